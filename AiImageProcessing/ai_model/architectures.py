@@ -0,0 +1,70 @@
+import torch.nn as nn
+
+ARCHITECTURES = ("resnet18", "densenet121", "efficientnet_b0", "cnn", "resnet10", "cnn_early_exit")
+
+
+def build_model(arch: str, num_classes: int, pretrained: bool = True) -> nn.Module:
+    """Build one of the supported classifiers with its head sized for `num_classes`."""
+    from torchvision import models
+
+    if arch == "resnet18":
+        model = models.resnet18(weights=models.ResNet18_Weights.IMAGENET1K_V1 if pretrained else None)
+        model.fc = nn.Linear(model.fc.in_features, num_classes)
+    elif arch == "densenet121":
+        model = models.densenet121(weights=models.DenseNet121_Weights.IMAGENET1K_V1 if pretrained else None)
+        model.classifier = nn.Linear(model.classifier.in_features, num_classes)
+    elif arch == "efficientnet_b0":
+        model = models.efficientnet_b0(weights=models.EfficientNet_B0_Weights.IMAGENET1K_V1 if pretrained else None)
+        model.classifier[1] = nn.Linear(model.classifier[1].in_features, num_classes)
+    elif arch == "resnet10":
+        # Slim ResNet: one BasicBlock per stage; starts from the matching ResNet18 weights
+        from torchvision.models.resnet import ResNet, BasicBlock
+        model = ResNet(BasicBlock, [1, 1, 1, 1])
+        if pretrained:
+            source = models.resnet18(weights=models.ResNet18_Weights.IMAGENET1K_V1).state_dict()
+            target = model.state_dict()
+            model.load_state_dict({k: v for k, v in source.items() if k in target and v.shape == target[k].shape}, strict=False)
+        model.fc = nn.Linear(model.fc.in_features, num_classes)
+    elif arch == "cnn":
+        try:
+            from ai_model.conventional_neural_model import SkinCancerCNN
+        except ImportError:
+            from conventional_neural_model import SkinCancerCNN
+        model = SkinCancerCNN(num_classes)
+    elif arch == "cnn_early_exit":
+        # Auxiliary heads after blocks 2-4, trained with early_exit.py
+        try:
+            from ai_model.conventional_neural_model import EarlyExitSkinCancerCNN
+        except ImportError:
+            from conventional_neural_model import EarlyExitSkinCancerCNN
+        model = EarlyExitSkinCancerCNN(num_classes)
+    else:
+        raise ValueError(f"Unknown architecture '{arch}', expected one of {ARCHITECTURES}")
+    return model
+
+
+def get_classifier(model: nn.Module, arch: str) -> nn.Linear:
+    """The final Linear layer of a model built by build_model."""
+    if arch in ("resnet18", "resnet10"):
+        return model.fc
+    if arch == "densenet121":
+        return model.classifier
+    if arch == "efficientnet_b0":
+        return model.classifier[1]
+    if arch in ("cnn", "cnn_early_exit"):
+        return model.classifier[-1]
+    raise ValueError(f"Unknown architecture '{arch}'")
+
+
+def set_classifier(model: nn.Module, arch: str, module: nn.Module):
+    """Replace the final Linear layer of a model built by build_model (e.g. with nn.Identity for features)."""
+    if arch in ("resnet18", "resnet10"):
+        model.fc = module
+    elif arch == "densenet121":
+        model.classifier = module
+    elif arch == "efficientnet_b0":
+        model.classifier[1] = module
+    elif arch in ("cnn", "cnn_early_exit"):
+        model.classifier[-1] = module
+    else:
+        raise ValueError(f"Unknown architecture '{arch}'")
@@ -50,3 +50,88 @@ class SkinCancerCNN(nn.Module):
         x = torch.flatten(x, 1)
         x = self.classifier(x)
         return x
+
+
+class EarlyExitSkinCancerCNN(SkinCancerCNN):
+    """
+    SkinCancerCNN with small auxiliary classifiers (global pool + linear) after
+    blocks 2, 3 and 4. Parameter names of the backbone and final classifier are
+    unchanged, so a trained SkinCancerCNN state dict loads with strict=False.
+
+    Training mode returns the logits of every exit (auxiliary heads first, final
+    classifier last). Eval mode returns one logits row per image, from the first
+    exit whose softmax confidence reaches its threshold in `exit_thresholds`
+    (a buffer, saved with the weights; inf disables an exit, which is the
+    default until early_exit.py calibrates them).
+    """
+
+    # Index into `features` after which each auxiliary head sits (end of blocks 2, 3, 4)
+    EXIT_POINTS = (8, 12, 16)
+    EXIT_CHANNELS = (64, 128, 256)
+
+    def __init__(self, num_classes):
+        super(EarlyExitSkinCancerCNN, self).__init__(num_classes)
+        self.exit_heads = nn.ModuleList([
+            nn.Sequential(
+                nn.AdaptiveAvgPool2d((1, 1)),
+                nn.Flatten(),
+                nn.Dropout(0.2),
+                nn.Linear(channels, num_classes)
+            )
+            for channels in self.EXIT_CHANNELS
+        ])
+        self.register_buffer("exit_thresholds", torch.full((len(self.EXIT_POINTS),), float("inf")))
+
+    @property
+    def num_exits(self):
+        return len(self.EXIT_POINTS) + 1
+
+    def _stages(self):
+        start = 0
+        for end in self.EXIT_POINTS + (len(self.features),):
+            yield self.features[start:end]
+            start = end
+
+    def forward_exits(self, x):
+        """Logits of every exit for the whole batch."""
+        outputs = []
+        for stage, head in zip(self._stages(), list(self.exit_heads) + [None]):
+            x = stage(x)
+            if head is not None:
+                outputs.append(head(x))
+        outputs.append(self.classifier(torch.flatten(x, 1)))
+        return outputs
+
+    def forward_early_exit(self, x, thresholds=None):
+        """
+        Per-image early exit: images whose confidence at a head reaches its threshold
+        stop there, the rest continue. Returns (logits, exit index per image).
+        """
+        thresholds = self.exit_thresholds if thresholds is None else thresholds
+        logits = None
+        exit_index = torch.full((x.shape[0],), self.num_exits - 1, dtype=torch.long, device=x.device)
+        remaining = torch.arange(x.shape[0], device=x.device)
+        for i, (stage, head) in enumerate(zip(self._stages(), list(self.exit_heads) + [None])):
+            x = stage(x)
+            if head is None:
+                out = self.classifier(torch.flatten(x, 1))
+            else:
+                out = head(x)
+            if logits is None:
+                logits = out.new_empty((exit_index.shape[0], out.shape[1]))
+            if head is None:
+                logits[remaining] = out
+                break
+            done = F.softmax(out.float(), dim=1).amax(dim=1) >= thresholds[i]
+            if done.any():
+                logits[remaining[done]] = out[done]
+                exit_index[remaining[done]] = i
+                x, remaining = x[~done], remaining[~done]
+                if remaining.numel() == 0:
+                    break
+        return logits, exit_index
+
+    def forward(self, x):
+        if self.training:
+            return self.forward_exits(x)
+        return self.forward_early_exit(x)[0]
@@ -0,0 +1,264 @@
+"""
+Parallel, batched CPU input pipeline for training.
+
+The per-sample path (pandas .iloc lookup, PIL decode, PIL augmentations) is
+replaced by:
+  * FlatImageDataset - paths and labels in flat NumPy arrays, decodes a JPEG
+    straight to a fixed-size uint8 CHW tensor (no augmentation per sample);
+  * make_loader - DataLoader with worker processes, pinned memory and
+    persistent workers;
+  * BatchAugment / BatchEvalTransform - flip, rotation, resized crop and
+    brightness/contrast jitter applied to the whole uint8 batch at once with
+    tensor ops (one affine_grid + grid_sample call per batch);
+  * DataWaitMeter - measures how long the training step is blocked on data.
+
+Works the same on top of tensor_cache.ShardedSkinCancerDataset (without a transform).
+
+    python data_pipeline.py --steps 50 --workers 4
+"""
+import argparse
+import math
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from PIL import Image
+from torch.utils.data import Dataset, DataLoader
+
+DECODE_SIZE = 256
+
+
+class FlatImageDataset(Dataset):
+    """Decode-only dataset over flat path/label arrays; augmentation happens later on whole batches."""
+
+    def __init__(self, image_paths, labels, image_size: int = DECODE_SIZE, image_ids=None):
+        # Fixed-width unicode arrays instead of Python lists/DataFrames: no per-object
+        # refcounts, so forked workers don't copy the pages while reading them
+        self.image_paths = np.asarray(image_paths, dtype=str)
+        self.labels = np.asarray(labels, dtype=np.int64)
+        self.image_ids = np.asarray(image_ids, dtype=str) if image_ids is not None else None
+        self.image_size = image_size
+
+    @classmethod
+    def from_metadata(cls, metadata, image_size: int = DECODE_SIZE):
+        return cls(metadata['image_path'].to_numpy(), metadata['dx_encoded'].to_numpy(),
+                   image_size, metadata['image_id'].to_numpy())
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        image = Image.open(self.image_paths[idx])
+        image.draft("RGB", (self.image_size, self.image_size))
+        image = image.convert("RGB").resize((self.image_size, self.image_size), Image.BILINEAR)
+        pixels = torch.from_numpy(np.asarray(image, dtype=np.uint8).copy()).permute(2, 0, 1)
+        return pixels, self.labels[idx]
+
+
+def default_num_workers() -> int:
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+def make_loader(dataset, batch_size: int = 32, shuffle: bool = False, num_workers: int = None,
+                sampler=None, drop_last: bool = False) -> DataLoader:
+    num_workers = default_num_workers() if num_workers is None else num_workers
+    options = {}
+    if num_workers > 0:
+        options = {"persistent_workers": True, "prefetch_factor": 4}
+    return DataLoader(
+        dataset,
+        batch_size=batch_size,
+        shuffle=shuffle if sampler is None else False,
+        sampler=sampler,
+        num_workers=num_workers,
+        pin_memory=torch.cuda.is_available(),
+        drop_last=drop_last,
+        **options
+    )
+
+
+def close_loader(loader: DataLoader):
+    """Stop the persistent workers of a loader that is being replaced (they would otherwise live until exit)."""
+    iterator = getattr(loader, "_iterator", None)
+    if iterator is not None and hasattr(iterator, "_shutdown_workers"):
+        iterator._shutdown_workers()
+    loader._iterator = None
+
+
+def _normalize(images: torch.Tensor) -> torch.Tensor:
+    # Same as transforms.Normalize(mean=[0.5]*3, std=[0.5]*3) on [0, 1] input
+    return images.mul(2.0).sub_(1.0)
+
+
+class BatchAugment(nn.Module):
+    """
+    Batched version of the training transforms in skin_cancer_dataset:
+    RandomHorizontalFlip, RandomRotation(20), RandomResizedCrop(scale=(0.8, 1)),
+    ColorJitter(brightness=0.2, contrast=0.2), ToTensor and Normalize.
+
+    Takes a uint8 (B, 3, H, W) batch, returns normalized float (B, 3, S, S).
+    """
+
+    def __init__(self, output_size: int = 224, degrees: float = 20.0, scale=(0.8, 1.0),
+                 ratio=(3 / 4, 4 / 3), brightness: float = 0.2, contrast: float = 0.2):
+        super().__init__()
+        self.output_size = output_size
+        self.degrees = degrees
+        self.scale = scale
+        self.log_ratio = (math.log(ratio[0]), math.log(ratio[1]))
+        self.brightness = brightness
+        self.contrast = contrast
+
+    def _uniform(self, n, low, high, device):
+        return torch.empty(n, device=device).uniform_(low, high)
+
+    @torch.no_grad()
+    def forward(self, images: torch.Tensor) -> torch.Tensor:
+        n, device = images.shape[0], images.device
+        images = images.float().div_(255.0)
+        if images.shape[-1] > 1.5 * self.output_size:
+            # Low-resolution phases: shrink with antialiasing first so grid_sample does not alias
+            size = int(self.output_size * 8 / 7)
+            images = F.interpolate(images, size=(size, size), mode="bilinear", align_corners=False, antialias=True)
+
+        # One affine matrix per sample: crop size/position, rotation and flip together
+        area = self._uniform(n, self.scale[0], self.scale[1], device)
+        aspect = torch.exp(self._uniform(n, self.log_ratio[0], self.log_ratio[1], device))
+        crop_w = torch.sqrt(area * aspect).clamp(max=1.0)
+        crop_h = torch.sqrt(area / aspect).clamp(max=1.0)
+        center_x = (torch.rand(n, device=device) * 2 - 1) * (1 - crop_w)
+        center_y = (torch.rand(n, device=device) * 2 - 1) * (1 - crop_h)
+        angle = self._uniform(n, -self.degrees, self.degrees, device) * (math.pi / 180.0)
+        flip = torch.where(torch.rand(n, device=device) < 0.5, -1.0, 1.0)
+        cos, sin = torch.cos(angle), torch.sin(angle)
+
+        theta = torch.stack([
+            torch.stack([cos * crop_w * flip, -sin * crop_h, center_x], dim=1),
+            torch.stack([sin * crop_w * flip, cos * crop_h, center_y], dim=1)
+        ], dim=1)
+        grid = F.affine_grid(theta, (n, 3, self.output_size, self.output_size), align_corners=False)
+        images = F.grid_sample(images, grid, mode="bilinear", padding_mode="zeros", align_corners=False)
+
+        # Brightness then contrast, each with a per-sample factor
+        brightness = self._uniform(n, 1 - self.brightness, 1 + self.brightness, device).view(n, 1, 1, 1)
+        images = images.mul_(brightness).clamp_(0.0, 1.0)
+        contrast = self._uniform(n, 1 - self.contrast, 1 + self.contrast, device).view(n, 1, 1, 1)
+        gray_mean = (0.299 * images[:, 0] + 0.587 * images[:, 1] + 0.114 * images[:, 2]).mean(dim=(1, 2)).view(n, 1, 1, 1)
+        images = images.sub_(gray_mean).mul_(contrast).add_(gray_mean).clamp_(0.0, 1.0)
+
+        return _normalize(images)
+
+
+class BatchEvalTransform(nn.Module):
+    """Batched Resize((S, S)) + ToTensor + Normalize for uint8 batches."""
+
+    def __init__(self, output_size: int = 224):
+        super().__init__()
+        self.output_size = output_size
+
+    @torch.no_grad()
+    def forward(self, images: torch.Tensor) -> torch.Tensor:
+        images = images.float().div_(255.0)
+        if images.shape[-1] != self.output_size or images.shape[-2] != self.output_size:
+            images = F.interpolate(images, size=(self.output_size, self.output_size),
+                                   mode="bilinear", align_corners=False, antialias=True)
+        return _normalize(images)
+
+
+class DataWaitMeter:
+    """
+    Wraps a loader and measures how long each next() blocks, i.e. how long the
+    training step sits waiting for input.
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.wait_seconds = 0.0
+        self.batches = 0
+        self.samples = 0
+        self.last_wait = 0.0
+        self._started = None
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        self._started = time.perf_counter()
+        iterator = iter(self.loader)
+        while True:
+            wait_start = time.perf_counter()
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                return
+            self.last_wait = time.perf_counter() - wait_start
+            self.wait_seconds += self.last_wait
+            self.batches += 1
+            self.samples += len(batch[0])
+            yield batch
+
+    def report(self) -> dict:
+        elapsed = time.perf_counter() - self._started if self._started else 0.0
+        return {
+            "batches": self.batches,
+            "samples": self.samples,
+            "data_wait_seconds": self.wait_seconds,
+            "elapsed_seconds": elapsed,
+            "data_wait_fraction": self.wait_seconds / elapsed if elapsed else 0.0,
+            "samples_per_second": self.samples / elapsed if elapsed else 0.0
+        }
+
+
+def get_fast_loaders(batch_size: int = 32, num_workers: int = None, cache_dir: str = None):
+    """Train/val loaders of uint8 batches, from the tensor cache if given, else from the JPEGs."""
+    from skin_cancer_dataset import get_splits
+
+    train_metadata, val_metadata = get_splits()
+    if cache_dir:
+        from tensor_cache import ShardedSkinCancerDataset
+        train_dataset = ShardedSkinCancerDataset(cache_dir, train_metadata['image_id'].tolist())
+        val_dataset = ShardedSkinCancerDataset(cache_dir, val_metadata['image_id'].tolist())
+    else:
+        train_dataset = FlatImageDataset.from_metadata(train_metadata)
+        val_dataset = FlatImageDataset.from_metadata(val_metadata)
+    train_loader = make_loader(train_dataset, batch_size, shuffle=True, num_workers=num_workers, drop_last=True)
+    val_loader = make_loader(val_dataset, batch_size, shuffle=False, num_workers=num_workers)
+    return train_loader, val_loader
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure how long training steps wait on the input pipeline")
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache", default=None, help="tensor cache directory (default: decode JPEGs)")
+    args = parser.parse_args()
+
+    from skin_cancer_dataset import build_resnet18, get_num_classes, get_device
+
+    device = get_device()
+    train_loader, _ = get_fast_loaders(args.batch_size, args.workers, args.cache)
+    augment = BatchAugment().to(device)
+    model = build_resnet18(get_num_classes(), pretrained=False).to(device)
+    optimizer = torch.optim.Adam(model.parameters(), lr=0.001)
+    criterion = nn.CrossEntropyLoss()
+
+    meter = DataWaitMeter(train_loader)
+    model.train()
+    for step, (images, labels) in enumerate(meter):
+        images = augment(images.to(device, non_blocking=True))
+        labels = labels.to(device, non_blocking=True)
+        optimizer.zero_grad()
+        loss = criterion(model(images), labels)
+        loss.backward()
+        optimizer.step()
+        if step + 1 >= args.steps:
+            break
+
+    report = meter.report()
+    print(f"{report['batches']} steps, {report['samples_per_second']:.1f} samples/s")
+    print(f"Waiting on data: {report['data_wait_seconds']:.2f}s of {report['elapsed_seconds']:.2f}s "
+          f"({report['data_wait_fraction'] * 100:.1f}%)")
@@ -0,0 +1,173 @@
+"""
+Knowledge distillation into a fast CPU serving model.
+
+DenseNet121 and/or EfficientNet-B0 checkpoints act as teachers for
+SkinCancerCNN ("cnn") or the slim ResNet ("resnet10"). Teacher logits for the
+training set are computed once, on un-augmented images, and cached on disk
+keyed by the teacher checkpoint hashes, so no epoch ever runs a teacher.
+The student is trained with the usual Trainer on
+    alpha * T^2 * KL(student/T || teachers/T) + (1 - alpha) * CE(student, label)
+and a latency / macro-F1 comparison against the teachers is printed at the end.
+
+    python distill.py --student cnn --teacher densenet121=best_model_densenet.pth \
+        --teacher efficientnet_b0=best_model_efficientnet.pth --cache tensor_cache
+"""
+import argparse
+import csv
+import os
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch.utils.data import Dataset
+
+from architectures import build_model
+from data_pipeline import BatchEvalTransform, make_loader
+from evaluation_store import EvaluationStore, evaluate_checkpoint, file_sha256
+from latency import count_parameters, measure_latency
+from trainer import Trainer
+
+TEACHER_CACHE_DIR = "distill_cache"
+
+
+class IndexedDataset(Dataset):
+    """Adds the sample index to every item so cached teacher logits can be looked up."""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.image_ids = getattr(dataset, "image_ids", None)
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, idx):
+        image, label = self.dataset[idx]
+        return image, label, idx
+
+
+def load_teacher(arch: str, checkpoint_path: str, num_classes: int, device):
+    model = build_model(arch, num_classes, pretrained=False)
+    model.load_state_dict(torch.load(checkpoint_path, map_location=device))
+    return model.to(device).eval()
+
+
+def compute_teacher_logits(teachers, dataset, num_classes: int, device, batch_size: int = 64,
+                           cache_dir: str = TEACHER_CACHE_DIR) -> np.ndarray:
+    """Averaged teacher logits for every sample of `dataset`, from the cache when it exists."""
+    os.makedirs(cache_dir, exist_ok=True)
+    key = "_".join(f"{arch}-{file_sha256(path)[:16]}" for arch, path in teachers)
+    ids = getattr(dataset, "image_ids", None)
+    if ids is not None:
+        import hashlib
+        key += "_" + hashlib.sha256("\n".join(map(str, ids)).encode()).hexdigest()[:16]
+    cache_path = os.path.join(cache_dir, f"{key}.npy")
+    if os.path.exists(cache_path):
+        print(f"Using cached teacher logits {cache_path}")
+        return np.load(cache_path)
+
+    transform = BatchEvalTransform().to(device)
+    loader = make_loader(dataset, batch_size, shuffle=False)
+    total = np.zeros((len(dataset), num_classes), dtype=np.float32)
+    for arch, path in teachers:
+        print(f"Computing teacher logits: {arch} ({path})")
+        model = load_teacher(arch, path, num_classes, device)
+        offset = 0
+        with torch.inference_mode():
+            for images, _ in loader:
+                logits = model(transform(images.to(device))).float().cpu().numpy()
+                total[offset:offset + len(logits)] += logits
+                offset += len(logits)
+        del model
+    total /= len(teachers)
+    np.save(cache_path, total)
+    return total
+
+
+class DistillationTrainer(Trainer):
+    def __init__(self, *args, teacher_logits: np.ndarray = None, temperature: float = 4.0, alpha: float = 0.7, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.teacher_logits = torch.from_numpy(teacher_logits).to(self.device)
+        self.temperature = temperature
+        self.alpha = alpha
+
+    def compute_loss(self, outputs, labels, extra):
+        hard_loss = self.criterion(outputs, labels)
+        if not extra:
+            # Validation batches carry no index; plain cross-entropy there
+            return hard_loss
+        teacher = self.teacher_logits[extra[0].to(self.device)]
+        t = self.temperature
+        soft_loss = F.kl_div(
+            F.log_softmax(outputs.float() / t, dim=1), F.log_softmax(teacher / t, dim=1),
+            reduction="batchmean", log_target=True
+        ) * (t * t)
+        return self.alpha * soft_loss + (1 - self.alpha) * hard_loss
+
+
+def comparison_report(entries, output_path: str):
+    """entries: (name, arch, checkpoint); prints and writes latency / F1 / size per model."""
+    from skin_cancer_dataset import get_num_classes
+
+    num_classes = get_num_classes()
+    rows = []
+    for name, arch, checkpoint in entries:
+        record = evaluate_checkpoint(checkpoint, arch, EvaluationStore())
+        model = build_model(arch, num_classes, pretrained=False)
+        model.load_state_dict(torch.load(checkpoint, map_location="cpu"))
+        latency = measure_latency(model)
+        rows.append({
+            "model": name, "arch": arch, "params_M": count_parameters(model) / 1e6,
+            "latency_p50_ms": latency["p50_ms"], "latency_p90_ms": latency["p90_ms"],
+            "macro_f1": record.macro_f1(), "accuracy": float((record.predictions == record.labels).mean() * 100)
+        })
+
+    print(f"\n{'model':<22}{'params M':>10}{'p50 ms':>10}{'p90 ms':>10}{'macro-F1':>10}{'acc':>8}")
+    for row in rows:
+        print(f"{row['model']:<22}{row['params_M']:>10.2f}{row['latency_p50_ms']:>10.2f}{row['latency_p90_ms']:>10.2f}"
+              f"{row['macro_f1']:>10.2f}{row['accuracy']:>8.2f}")
+    with open(output_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Report written to {output_path}")
+    return rows
+
+
+def main(argv=None):
+    from train import build_argument_parser, build_trainer
+    from data_pipeline import get_fast_loaders
+    from skin_cancer_dataset import get_device, get_num_classes
+
+    parser = argparse.ArgumentParser(description="Distil teacher checkpoints into a fast student")
+    parser.add_argument("--student", choices=["cnn", "resnet10", "resnet18"], default="cnn")
+    parser.add_argument("--teacher", action="append", required=True, help="arch=checkpoint, may be repeated")
+    parser.add_argument("--temperature", type=float, default=4.0)
+    parser.add_argument("--alpha", type=float, default=0.7)
+    parser.add_argument("--report", default="distillation_report.csv")
+    args, train_argv = parser.parse_known_args(argv)
+    teachers = [tuple(t.split("=", 1)) for t in args.teacher]
+
+    train_args = build_argument_parser().parse_args(["--arch", args.student] + train_argv)
+    if train_args.model_save_path is None:
+        train_args.model_save_path = f"best_model_student_{args.student}.pth"
+    if train_args.log_dir is None:
+        train_args.log_dir = f"runs/distill_{args.student}"
+
+    device = get_device()
+    num_classes = get_num_classes()
+    train_loader, val_loader = get_fast_loaders(train_args.batch_size, train_args.workers, train_args.cache)
+    teacher_logits = compute_teacher_logits(teachers, train_loader.dataset, num_classes, device)
+
+    indexed_train_loader = make_loader(IndexedDataset(train_loader.dataset), train_args.batch_size, shuffle=True,
+                                       num_workers=train_args.workers, drop_last=True)
+    trainer = build_trainer(train_args, trainer_class=DistillationTrainer, loaders=(indexed_train_loader, val_loader),
+                            teacher_logits=teacher_logits, temperature=args.temperature, alpha=args.alpha)
+    trainer.fit()
+
+    entries = [(f"teacher {arch}", arch, path) for arch, path in teachers]
+    entries.append((f"student {args.student}", args.student, train_args.model_save_path))
+    comparison_report(entries, args.report)
+
+
+if __name__ == '__main__':
+    main()
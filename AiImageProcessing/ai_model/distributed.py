@@ -0,0 +1,214 @@
+"""
+Multi-process data-parallel training on CPU nodes (torch.distributed, gloo).
+
+Every process trains on its own shard of train_metadata (DistributedSampler),
+gradients are averaged with all-reduce by DistributedDataParallel, validation
+is split across ranks and gathered, and only rank 0 writes checkpoints and
+TensorBoard logs. Processes are started by launch_distributed.py or torchrun;
+configuration comes from the usual RANK / WORLD_SIZE / LOCAL_RANK /
+LOCAL_WORLD_SIZE / MASTER_ADDR / MASTER_PORT environment variables.
+"""
+import os
+
+import numpy as np
+import torch
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import Sampler
+from torch.utils.data.distributed import DistributedSampler
+
+from trainer import Trainer
+
+
+def init_distributed(backend: str = "gloo"):
+    """Join the process group described by the environment; returns (rank, world_size)."""
+    if not dist.is_initialized():
+        dist.init_process_group(backend=backend)
+    rank, world_size = dist.get_rank(), dist.get_world_size()
+
+    # Split the cores of this machine between the processes running on it
+    local_world_size = int(os.environ.get("LOCAL_WORLD_SIZE", world_size))
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // local_world_size))
+    return rank, world_size
+
+
+def cleanup_distributed():
+    if dist.is_initialized():
+        dist.destroy_process_group()
+
+
+class ShardSampler(Sampler):
+    """Every world_size-th index starting at rank, in order, without the padding DistributedSampler adds."""
+
+    def __init__(self, dataset_size: int, rank: int, world_size: int):
+        self.indices = list(range(rank, dataset_size, world_size))
+
+    def __iter__(self):
+        return iter(self.indices)
+
+    def __len__(self):
+        return len(self.indices)
+
+
+def build_distributed_loaders(train_dataset, val_dataset, batch_size: int, num_workers: int = None, seed: int = 42):
+    from data_pipeline import make_loader
+
+    rank, world_size = dist.get_rank(), dist.get_world_size()
+    local_world_size = int(os.environ.get("LOCAL_WORLD_SIZE", world_size))
+    if num_workers is None:
+        num_workers = max(1, (os.cpu_count() or 2) // (2 * local_world_size))
+    train_sampler = DistributedSampler(train_dataset, num_replicas=world_size, rank=rank, shuffle=True, seed=seed, drop_last=True)
+    val_sampler = ShardSampler(len(val_dataset), rank, world_size)
+    train_loader = make_loader(train_dataset, batch_size, num_workers=num_workers, sampler=train_sampler, drop_last=True)
+    val_loader = make_loader(val_dataset, batch_size, num_workers=num_workers, sampler=val_sampler)
+    return train_loader, val_loader
+
+
+class DistributedTrainer(Trainer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rank = dist.get_rank()
+        self.world_size = dist.get_world_size()
+        ddp_model = DistributedDataParallel(self.model)
+        self.ddp_model = ddp_model
+        self.forward_model = torch.compile(ddp_model) if self.config.compile else ddp_model
+
+    @property
+    def is_main_process(self) -> bool:
+        return self.rank == 0
+
+    def sync_context(self, sync: bool):
+        # Only all-reduce gradients on the micro-batch that ends an accumulation window
+        return super().sync_context(sync) if sync else self.ddp_model.no_sync()
+
+    def _all_reduce_sum(self, *values):
+        tensor = torch.tensor(values, dtype=torch.float64)
+        dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+        return tensor.tolist()
+
+    def train_one_epoch(self, epoch: int):
+        sampler = getattr(self.train_loader, "sampler", None)
+        if hasattr(sampler, "set_epoch"):
+            sampler.set_epoch(epoch)
+        train_loss, report = super().train_one_epoch(epoch)
+
+        # Global loss and throughput; data wait is reported as the slowest rank's share
+        loss_sum, samples = self._all_reduce_sum(train_loss, report["samples"])
+        wait = torch.tensor([report["data_wait_fraction"]])
+        dist.all_reduce(wait, op=dist.ReduceOp.MAX)
+        report = dict(report, samples=int(samples), data_wait_fraction=wait.item())
+        return loss_sum / self.world_size, report
+
+    def evaluate(self):
+        val_loss, logits, labels = super().evaluate()
+        batches = len(self.val_loader)
+        loss_sum, batch_count = self._all_reduce_sum(val_loss * batches, batches)
+
+        # Re-interleave the rank shards so the arrays follow the validation set order
+        gathered = [None] * self.world_size
+        dist.all_gather_object(gathered, (logits, labels))
+        total = sum(len(part[1]) for part in gathered)
+        # A rank with an empty shard (fewer validation images than ranks) reports no class dimension
+        num_classes = max(part[0].shape[1] for part in gathered)
+        all_logits = np.empty((total, num_classes), dtype=np.float32)
+        all_labels = np.empty(total, dtype=labels.dtype)
+        for rank, (rank_logits, rank_labels) in enumerate(gathered):
+            if len(rank_labels) == 0:
+                continue
+            all_logits[rank::self.world_size] = rank_logits
+            all_labels[rank::self.world_size] = rank_labels
+        return loss_sum / max(1, batch_count), all_logits, all_labels
+
+    def load_checkpoint(self, path: str = None):
+        # Rank 0 reads the file and hands the state to the other ranks (no shared filesystem needed)
+        path = path or self.config.checkpoint_path
+        state = [torch.load(path, map_location="cpu", weights_only=False) if self.is_main_process else None]
+        dist.broadcast_object_list(state, src=0)
+        tmp_path = f"{path}.rank{self.rank}.tmp"
+        if not self.is_main_process:
+            torch.save(state[0], tmp_path)
+            path = tmp_path
+        try:
+            super().load_checkpoint(path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def resume_if_requested(self):
+        # Every rank must agree on whether there is something to resume from
+        has_checkpoint = [bool(self.config.checkpoint_path and os.path.exists(self.config.checkpoint_path))
+                          if self.is_main_process else None]
+        dist.broadcast_object_list(has_checkpoint, src=0)
+        if not has_checkpoint[0]:
+            return
+        if self.config.resume:
+            self.load_checkpoint()
+        elif self.is_main_process:
+            print(f"ℹ️ Not resuming from existing {self.config.checkpoint_path} (pass --resume to continue it); "
+                  "it will be overwritten")
+
+
+def run_distributed_training(argv=None, synthetic_samples: int = 0):
+    """Entry point executed by every process."""
+    from data_pipeline import FlatImageDataset
+    from train import build_argument_parser, build_trainer
+
+    args = build_argument_parser().parse_args(argv)
+    rank, world_size = init_distributed()
+    try:
+        if synthetic_samples:
+            train_dataset, val_dataset = synthetic_datasets(synthetic_samples)
+            class_names = [f"class_{i}" for i in range(SYNTHETIC_CLASSES)]
+        else:
+            from skin_cancer_dataset import get_splits, get_label_encoder, save_label_encoder
+            train_metadata, val_metadata = get_splits()
+            if args.cache:
+                from tensor_cache import ShardedSkinCancerDataset
+                train_dataset = ShardedSkinCancerDataset(args.cache, train_metadata['image_id'].tolist())
+                val_dataset = ShardedSkinCancerDataset(args.cache, val_metadata['image_id'].tolist())
+            else:
+                train_dataset = FlatImageDataset.from_metadata(train_metadata)
+                val_dataset = FlatImageDataset.from_metadata(val_metadata)
+            class_names = [str(c) for c in get_label_encoder().classes_]
+            if rank == 0:
+                save_label_encoder()
+
+        loaders = build_distributed_loaders(train_dataset, val_dataset, args.batch_size, args.workers)
+        trainer = build_trainer(args, trainer_class=DistributedTrainer, loaders=loaders, class_names=class_names)
+        if rank == 0:
+            print(f"Training on {world_size} processes, {args.batch_size * world_size} samples per global step")
+        trainer.fit()
+
+        if synthetic_samples:
+            check_replicas_in_sync(trainer.model)
+        return trainer.history
+    finally:
+        cleanup_distributed()
+
+
+# ===== SINGLE-MACHINE CHECKS =====
+SYNTHETIC_CLASSES = 7
+
+
+def synthetic_datasets(num_samples: int):
+    """Random uint8 images with a fixed seed, identical on every rank; lets the launcher be tried without HAM10000."""
+    from torch.utils.data import TensorDataset
+
+    generator = torch.Generator().manual_seed(0)
+    images = torch.randint(0, 256, (num_samples, 3, 64, 64), dtype=torch.uint8, generator=generator)
+    labels = torch.randint(0, SYNTHETIC_CLASSES, (num_samples,), generator=generator)
+    split = int(num_samples * 0.8)
+    return TensorDataset(images[:split], labels[:split]), TensorDataset(images[split:], labels[split:])
+
+
+def check_replicas_in_sync(model):
+    """After all-reduced training every rank must hold identical weights."""
+    flat = torch.cat([p.detach().reshape(-1).float() for p in model.parameters()])
+    reference = flat.clone()
+    dist.broadcast(reference, src=0)
+    max_diff = (flat - reference).abs().max().item()
+    diffs = [None] * dist.get_world_size()
+    dist.all_gather_object(diffs, max_diff)
+    if dist.get_rank() == 0:
+        status = "OK" if max(diffs) < 1e-5 else "MISMATCH"
+        print(f"Replica consistency: {status} (max parameter difference {max(diffs):.2e})")
@@ -0,0 +1,277 @@
+"""
+Early-exit SkinCancerCNN ("cnn_early_exit"): training, calibration and report.
+
+Most nv images are easy, so auxiliary heads after blocks 2, 3 and 4 (see
+EarlyExitSkinCancerCNN) can classify them without running the rest of the
+network. Training uses the usual Trainer with the joint loss
+    sum_k w_k * CE(exit_k, label) / sum_k w_k
+over the auxiliary heads and the final classifier. Afterwards a confidence
+threshold per auxiliary head is calibrated on one half of the validation
+split: the lowest threshold whose exiting images are classified (almost) as
+well by that head as by the final classifier (within --max-accuracy-drop
+points). The other half is used for the report: images and accuracy per exit,
+cascade vs final-head accuracy / macro-F1 and the average compute saved
+(multiply-accumulates of the layers actually run). Thresholds are stored in the
+model's exit_thresholds buffer of a separate state dict (--output, default
+<model>_calibrated.pth) that serves with early exit; the trained checkpoint and
+its evaluation entry stay as logged. The calibrated model gets its own entry:
+the cascade outputs on the held-out half, with the thresholds and report.
+
+    python early_exit.py --cache tensor_cache --init-from best_model_cnn.pth
+    python early_exit.py --skip-training --max-accuracy-drop 0.5
+"""
+import argparse
+import csv
+from collections import Counter
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from sklearn.metrics import f1_score
+
+from trainer import Trainer
+
+ARCH = "cnn_early_exit"
+DEFAULT_EXIT_WEIGHTS = (0.3, 0.3, 0.3, 1.0)
+MIN_EXIT_SAMPLES = 20
+
+
+class EarlyExitTrainer(Trainer):
+    """Joint loss over all exits in training; eval batches see the cascade output (one tensor)."""
+
+    def __init__(self, *args, exit_weights=DEFAULT_EXIT_WEIGHTS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.exit_weights = tuple(exit_weights)
+
+    def compute_loss(self, outputs, labels, extra):
+        if torch.is_tensor(outputs):
+            return self.criterion(outputs, labels)
+        losses = [weight * self.criterion(logits, labels) for weight, logits in zip(self.exit_weights, outputs)]
+        return sum(losses) / sum(self.exit_weights)
+
+    def logits_of(self, outputs):
+        return outputs if torch.is_tensor(outputs) else outputs[-1]
+
+
+# ===== MEASUREMENTS =====
+@torch.no_grad()
+def collect_exit_probabilities(trainer: Trainer):
+    """Softmax outputs of every exit on the validation split: ([N x C per exit], labels)."""
+    model = trainer.model
+    model.eval()
+    probabilities = [[] for _ in range(model.num_exits)]
+    all_labels = []
+    for batch in trainer.val_loader:
+        images, labels, _ = trainer.prepare_batch(batch, trainer.val_transform)
+        with trainer.autocast():
+            outputs = model.forward_exits(images)
+        for i, logits in enumerate(outputs):
+            probabilities[i].append(F.softmax(logits.float(), dim=1).cpu())
+        all_labels.append(labels.cpu())
+    return [torch.cat(p).numpy() for p in probabilities], torch.cat(all_labels).numpy()
+
+
+@torch.no_grad()
+def exit_macs(model: nn.Module, image_size: int = 224) -> np.ndarray:
+    """Multiply-accumulates of one image leaving at each exit (backbone so far plus every head evaluated)."""
+    macs = {}
+
+    def hook(module, inputs, output):
+        if isinstance(module, nn.Conv2d):
+            kernel = module.kernel_size[0] * module.kernel_size[1]
+            macs[module] = output.numel() * module.in_channels // module.groups * kernel
+        else:
+            macs[module] = module.in_features * module.out_features
+
+    handles = [m.register_forward_hook(hook) for m in model.modules() if isinstance(m, (nn.Conv2d, nn.Linear))]
+    was_training = model.training
+    model.eval()
+    try:
+        device = next(model.parameters()).device
+        model.forward_exits(torch.zeros(1, 3, image_size, image_size, device=device))
+    finally:
+        for handle in handles:
+            handle.remove()
+        model.train(was_training)
+
+    def total(module):
+        return sum(macs.get(m, 0) for m in module.modules())
+
+    stages = [total(stage) for stage in model._stages()]
+    heads = [total(head) for head in model.exit_heads] + [total(model.classifier)]
+    return np.cumsum(stages) + np.cumsum(heads)
+
+
+# ===== CALIBRATION =====
+def calibrate_thresholds(probabilities, labels, max_accuracy_drop: float, min_samples: int = MIN_EXIT_SAMPLES):
+    """
+    Thresholds for the auxiliary heads, in order. For each head, among the images
+    still in the cascade, the most confident prefix is allowed to exit as long as
+    the head's accuracy on it stays within max_accuracy_drop points of the final
+    classifier's accuracy on the same images.
+    """
+    final_correct = probabilities[-1].argmax(axis=1) == labels
+    remaining = np.ones(len(labels), dtype=bool)
+    thresholds = []
+    for exit_probabilities in probabilities[:-1]:
+        index = np.flatnonzero(remaining)
+        confidence = exit_probabilities[index].max(axis=1)
+        correct = exit_probabilities[index].argmax(axis=1) == labels[index]
+        order = np.argsort(-confidence, kind="stable")
+        count = np.arange(1, len(order) + 1)
+        head_accuracy = np.cumsum(correct[order]) / count
+        final_accuracy = np.cumsum(final_correct[index][order]) / count
+        ok = (head_accuracy >= final_accuracy - max_accuracy_drop / 100) & (count >= min_samples)
+        # The prefix must end between distinct confidences, or the threshold would let ties through
+        distinct = np.append(confidence[order][1:] < confidence[order][:-1], True)
+        candidates = np.flatnonzero(ok & distinct)
+        if len(candidates) == 0:
+            thresholds.append(float("inf"))
+            continue
+        cut = candidates[-1]
+        thresholds.append(float(confidence[order][cut]))
+        remaining[index[order[:cut + 1]]] = False
+    return thresholds
+
+
+def simulate_cascade(probabilities, thresholds):
+    """(exit index, prediction) per image for the given thresholds."""
+    n = len(probabilities[0])
+    exits = np.full(n, len(probabilities) - 1)
+    predictions = probabilities[-1].argmax(axis=1)
+    remaining = np.ones(n, dtype=bool)
+    for i, (exit_probabilities, threshold) in enumerate(zip(probabilities[:-1], thresholds)):
+        leave = remaining & (exit_probabilities.max(axis=1) >= threshold)
+        exits[leave] = i
+        predictions[leave] = exit_probabilities[leave].argmax(axis=1)
+        remaining &= ~leave
+    return exits, predictions
+
+
+def cascade_probabilities(probabilities, thresholds) -> np.ndarray:
+    """N x C probabilities of the exit each image leaves at."""
+    exits, _ = simulate_cascade(probabilities, thresholds)
+    return np.stack(probabilities)[exits, np.arange(len(exits))]
+
+
+def split_indices(n: int, calibration_fraction: float, seed: int = 0):
+    order = np.random.default_rng(seed).permutation(n)
+    cut = int(n * calibration_fraction)
+    return order[:cut], order[cut:]
+
+
+# ===== REPORT =====
+def exit_report(probabilities, labels, thresholds, macs, class_names, output_path: str = None) -> dict:
+    exits, predictions = simulate_cascade(probabilities, thresholds)
+    final_predictions = probabilities[-1].argmax(axis=1)
+    names = [f"exit {i + 1} (block {i + 2})" for i in range(len(thresholds))] + ["final"]
+
+    rows = []
+    for i, name in enumerate(names):
+        mask = exits == i
+        top = Counter(predictions[mask].tolist()).most_common(1)
+        rows.append({
+            "exit": name,
+            "threshold": thresholds[i] if i < len(thresholds) else None,
+            "images": int(mask.sum()),
+            "share": float(mask.mean() * 100),
+            "accuracy": float((predictions[mask] == labels[mask]).mean() * 100) if mask.any() else None,
+            "final_head_accuracy": float((final_predictions[mask] == labels[mask]).mean() * 100) if mask.any() else None,
+            "top_class": f"{class_names[top[0][0]]} ({top[0][1] / mask.sum() * 100:.0f}%)" if top else "",
+            "relative_compute": float(macs[i] / macs[-1])
+        })
+    summary = {
+        "cascade_accuracy": float((predictions == labels).mean() * 100),
+        "final_accuracy": float((final_predictions == labels).mean() * 100),
+        "cascade_f1": float(f1_score(labels, predictions, average="macro") * 100),
+        "final_f1": float(f1_score(labels, final_predictions, average="macro") * 100),
+        "compute_saved": float((1 - macs[exits].mean() / macs[-1]) * 100)
+    }
+
+    print(f"\n{'exit':<20}{'threshold':>10}{'images':>8}{'share':>8}{'acc':>8}{'final acc':>11}{'compute':>9}  top class")
+    for row in rows:
+        threshold = "-" if row["threshold"] is None else f"{row['threshold']:.3f}"
+        accuracy = "-" if row["accuracy"] is None else f"{row['accuracy']:.2f}"
+        final_accuracy = "-" if row["final_head_accuracy"] is None else f"{row['final_head_accuracy']:.2f}"
+        print(f"{row['exit']:<20}{threshold:>10}{row['images']:>8}{row['share']:>7.1f}%{accuracy:>8}{final_accuracy:>11}"
+              f"{row['relative_compute'] * 100:>8.0f}%  {row['top_class']}")
+    print(f"Cascade: acc {summary['cascade_accuracy']:.2f}% / macro-F1 {summary['cascade_f1']:.2f}% "
+          f"vs final head {summary['final_accuracy']:.2f}% / {summary['final_f1']:.2f}%")
+    print(f"⚡ Average compute saved: {summary['compute_saved']:.1f}%")
+
+    if output_path:
+        with open(output_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Report written to {output_path}")
+    return {"exits": rows, **summary}
+
+
+def main(argv=None):
+    from train import build_argument_parser, build_trainer
+    from evaluation_store import EvaluationStore
+    from skin_cancer_dataset import save_label_encoder
+
+    parser = argparse.ArgumentParser(description="Train and calibrate the early-exit SkinCancerCNN")
+    parser.add_argument("--exit-weights", default=",".join(str(w) for w in DEFAULT_EXIT_WEIGHTS),
+                        help="loss weight per exit, auxiliary heads first")
+    parser.add_argument("--init-from", default=None, help="SkinCancerCNN state dict to start from")
+    parser.add_argument("--skip-training", action="store_true", help="only calibrate and report the saved model")
+    parser.add_argument("--max-accuracy-drop", type=float, default=1.0,
+                        help="points of accuracy an exit may lose against the final head on the images it takes")
+    parser.add_argument("--calibration-fraction", type=float, default=0.5)
+    parser.add_argument("--report", default="early_exit_report.csv")
+    parser.add_argument("--output", default=None, help="calibrated state dict (default: <model>_calibrated.pth)")
+    args, train_argv = parser.parse_known_args(argv)
+    exit_weights = [float(w) for w in args.exit_weights.split(",")]
+
+    train_args = build_argument_parser().parse_args(["--arch", ARCH] + train_argv)
+    if args.init_from and train_args.resume:
+        raise SystemExit("--init-from and --resume are mutually exclusive: resuming would overwrite the initial weights")
+    save_label_encoder()
+    trainer = build_trainer(train_args, trainer_class=EarlyExitTrainer, exit_weights=exit_weights)
+    model = trainer.model
+    if len(exit_weights) != model.num_exits:
+        raise SystemExit(f"--exit-weights needs {model.num_exits} values")
+
+    if not args.skip_training:
+        if args.init_from:
+            missing, _ = model.load_state_dict(torch.load(args.init_from, map_location=trainer.device), strict=False)
+            print(f"Initialised from {args.init_from} ({len(missing)} new tensors)")
+        trainer.fit()
+    model.load_state_dict(torch.load(trainer.config.model_save_path, map_location=trainer.device))
+
+    probabilities, labels = collect_exit_probabilities(trainer)
+    calibration, held_out = split_indices(len(labels), args.calibration_fraction)
+    thresholds = calibrate_thresholds([p[calibration] for p in probabilities], labels[calibration],
+                                      args.max_accuracy_drop)
+    print(f"Calibrated on {len(calibration)} validation images, reporting on {len(held_out)}")
+    report = exit_report([p[held_out] for p in probabilities], labels[held_out], thresholds, exit_macs(model),
+                         trainer.class_names, args.report)
+
+    # The trained checkpoint keeps its weights and evaluation entry; the calibrated copy is logged on its own
+    output_path = args.output or trainer.config.model_save_path.replace(".pth", "_calibrated.pth")
+    model.exit_thresholds.copy_(torch.tensor(thresholds))
+    torch.save(model.state_dict(), output_path)
+    if trainer.config.eval_store_dir:
+        image_ids = getattr(trainer.val_loader.dataset, "image_ids", None)
+        if image_ids is not None and len(image_ids) == len(labels):
+            image_ids = np.asarray(image_ids)[held_out]
+        else:
+            image_ids = None
+        held_out_probabilities = cascade_probabilities([p[held_out] for p in probabilities], thresholds)
+        summary = {k: v for k, v in report.items() if k != "exits"}
+        EvaluationStore(trainer.config.eval_store_dir).save(
+            output_path, np.log(np.clip(held_out_probabilities, 1e-12, None)), labels[held_out], image_ids,
+            trainer.class_names,
+            {"arch": ARCH, "mode": "early_exit_cascade", "split": "calibration_held_out", "thresholds": thresholds,
+             "trained_checkpoint": trainer.config.model_save_path, "f1": summary["cascade_f1"], **summary}
+        )
+    print(f"💾 Calibrated model with exit thresholds saved to {output_path}")
+    return report
+
+
+if __name__ == '__main__':
+    main()
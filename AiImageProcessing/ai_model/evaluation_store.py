@@ -0,0 +1,210 @@
+"""
+Checkpoint-keyed evaluation cache.
+
+Validation logits, labels and image ids are stored once per checkpoint, keyed
+by the SHA-256 of the checkpoint file, so confusion matrices, classification
+reports and per-class curves can be regenerated from the stored arrays
+without another inference pass. The Trainer fills the store whenever it saves
+a new best model; evaluate_checkpoint() fills it for older checkpoints.
+
+    python evaluation_store.py report best_model.pth
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from typing import Optional, Sequence
+
+import numpy as np
+
+DEFAULT_STORE_DIR = "eval_cache"
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class EvaluationRecord:
+    def __init__(self, checkpoint_hash: str, logits: np.ndarray, labels: np.ndarray,
+                 image_ids: Optional[np.ndarray], class_names: Sequence[str], info: dict):
+        self.checkpoint_hash = checkpoint_hash
+        self.logits = logits
+        self.labels = labels
+        self.image_ids = image_ids
+        self.class_names = list(class_names)
+        self.info = info
+
+    @property
+    def predictions(self) -> np.ndarray:
+        return self.logits.argmax(axis=1)
+
+    @property
+    def probabilities(self) -> np.ndarray:
+        return softmax(self.logits.astype(np.float64))
+
+    def confusion_matrix(self, normalize: Optional[str] = 'true') -> np.ndarray:
+        from sklearn.metrics import confusion_matrix
+        return confusion_matrix(self.labels, self.predictions, labels=range(len(self.class_names)), normalize=normalize)
+
+    def classification_report(self, output_dict: bool = False):
+        from sklearn.metrics import classification_report
+        return classification_report(self.labels, self.predictions, labels=range(len(self.class_names)),
+                                     target_names=self.class_names, output_dict=output_dict, zero_division=0)
+
+    def macro_f1(self) -> float:
+        from sklearn.metrics import f1_score
+        return f1_score(self.labels, self.predictions, average='macro') * 100
+
+    def per_class_curves(self) -> dict:
+        """One-vs-rest ROC and precision-recall curves with their areas, per class."""
+        from sklearn.metrics import roc_curve, precision_recall_curve, auc, average_precision_score
+
+        probabilities = self.probabilities
+        curves = {}
+        for index, name in enumerate(self.class_names):
+            positives = (self.labels == index).astype(int)
+            if positives.sum() == 0 or positives.sum() == len(positives):
+                continue
+            fpr, tpr, _ = roc_curve(positives, probabilities[:, index])
+            precision, recall, _ = precision_recall_curve(positives, probabilities[:, index])
+            curves[name] = {
+                "fpr": fpr, "tpr": tpr, "roc_auc": auc(fpr, tpr),
+                "precision": precision, "recall": recall,
+                "average_precision": average_precision_score(positives, probabilities[:, index])
+            }
+        return curves
+
+    def misclassified(self) -> list:
+        """(image_id, true class, predicted class) for every wrong prediction."""
+        if self.image_ids is None:
+            return []
+        wrong = np.nonzero(self.predictions != self.labels)[0]
+        return [(str(self.image_ids[i]), self.class_names[self.labels[i]], self.class_names[self.predictions[i]]) for i in wrong]
+
+
+class EvaluationStore:
+    def __init__(self, root: str = DEFAULT_STORE_DIR):
+        self.root = root
+
+    def _paths(self, checkpoint_hash: str):
+        base = os.path.join(self.root, checkpoint_hash)
+        return base + ".npz", base + ".json"
+
+    def has(self, checkpoint_path: str) -> bool:
+        return os.path.exists(self._paths(file_sha256(checkpoint_path))[0])
+
+    def save(self, checkpoint_path: str, logits: np.ndarray, labels: np.ndarray, image_ids=None,
+             class_names: Sequence[str] = None, info: dict = None) -> EvaluationRecord:
+        os.makedirs(self.root, exist_ok=True)
+        checkpoint_hash = file_sha256(checkpoint_path)
+        arrays_path, info_path = self._paths(checkpoint_hash)
+        class_names = list(class_names) if class_names is not None else [str(i) for i in range(logits.shape[1])]
+
+        arrays = {"logits": np.asarray(logits, dtype=np.float32), "labels": np.asarray(labels, dtype=np.int64)}
+        if image_ids is not None:
+            arrays["image_ids"] = np.asarray(image_ids, dtype=str)
+        np.savez(arrays_path, **arrays)
+
+        info = dict(info or {}, checkpoint=os.path.basename(checkpoint_path), class_names=class_names,
+                    samples=int(len(labels)), created_at=time.strftime("%Y-%m-%dT%H:%M:%S"))
+        with open(info_path, "w") as f:
+            json.dump(info, f, indent=2)
+        return EvaluationRecord(checkpoint_hash, arrays["logits"], arrays["labels"], arrays.get("image_ids"), class_names, info)
+
+    def load(self, checkpoint_path: str) -> Optional[EvaluationRecord]:
+        checkpoint_hash = file_sha256(checkpoint_path)
+        arrays_path, info_path = self._paths(checkpoint_hash)
+        if not os.path.exists(arrays_path):
+            return None
+        with open(info_path) as f:
+            info = json.load(f)
+        with np.load(arrays_path) as arrays:
+            image_ids = arrays["image_ids"] if "image_ids" in arrays.files else None
+            return EvaluationRecord(checkpoint_hash, arrays["logits"], arrays["labels"], image_ids, info["class_names"], info)
+
+
+def evaluate_checkpoint(checkpoint_path: str, arch: str = "resnet18", store: EvaluationStore = None,
+                        batch_size: int = 64) -> EvaluationRecord:
+    """Stored evaluation of a checkpoint, running the validation set through it only on a cache miss."""
+    store = store or EvaluationStore()
+    record = store.load(checkpoint_path)
+    if record is not None:
+        return record
+
+    import torch
+    from architectures import build_model
+    from data_pipeline import BatchEvalTransform, FlatImageDataset, make_loader
+    from skin_cancer_dataset import get_device, get_label_encoder, get_splits
+
+    device = get_device()
+    class_names = [str(c) for c in get_label_encoder().classes_]
+    model = build_model(arch, len(class_names), pretrained=False)
+    model.load_state_dict(torch.load(checkpoint_path, map_location=device))
+    model.to(device).eval()
+
+    _, val_metadata = get_splits()
+    dataset = FlatImageDataset.from_metadata(val_metadata)
+    transform = BatchEvalTransform().to(device)
+    all_logits = []
+    with torch.inference_mode():
+        for images, _ in make_loader(dataset, batch_size):
+            all_logits.append(model(transform(images.to(device))).float().cpu())
+    logits = torch.cat(all_logits).numpy()
+    return store.save(checkpoint_path, logits, dataset.labels, dataset.image_ids, class_names, {"arch": arch})
+
+
+def plot_confusion_matrix(record: EvaluationRecord, output_path: str = "confusion_matrix.pdf", dpi: int = 300):
+    from sklearn.metrics import ConfusionMatrixDisplay
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(10, 8), dpi=dpi)
+    disp = ConfusionMatrixDisplay(confusion_matrix=record.confusion_matrix(), display_labels=record.class_names)
+    disp.plot(cmap='Blues', values_format='.2f', xticks_rotation=45)
+    plt.tight_layout()
+    plt.savefig(output_path, bbox_inches='tight')
+    plt.close()
+
+
+def plot_per_class_curves(record: EvaluationRecord, output_path: str = "per_class_curves.pdf"):
+    import matplotlib.pyplot as plt
+
+    curves = record.per_class_curves()
+    fig, (roc_ax, pr_ax) = plt.subplots(1, 2, figsize=(14, 6))
+    for name, curve in curves.items():
+        roc_ax.plot(curve["fpr"], curve["tpr"], label=f"{name} (AUC {curve['roc_auc']:.3f})")
+        pr_ax.plot(curve["recall"], curve["precision"], label=f"{name} (AP {curve['average_precision']:.3f})")
+    roc_ax.plot([0, 1], [0, 1], "k--", linewidth=0.8)
+    roc_ax.set(xlabel="False positive rate", ylabel="True positive rate", title="ROC (one-vs-rest)")
+    pr_ax.set(xlabel="Recall", ylabel="Precision", title="Precision-recall (one-vs-rest)")
+    roc_ax.legend(fontsize=8)
+    pr_ax.legend(fontsize=8)
+    fig.tight_layout()
+    fig.savefig(output_path, bbox_inches='tight')
+    plt.close(fig)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Reports from stored checkpoint evaluations")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("checkpoint")
+    parser.add_argument("--arch", default="resnet18")
+    parser.add_argument("--store", default=DEFAULT_STORE_DIR)
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    record = evaluate_checkpoint(args.checkpoint, args.arch, EvaluationStore(args.store))
+    print(record.classification_report())
+    plot_confusion_matrix(record)
+    plot_per_class_curves(record)
+    print(f"Report generated in {time.perf_counter() - start_time:.1f}s (checkpoint {record.checkpoint_hash[:12]})")
@@ -0,0 +1,32 @@
+import time
+
+import numpy as np
+import torch
+
+
+@torch.inference_mode()
+def measure_latency(model, batch_size: int = 1, image_size: int = 224, warmup: int = 10, runs: int = 50,
+                    threads: int = None, device=None) -> dict:
+    """CPU forward latency of `model` in milliseconds (median, p90, mean) for one batch."""
+    device = device or torch.device("cpu")
+    previous_threads = torch.get_num_threads()
+    if threads:
+        torch.set_num_threads(threads)
+    try:
+        model = model.to(device).eval()
+        images = torch.randn(batch_size, 3, image_size, image_size, device=device)
+        for _ in range(warmup):
+            model(images)
+        timings = []
+        for _ in range(runs):
+            start_time = time.perf_counter()
+            model(images)
+            timings.append((time.perf_counter() - start_time) * 1000)
+    finally:
+        torch.set_num_threads(previous_threads)
+    timings = np.asarray(timings)
+    return {"p50_ms": float(np.median(timings)), "p90_ms": float(np.percentile(timings, 90)), "mean_ms": float(timings.mean())}
+
+
+def count_parameters(model) -> int:
+    return sum(p.numel() for p in model.parameters())
@@ -0,0 +1,63 @@
+"""
+Launcher for multi-process CPU training.
+
+One machine, 4 processes:
+    python launch_distributed.py --nproc 4 -- --arch resnet18 --bf16
+
+Two machines, 4 processes each (run on both, node-rank 0 and 1):
+    python launch_distributed.py --nproc 4 --nnodes 2 --node-rank 0 --master-addr 10.0.0.5 -- --arch resnet18
+
+Quick check on one box without the dataset (weights must end up identical on every rank):
+    python launch_distributed.py --nproc 2 --synthetic 256 -- --arch cnn --epochs 1 --no-pretrained
+
+Arguments after "--" go to train.py. The script can also be started by torchrun
+directly; if RANK is already set it just runs the training function.
+"""
+import argparse
+import os
+import sys
+
+import torch.multiprocessing as mp
+
+
+def _worker(local_rank: int, args, train_argv):
+    os.environ.update({
+        "MASTER_ADDR": args.master_addr,
+        "MASTER_PORT": str(args.master_port),
+        "WORLD_SIZE": str(args.nproc * args.nnodes),
+        "RANK": str(args.node_rank * args.nproc + local_rank),
+        "LOCAL_RANK": str(local_rank),
+        "LOCAL_WORLD_SIZE": str(args.nproc)
+    })
+    from distributed import run_distributed_training
+    run_distributed_training(train_argv, synthetic_samples=args.synthetic)
+
+
+def main():
+    argv = sys.argv[1:]
+    if "--" in argv:
+        split = argv.index("--")
+        argv, train_argv = argv[:split], argv[split + 1:]
+    else:
+        train_argv = []
+
+    parser = argparse.ArgumentParser(description="Launch data-parallel training processes")
+    parser.add_argument("--nproc", type=int, default=2, help="processes on this node")
+    parser.add_argument("--nnodes", type=int, default=1)
+    parser.add_argument("--node-rank", type=int, default=0)
+    parser.add_argument("--master-addr", default="127.0.0.1")
+    parser.add_argument("--master-port", type=int, default=29500)
+    parser.add_argument("--synthetic", type=int, default=0, help="train on N random samples instead of HAM10000")
+    args = parser.parse_args(argv)
+
+    if "RANK" in os.environ:
+        # Started by torchrun (or another launcher) that already set up the environment
+        from distributed import run_distributed_training
+        run_distributed_training(train_argv, synthetic_samples=args.synthetic)
+        return
+
+    mp.spawn(_worker, args=(args, train_argv), nprocs=args.nproc, join=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+"""
+Linear-probe training on cached backbone features.
+
+A frozen ImageNet backbone (resnet18, densenet121 or efficientnet_b0) runs over
+the train and validation images once; the pooled features are written to
+memory-mapped .npy files under feature_cache/ and reused on every later run.
+Classifier heads are then trained on those features in seconds (one head per
+weight decay). The weight decay and epoch are chosen on a stratified slice held
+out from the training features (--selection-fraction), so the macro-F1 reported
+and stored for the validation split is not used for any choice. An optional
+partial fine-tune unfreezes the last backbone stage for a few epochs with the
+normal Trainer and replaces the probe only if its validation macro-F1 is higher.
+
+    python linear_probe.py --arch resnet18 --cache tensor_cache
+    python linear_probe.py --arch efficientnet_b0 --finetune-epochs 3
+
+The exported state dict has the same layout as train.py's, so serving,
+evaluation_store and model_artifact take it as is.
+"""
+import argparse
+import hashlib
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+from sklearn.metrics import f1_score
+
+from architectures import build_model, get_classifier, set_classifier
+from data_pipeline import BatchEvalTransform, make_loader
+
+FEATURE_CACHE_DIR = "feature_cache"
+
+# Parameters (by name prefix) trained in the partial fine-tune, besides the head
+LAST_STAGE = {
+    "resnet18": ("layer4",),
+    "densenet121": ("features.denseblock4", "features.norm5"),
+    "efficientnet_b0": ("features.7", "features.8"),
+}
+
+
+def build_backbone(arch: str, num_classes: int, device):
+    """Pretrained model with its classifier replaced by Identity; returns (backbone, feature dim)."""
+    model = build_model(arch, num_classes, pretrained=True)
+    feature_dim = get_classifier(model, arch).in_features
+    set_classifier(model, arch, nn.Identity())
+    return model.to(device).eval(), feature_dim
+
+
+def extract_features(backbone, feature_dim: int, dataset, cache_path: str, device, batch_size: int = 64,
+                     num_workers: int = None) -> np.ndarray:
+    """Pooled features for every sample of `dataset`, memory-mapped from `cache_path` once computed."""
+    if os.path.exists(cache_path):
+        return np.load(cache_path, mmap_mode="r")
+
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = cache_path + ".tmp.npy"
+    features = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(len(dataset), feature_dim))
+    transform = BatchEvalTransform().to(device)
+    offset = 0
+    with torch.inference_mode():
+        for images, _ in make_loader(dataset, batch_size, shuffle=False, num_workers=num_workers):
+            batch = backbone(transform(images.to(device))).float().cpu().numpy()
+            features[offset:offset + len(batch)] = batch
+            offset += len(batch)
+    features.flush()
+    del features
+    os.replace(tmp_path, cache_path)
+    return np.load(cache_path, mmap_mode="r")
+
+
+def feature_cache_path(arch: str, dataset, split: str) -> str:
+    ids = getattr(dataset, "image_ids", None)
+    key = hashlib.sha256("\n".join(map(str, ids if ids is not None else range(len(dataset)))).encode()).hexdigest()[:16]
+    return os.path.join(FEATURE_CACHE_DIR, f"{arch}_{split}_{key}.npy")
+
+
+def selection_split(labels, fraction: float, seed: int = 0):
+    """(fit indices, selection indices): a stratified slice of the training set for choosing the head."""
+    from sklearn.model_selection import train_test_split
+
+    indices = np.arange(len(labels))
+    fit_indices, selection_indices = train_test_split(indices, test_size=fraction, stratify=np.asarray(labels),
+                                                      random_state=seed)
+    return np.sort(fit_indices), np.sort(selection_indices)
+
+
+def head_logits(head, features) -> np.ndarray:
+    head.eval()
+    with torch.no_grad():
+        return head(torch.as_tensor(np.asarray(features))).numpy()
+
+
+def train_head(train_features, train_labels, select_features, select_labels, num_classes: int, epochs: int = 100,
+               lr: float = 1e-3, weight_decay: float = 0.0, batch_size: int = 256, balanced: bool = False):
+    """Fit a Linear head on in-memory features; returns (head of the best epoch, its selection macro-F1)."""
+    x_train = torch.as_tensor(np.asarray(train_features))
+    y_train = torch.as_tensor(np.asarray(train_labels), dtype=torch.long)
+    x_select = torch.as_tensor(np.asarray(select_features))
+    y_select = np.asarray(select_labels)
+
+    head = nn.Linear(x_train.shape[1], num_classes)
+    weight = None
+    if balanced:
+        counts = torch.bincount(y_train, minlength=num_classes).float().clamp_(min=1)
+        weight = counts.sum() / (num_classes * counts)
+    criterion = nn.CrossEntropyLoss(weight=weight)
+    optimizer = torch.optim.AdamW(head.parameters(), lr=lr, weight_decay=weight_decay)
+
+    best_f1, best_state = -1.0, None
+    for _ in range(epochs):
+        head.train()
+        for batch in torch.randperm(len(x_train)).split(batch_size):
+            optimizer.zero_grad(set_to_none=True)
+            criterion(head(x_train[batch]), y_train[batch]).backward()
+            optimizer.step()
+        head.eval()
+        with torch.no_grad():
+            logits = head(x_select)
+        f1 = f1_score(y_select, logits.argmax(dim=1).numpy(), average='macro') * 100
+        if f1 > best_f1:
+            best_f1 = f1
+            best_state = {k: v.clone() for k, v in head.state_dict().items()}
+    head.load_state_dict(best_state)
+    return head, best_f1
+
+
+def partial_fine_tune(model, arch: str, args, train_loader, val_loader, device, class_names, probe_f1: float):
+    """
+    Unfreeze the last stage and the head, then run the normal Trainer for a few
+    epochs. The fine-tuned checkpoint replaces args.model_save_path only if its
+    validation macro-F1 beats the probe's.
+    """
+    import torch.optim as optim
+    from data_pipeline import BatchAugment
+    from evaluation_store import EvaluationStore
+    from trainer import Trainer, TrainerConfig
+
+    head_parameters = {id(p) for p in get_classifier(model, arch).parameters()}
+    for name, parameter in model.named_parameters():
+        parameter.requires_grad_(name.startswith(LAST_STAGE[arch]) or id(parameter) in head_parameters)
+    finetune_path = args.model_save_path.replace(".pth", "_finetuned.pth")
+    config = TrainerConfig(
+        num_epochs=args.finetune_epochs, patience=args.finetune_epochs, model_save_path=finetune_path,
+        checkpoint_path=None, log_dir=f"runs/linear_probe_{arch}", mixed_precision=args.bf16
+    )
+    trainer = Trainer(model, optim.Adam([p for p in model.parameters() if p.requires_grad], lr=args.finetune_lr),
+                      nn.CrossEntropyLoss(), train_loader, val_loader, config, device,
+                      train_transform=BatchAugment().to(device), val_transform=BatchEvalTransform().to(device),
+                      class_names=class_names)
+    history = trainer.fit()
+
+    saved = [h for h in history if h["improved"]]
+    if not saved:
+        return history
+    finetune_f1 = saved[-1]["f1"]
+    if finetune_f1 <= probe_f1:
+        os.remove(finetune_path)
+        print(f"Fine-tune F1 {finetune_f1:.2f}% does not beat the probe's {probe_f1:.2f}%; keeping {args.model_save_path}")
+        return history
+    os.replace(finetune_path, args.model_save_path)
+    # Same file contents, so the Trainer's evaluation entry still applies; record the final name and mode
+    store = EvaluationStore()
+    record = store.load(args.model_save_path)
+    if record is not None:
+        store.save(args.model_save_path, record.logits, record.labels, record.image_ids, record.class_names,
+                   dict(record.info, arch=arch, mode="linear_probe_finetune"))
+    print(f"✅ Fine-tune F1 {finetune_f1:.2f}% beats the probe's {probe_f1:.2f}%; saved to {args.model_save_path}")
+    return history
+
+
+def main(argv=None):
+    from data_pipeline import get_fast_loaders
+    from evaluation_store import EvaluationStore
+    from skin_cancer_dataset import get_device, get_label_encoder, save_label_encoder
+
+    parser = argparse.ArgumentParser(description="Train classifier heads on cached frozen-backbone features")
+    parser.add_argument("--arch", choices=sorted(LAST_STAGE), default="resnet18")
+    parser.add_argument("--cache", default=None, help="tensor cache directory (default: decode JPEGs)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--head-epochs", type=int, default=100)
+    parser.add_argument("--head-lr", type=float, default=1e-3)
+    parser.add_argument("--weight-decays", type=lambda s: [float(v) for v in s.split(",")], default=[0.0, 1e-4, 1e-3])
+    parser.add_argument("--balanced", action="store_true", help="class-weighted loss for the heads")
+    parser.add_argument("--selection-fraction", type=float, default=0.15,
+                        help="share of the training features held out to choose weight decay and epoch")
+    parser.add_argument("--finetune-epochs", type=int, default=0, help="partial fine-tune after the probe (0 = off)")
+    parser.add_argument("--finetune-lr", type=float, default=1e-4)
+    parser.add_argument("--bf16", action="store_true")
+    parser.add_argument("--model-save-path", default=None)
+    args = parser.parse_args(argv)
+    args.model_save_path = args.model_save_path or f"best_model_probe_{args.arch}.pth"
+
+    device = get_device()
+    save_label_encoder()
+    class_names = [str(c) for c in get_label_encoder().classes_]
+    train_loader, val_loader = get_fast_loaders(args.batch_size, args.workers, args.cache)
+    train_set, val_set = train_loader.dataset, val_loader.dataset
+
+    start_time = time.perf_counter()
+    backbone, feature_dim = build_backbone(args.arch, len(class_names), device)
+    train_features = extract_features(backbone, feature_dim, train_set, feature_cache_path(args.arch, train_set, "train"),
+                                      device, args.batch_size, args.workers)
+    val_features = extract_features(backbone, feature_dim, val_set, feature_cache_path(args.arch, val_set, "val"),
+                                    device, args.batch_size, args.workers)
+    print(f"Features ready in {time.perf_counter() - start_time:.1f}s ({len(train_features)} train, {len(val_features)} val)")
+
+    start_time = time.perf_counter()
+    train_labels = np.asarray(train_set.labels)
+    fit_indices, selection_indices = selection_split(train_labels, args.selection_fraction)
+    fit_features, fit_labels = np.asarray(train_features[fit_indices]), train_labels[fit_indices]
+    select_features, select_labels = np.asarray(train_features[selection_indices]), train_labels[selection_indices]
+    best = None
+    for weight_decay in args.weight_decays:
+        head, selection_f1 = train_head(fit_features, fit_labels, select_features, select_labels, len(class_names),
+                                        args.head_epochs, args.head_lr, weight_decay, balanced=args.balanced)
+        print(f"Head weight_decay={weight_decay:g}: selection F1 {selection_f1:.2f}%")
+        if best is None or selection_f1 > best[1]:
+            best = (head, selection_f1, weight_decay)
+    head, selection_f1, weight_decay = best
+    logits = head_logits(head, val_features)
+    f1 = f1_score(val_set.labels, logits.argmax(axis=1), average='macro') * 100
+    print(f"✅ Heads trained in {time.perf_counter() - start_time:.1f}s; weight_decay={weight_decay:g} "
+          f"(selection F1 {selection_f1:.2f}%), validation F1 {f1:.2f}%")
+
+    # Export: the backbone with the probe head in place of its classifier
+    set_classifier(backbone, args.arch, head.to(device))
+    torch.save(backbone.state_dict(), args.model_save_path)
+    EvaluationStore().save(args.model_save_path, logits, val_set.labels, getattr(val_set, "image_ids", None), class_names,
+                           {"arch": args.arch, "mode": "linear_probe", "f1": f1, "selection_f1": selection_f1,
+                            "weight_decay": weight_decay})
+    print(f"Model saved to {args.model_save_path}")
+
+    if args.finetune_epochs:
+        partial_fine_tune(backbone, args.arch, args, train_loader, val_loader, device, class_names, f1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+"""
+Self-describing model artifact (.skca) for serving.
+
+Layout:
+    8 bytes   magic b"SKCA0001"
+    8 bytes   little-endian length of the JSON manifest
+    manifest  UTF-8 JSON: architecture (+ params such as pruned block widths),
+              class names, preprocessing, metrics, tensor table and the
+              SHA-256 of the data section
+    padding   to a 64-byte boundary
+    data      raw tensor bytes, each tensor starting on a 64-byte boundary
+
+Reading the manifest touches only the first few kilobytes. Tensors are views
+into a copy-on-write mmap of the file (torch.frombuffer), so loading needs no
+unpickling, no sklearn, and the weight pages are shared through the page cache
+between every serving process.
+
+    python model_artifact.py convert best_model.pth label_encoder.pkl -o best_model.skca
+    python model_artifact.py inspect best_model.skca
+    python model_artifact.py verify best_model.skca
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+from typing import Optional, Sequence
+
+import torch
+
+MAGIC = b"SKCA0001"
+ALIGNMENT = 64
+FORMAT_VERSION = 1
+
+DEFAULT_PREPROCESSING = {"resize": [224, 224], "mean": [0.5, 0.5, 0.5], "std": [0.5, 0.5, 0.5]}
+
+
+class ArtifactError(Exception):
+    pass
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _dtype_name(dtype: torch.dtype) -> str:
+    return str(dtype).replace("torch.", "")
+
+
+def save_artifact(path: str, state_dict: dict, arch: str, class_names: Sequence[str], arch_params: dict = None,
+                  preprocessing: dict = None, metrics: dict = None):
+    """Write `state_dict` and its description to `path` (atomically, via a temporary file)."""
+    tensors, offset = {}, 0
+    blobs = []
+    for name, tensor in state_dict.items():
+        data = tensor.detach().cpu().contiguous().reshape(-1).view(torch.uint8).numpy().tobytes()
+        offset = _align(offset)
+        tensors[name] = {"dtype": _dtype_name(tensor.dtype), "shape": list(tensor.shape), "offset": offset, "nbytes": len(data)}
+        blobs.append((offset, data))
+        offset += len(data)
+
+    data_section = bytearray(offset)
+    for start, data in blobs:
+        data_section[start:start + len(data)] = data
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "architecture": {"name": arch, "params": arch_params or {}},
+        "class_names": [str(c) for c in class_names],
+        "preprocessing": preprocessing or DEFAULT_PREPROCESSING,
+        "metrics": metrics or {},
+        "tensors": tensors,
+        "data_sha256": hashlib.sha256(data_section).hexdigest(),
+        "data_nbytes": len(data_section)
+    }
+    header = json.dumps(manifest).encode("utf-8")
+    prefix = MAGIC + len(header).to_bytes(8, "little") + header
+    prefix += b"\0" * (_align(len(prefix)) - len(prefix))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(prefix)
+        f.write(data_section)
+    os.replace(tmp_path, path)
+    return manifest
+
+
+def read_manifest(path: str):
+    """(manifest, data offset) without reading any tensor data."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ArtifactError(f"{path} is not a model artifact")
+        length = int.from_bytes(f.read(8), "little")
+        manifest = json.loads(f.read(length).decode("utf-8"))
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ArtifactError(f"Unsupported artifact version {manifest.get('format_version')}")
+    return manifest, _align(len(MAGIC) + 8 + length)
+
+
+class ModelArtifact:
+    """An opened artifact; tensors are mapped on first access."""
+
+    def __init__(self, path: str, verify: bool = True):
+        self.path = path
+        self.manifest, self.data_offset = read_manifest(path)
+        self._mmap = None
+        if os.path.getsize(path) != self.data_offset + self.manifest["data_nbytes"]:
+            raise ArtifactError(f"{path} is truncated or has trailing data")
+        for name, entry in self.manifest["tensors"].items():
+            if entry["offset"] + entry["nbytes"] > self.manifest["data_nbytes"]:
+                raise ArtifactError(f"Tensor '{name}' lies outside the data section")
+        if verify:
+            self.verify()
+
+    @property
+    def arch(self) -> str:
+        return self.manifest["architecture"]["name"]
+
+    @property
+    def arch_params(self) -> dict:
+        return self.manifest["architecture"]["params"]
+
+    @property
+    def class_names(self) -> list:
+        return self.manifest["class_names"]
+
+    @property
+    def preprocessing(self) -> dict:
+        return self.manifest["preprocessing"]
+
+    @property
+    def metrics(self) -> dict:
+        return self.manifest["metrics"]
+
+    def _buffer(self):
+        if self._mmap is None:
+            with open(self.path, "rb") as f:
+                # Copy-on-write: pages stay shared with the page cache until something writes to them
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        return self._mmap
+
+    def verify(self):
+        digest = hashlib.sha256()
+        with open(self.path, "rb") as f:
+            f.seek(self.data_offset)
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        if digest.hexdigest() != self.manifest["data_sha256"]:
+            raise ArtifactError(f"Checksum mismatch for {self.path}")
+
+    def tensor(self, name: str) -> torch.Tensor:
+        entry = self.manifest["tensors"][name]
+        dtype = getattr(torch, entry["dtype"])
+        if entry["nbytes"] == 0:
+            return torch.empty(entry["shape"], dtype=dtype)
+        raw = torch.frombuffer(self._buffer(), dtype=torch.uint8, count=entry["nbytes"],
+                               offset=self.data_offset + entry["offset"])
+        return raw.view(dtype).reshape(entry["shape"])
+
+    def state_dict(self) -> dict:
+        return {name: self.tensor(name) for name in self.manifest["tensors"]}
+
+    def build_model(self) -> torch.nn.Module:
+        """The model with its parameters pointing straight at the mapped file."""
+        num_classes = len(self.class_names)
+        with torch.device("meta"):
+            model = build_architecture(self.arch, num_classes, self.arch_params)
+        model.load_state_dict(self.state_dict(), assign=True)
+        return model.eval()
+
+    def build_transform(self):
+        from torchvision import transforms
+
+        return transforms.Compose([
+            transforms.Resize(tuple(self.preprocessing["resize"])),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=self.preprocessing["mean"], std=self.preprocessing["std"])
+        ])
+
+
+def build_architecture(arch: str, num_classes: int, params: dict = None) -> torch.nn.Module:
+    try:
+        from ai_model.architectures import build_model
+        from ai_model.prune_resnet import PRUNED_ARCH, build_pruned_resnet18
+    except ImportError:
+        from architectures import build_model
+        from prune_resnet import PRUNED_ARCH, build_pruned_resnet18
+
+    if arch == PRUNED_ARCH:
+        return build_pruned_resnet18(num_classes, params["block_widths"])
+    return build_model(arch, num_classes, pretrained=False)
+
+
+def convert_checkpoint(checkpoint_path: str, encoder_path: str, output_path: str, arch: str = "resnet18",
+                       metrics: Optional[dict] = None, preprocessing: dict = None) -> dict:
+    """Convert a legacy .pth state dict (or pruned checkpoint) plus pickled LabelEncoder into an artifact."""
+    import pickle
+
+    with open(encoder_path, "rb") as f:
+        class_names = [str(c) for c in pickle.load(f).classes_]
+
+    checkpoint = torch.load(checkpoint_path, map_location="cpu")
+    arch_params = {}
+    metrics = dict(metrics or {})
+    if isinstance(checkpoint, dict) and "block_widths" in checkpoint:
+        arch, arch_params = checkpoint["arch"], {"block_widths": checkpoint["block_widths"]}
+        metrics = dict(checkpoint.get("metrics", {}), **metrics)
+        checkpoint = checkpoint["state_dict"]
+
+    # Fail now rather than at serving time if the weights do not fit the architecture
+    build_architecture(arch, len(class_names), arch_params).load_state_dict(checkpoint)
+    return save_artifact(output_path, checkpoint, arch, class_names, arch_params, preprocessing, metrics)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Model artifact tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert = subparsers.add_parser("convert", help="convert a .pth checkpoint and label encoder")
+    convert.add_argument("checkpoint")
+    convert.add_argument("encoder")
+    convert.add_argument("-o", "--output", default="best_model.skca")
+    convert.add_argument("--arch", default="resnet18")
+    convert.add_argument("--metric", action="append", default=[], help="name=value, may be repeated")
+    convert.add_argument("--evaluate", action="store_true", help="add macro-F1 from the evaluation store")
+    convert.add_argument("--resize", type=int, default=None, help="test resolution (default 224)")
+    for name in ("inspect", "verify"):
+        subparsers.add_parser(name).add_argument("artifact")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        metrics = {k: float(v) for k, v in (m.split("=", 1) for m in args.metric)}
+        if args.evaluate:
+            from evaluation_store import evaluate_checkpoint
+            metrics["macro_f1"] = evaluate_checkpoint(args.checkpoint, args.arch).macro_f1()
+        preprocessing = dict(DEFAULT_PREPROCESSING, resize=[args.resize, args.resize]) if args.resize else None
+        manifest = convert_checkpoint(args.checkpoint, args.encoder, args.output, args.arch, metrics, preprocessing)
+        print(f"✅ Wrote {args.output} ({len(manifest['tensors'])} tensors, sha256 {manifest['data_sha256'][:12]})")
+    elif args.command == "inspect":
+        manifest, _ = read_manifest(args.artifact)
+        manifest["tensors"] = f"{len(manifest['tensors'])} tensors"
+        print(json.dumps(manifest, indent=2))
+    else:
+        ModelArtifact(args.artifact, verify=True)
+        print(f"✅ {args.artifact} is intact")
@@ -2,68 +2,150 @@ import torch
 import torch.nn as nn
 from torchvision import models, transforms
 from PIL import Image
-import pickle
 import numpy as np
 import os
+import threading
 import requests
 from io import BytesIO
 import base64
 
-def predict_image(image_path):
-    # ===== CONFIG =====
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    MODEL_PATH = os.path.join(BASE_DIR, "best_model.pth")
-    ENCODER_PATH = os.path.join(BASE_DIR, "label_encoder.pkl")
+# ===== CONFIG =====
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.environ.get("MODEL_PATH", os.path.join(BASE_DIR, "best_model.pth"))
+ENCODER_PATH = os.path.join(BASE_DIR, "label_encoder.pkl")
+# Self-describing artifact (see model_artifact.py); used instead of MODEL_PATH + ENCODER_PATH when present
+ARTIFACT_PATH = os.environ.get("MODEL_ARTIFACT_PATH", os.path.join(BASE_DIR, "best_model.skca"))
+
+# ===== DEVICE =====
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+# ===== TRANSFORM =====
+transform = transforms.Compose([
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=[0.5]*3, std=[0.5]*3)
+])
+
+# JPEGs are decoded at a reduced scale (DCT scaling) no smaller than this, since the model only needs 224x224
+DECODE_MIN_SIZE = 448
+
+_model = None
+_classes = None
+_load_lock = threading.Lock()
+
 
-    # ===== DEVICE =====
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+def load_model():
+    """Load the classifier and class names once per process and reuse them for every prediction."""
+    global _model, _classes
+    if _model is not None:
+        return _model, _classes
 
-    # ===== TRANSFORM =====
-    transform = transforms.Compose([
-        transforms.Resize((224, 224)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.5]*3, std=[0.5]*3)
-    ])
+    with _load_lock:
+        if _model is not None:
+            return _model, _classes
 
+        if os.path.exists(ARTIFACT_PATH):
+            model, classes = _load_artifact()
+        else:
+            model, classes = _load_legacy()
+        model.to(device)
+        model.eval()
+        _classes = classes
+        _model = model
+    return _model, _classes
+
+
+def _load_artifact():
+    global transform
+    try:
+        from ai_model.model_artifact import ModelArtifact
+    except ImportError:
+        from model_artifact import ModelArtifact
+
+    artifact = ModelArtifact(ARTIFACT_PATH, verify=True)
+    transform = artifact.build_transform()
+    return artifact.build_model(), artifact.class_names
+
+
+def _load_legacy():
+    """Fallback for a plain .pth state dict plus a pickled LabelEncoder."""
     # ===== LOAD LABEL ENCODER =====
     try:
+        import pickle  # unpickling the LabelEncoder needs scikit-learn
         with open(ENCODER_PATH, "rb") as f:
             label_encoder = pickle.load(f)
-        classes = label_encoder.classes_
+        classes = [str(c) for c in label_encoder.classes_]
     except FileNotFoundError:
         raise Exception(f"Label encoder file not found at {ENCODER_PATH}")
 
     # ===== LOAD MODEL =====
     try:
         num_classes = len(classes)
-        model = models.resnet18()
-        model.fc = nn.Linear(model.fc.in_features, num_classes)
-        model.load_state_dict(torch.load(MODEL_PATH, map_location=device))
-        model.to(device)
-        model.eval()
+        checkpoint = torch.load(MODEL_PATH, map_location=device)
+        if isinstance(checkpoint, dict) and "block_widths" in checkpoint:
+            # Channel-pruned ResNet18 saved by prune_resnet.py
+            try:
+                from ai_model.prune_resnet import build_pruned_resnet18
+            except ImportError:
+                from prune_resnet import build_pruned_resnet18
+            model = build_pruned_resnet18(num_classes, checkpoint["block_widths"])
+            checkpoint = checkpoint["state_dict"]
+        else:
+            model = models.resnet18()
+            model.fc = nn.Linear(model.fc.in_features, num_classes)
+        model.load_state_dict(checkpoint)
     except FileNotFoundError:
         raise Exception(f"Model file not found at {MODEL_PATH}")
+    return model, classes
+
+
+def freeze_model():
+    """
+    Load the model in the master before forking and turn off autograd on its
+    weights, so no gradient buffers are ever allocated for them. This does not
+    make the pages read-only: Python refcount updates on the tensor objects can
+    still copy a few pages per worker, but the large weight storages stay shared
+    as long as nothing writes to them.
+    """
+    model, _ = load_model()
+    for parameter in model.parameters():
+        parameter.requires_grad_(False)
+    return model
+
+
+def decode_image(source):
+    """
+    Decode to RGB without materialising a full-resolution bitmap of large JPEGs.
+    The original dimensions are kept in image.info["original_size"].
+    """
+    image = Image.open(source)
+    original_size = image.size
+    image.draft("RGB", (DECODE_MIN_SIZE, DECODE_MIN_SIZE))
+    image = image.convert("RGB")
+    image.info["original_size"] = original_size
+    return image
+
 
+def load_image(image_path):
     # ===== LOAD IMAGE =====
     try:
         if image_path.startswith(("http://", "https://")):
             # Load from URL
             response = requests.get(image_path, stream=True, timeout=10)
             response.raise_for_status()
-            image = Image.open(BytesIO(response.content)).convert("RGB")
+            image = decode_image(BytesIO(response.content))
         elif image_path.startswith("data:image"):
             # Load from base64-encoded string
             base64_data = image_path.split(",")[1]  # Extract base64 data
             image_data = base64.b64decode(base64_data)  # Decode base64
-            image = Image.open(BytesIO(image_data)).convert("RGB")
+            image = decode_image(BytesIO(image_data))
         elif image_path.startswith("file://"):
             # This is a file URL, we should not try to open it directly
             raise Exception("File URLs are not supported. Please provide base64 data instead.")
         else:
             # Load from local file
-            image = Image.open(image_path).convert("RGB")
-        
-        image_tensor = transform(image).unsqueeze(0).to(device)
+            image = decode_image(image_path)
+        return image
     except requests.RequestException as e:
         raise Exception(f"Failed to download image from URL: {str(e)}")
     except FileNotFoundError:
@@ -73,24 +155,53 @@ def predict_image(image_path):
     except Exception as e:
         raise Exception(f"Failed to process image: {str(e)}")
 
-    # ===== PREDICT & PROBS =====
-    with torch.no_grad():
-        output = model(image_tensor)
-        probabilities = torch.softmax(output, dim=1).cpu().numpy()[0]
-        predicted_idx = np.argmax(probabilities)
-        predicted_label = label_encoder.inverse_transform([predicted_idx])[0]
 
+def build_distribution(probabilities, classes):
     # ===== PREPARE RESPONSE =====
+    predicted_idx = int(np.argmax(probabilities))
     sorted_indices = np.argsort(probabilities)[::-1]
-    class_distribution = {
-        "predicted_class": predicted_label,
+    return {
+        "predicted_class": classes[predicted_idx],
         "probabilities": {
             classes[idx]: round(float(probabilities[idx] * 100), 4)  # Round to 4 decimal places
             for idx in sorted_indices
         }
     }
 
-    return class_distribution
+
+def predict_image(image_path):
+    return predict_pil(load_image(image_path))
+
+
+def preprocess(image):
+    """Model input tensor (3, H, W) for a decoded image, using the loaded model's preprocessing."""
+    load_model()
+    return transform(image)
+
+
+def predict_batch(image_tensors):
+    """Class distributions for a list of preprocessed tensors, in one forward pass."""
+    model, classes = load_model()
+    batch = torch.stack(image_tensors).to(device)
+    with torch.inference_mode():
+        probabilities = torch.softmax(model(batch), dim=1).cpu().numpy()
+    return [build_distribution(p, classes) for p in probabilities]
+
+
+def predict_pil(image):
+    model, classes = load_model()
+
+    try:
+        image_tensor = transform(image).unsqueeze(0).to(device)
+    except Exception as e:
+        raise Exception(f"Failed to process image: {str(e)}")
+
+    # ===== PREDICT & PROBS =====
+    with torch.inference_mode():
+        output = model(image_tensor)
+        probabilities = torch.softmax(output, dim=1).cpu().numpy()[0]
+
+    return build_distribution(probabilities, classes)
 
 if __name__ == "__main__":
     # Example usage
@@ -0,0 +1,79 @@
+"""
+Perceptual image hashes for near-duplicate detection.
+
+Both hashes are 64-bit integers that stay (nearly) the same under re-encoding,
+resizing, small crops and exposure changes, so burst shots and re-crops of the
+same mole end up a few bits apart while unrelated photos differ in ~32 bits:
+
+  * phash - sign of the low-frequency 8x8 block of the DCT of a 32x32 grey
+    thumbnail, relative to its median (stored with every diagnostic);
+  * dhash - sign of the horizontal gradient of a 9x8 grey thumbnail (cheaper,
+    a bit less robust).
+
+Hashes are stored as 16-character hex strings (to_hex / from_hex).
+
+    python perceptual_hash.py a.jpg b.jpg   # hashes and Hamming distance
+"""
+import sys
+
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8
+PHASH_IMAGE_SIZE = 32
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II basis, so dct(x) = D @ x @ D.T for an n x n block."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT = _dct_matrix(PHASH_IMAGE_SIZE)
+_BIT_WEIGHTS = np.uint64(1) << np.arange(HASH_SIZE * HASH_SIZE - 1, -1, -1, dtype=np.uint64)
+
+
+def _grey_thumbnail(image, size) -> np.ndarray:
+    thumbnail = image.convert("L").resize(size, Image.BILINEAR, reducing_gap=2.0)
+    return np.asarray(thumbnail, dtype=np.float64)
+
+
+def _pack(bits: np.ndarray) -> int:
+    return int((bits.ravel().astype(np.uint64) * _BIT_WEIGHTS).sum())
+
+
+def phash(image) -> int:
+    pixels = _grey_thumbnail(image, (PHASH_IMAGE_SIZE, PHASH_IMAGE_SIZE))
+    low_frequencies = (_DCT @ pixels @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    # The DC term only carries overall brightness
+    median = np.median(low_frequencies.ravel()[1:])
+    return _pack(low_frequencies > median)
+
+
+def dhash(image) -> int:
+    pixels = _grey_thumbnail(image, (HASH_SIZE + 1, HASH_SIZE))
+    return _pack(pixels[:, 1:] > pixels[:, :-1])
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def to_hex(value: int) -> str:
+    return f"{value:016x}"
+
+
+def from_hex(value: str) -> int:
+    return int(value, 16)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        raise SystemExit("Usage: python perceptual_hash.py <image> <image>")
+    first, second = (Image.open(path) for path in sys.argv[1:])
+    for name, fn in (("phash", phash), ("dhash", dhash)):
+        a, b = fn(first), fn(second)
+        print(f"{name}: {to_hex(a)} {to_hex(b)} distance {hamming(a, b)}")
@@ -0,0 +1,130 @@
+"""
+Progressive-resizing training schedule.
+
+Early epochs train on small crops with large batches (cheap), later epochs on
+the full 224 resolution, e.g. the default "0:128:64,10:176:48,20:224:32"
+means epochs 1-10 at 128px / batch 64, 11-20 at 176px / batch 48, then
+224px / batch 32. The schedule is applied by a Trainer callback that changes
+BatchAugment.output_size and rebuilds the train loader when the batch size
+changes; validation always runs at the serving resolution.
+
+Because random-resized crops make objects look larger at train time than the
+centre view does at test time, the best checkpoint is finally evaluated at
+several test resolutions (--eval-sizes); the best one can be recorded in the
+model artifact (model_artifact.py convert --resize).
+
+    python progressive.py --arch resnet18 --cache tensor_cache
+    python progressive.py --arch resnet18 --cache tensor_cache --baseline   # also run fixed 224 and compare
+"""
+import argparse
+import time
+
+import torch
+from sklearn.metrics import f1_score
+
+from data_pipeline import BatchEvalTransform, close_loader, make_loader
+
+DEFAULT_SCHEDULE = "0:128:64,10:176:48,20:224:32"
+
+
+def parse_schedule(text: str) -> list:
+    """"start_epoch:size:batch_size,..." -> sorted [(start_epoch, size, batch_size)]."""
+    phases = sorted(tuple(int(v) for v in phase.split(":")) for phase in text.split(","))
+    if not phases or phases[0][0] != 0:
+        raise ValueError("The schedule must start at epoch 0")
+    return phases
+
+
+class ProgressiveResizeCallback:
+    def __init__(self, schedule: list, num_workers: int = None):
+        self.schedule = schedule
+        self.num_workers = num_workers
+        self.current = None
+
+    def phase_for(self, epoch: int):
+        return [phase for phase in self.schedule if phase[0] <= epoch][-1]
+
+    def on_epoch_start(self, trainer, epoch):
+        _, size, batch_size = self.phase_for(epoch)
+        if (size, batch_size) == self.current:
+            return
+        trainer.train_transform.output_size = size
+        if trainer.train_loader.batch_size != batch_size:
+            close_loader(trainer.train_loader)
+            trainer.train_loader = make_loader(trainer.train_loader.dataset, batch_size, shuffle=True,
+                                               num_workers=self.num_workers, drop_last=True)
+        self.current = (size, batch_size)
+        print(f"📐 Training at {size}px, batch size {batch_size}")
+        trainer.log_scalar("Schedule/resolution", size, epoch)
+        trainer.log_scalar("Schedule/batch_size", batch_size, epoch)
+
+
+def evaluate_resolutions(model, val_loader, sizes, device) -> dict:
+    """Macro-F1 of `model` on the validation set at each test resolution."""
+    model.eval()
+    scores = {}
+    for size in sizes:
+        transform = BatchEvalTransform(size).to(device)
+        preds, labels = [], []
+        with torch.inference_mode():
+            for images, batch_labels, *_ in val_loader:
+                preds.append(model(transform(images.to(device))).argmax(dim=1).cpu())
+                labels.append(batch_labels)
+        scores[size] = f1_score(torch.cat(labels).numpy(), torch.cat(preds).numpy(), average='macro') * 100
+    return scores
+
+
+def run(args, train_argv, progressive: bool) -> dict:
+    from train import build_argument_parser, build_trainer
+
+    label = "progressive" if progressive else "fixed-224"
+    train_args = build_argument_parser().parse_args(train_argv)
+    train_args.resume = False
+    if not (progressive and train_args.model_save_path):
+        train_args.model_save_path = f"best_model_{label}_{train_args.arch}.pth"
+    train_args.log_dir = f"runs/{label}_{train_args.arch}"
+    callbacks = []
+    if progressive:
+        callbacks.append(ProgressiveResizeCallback(parse_schedule(args.schedule), train_args.workers))
+
+    trainer = build_trainer(train_args, callbacks=callbacks)
+    start_time = time.perf_counter()
+    history = trainer.fit()
+    seconds = time.perf_counter() - start_time
+
+    trainer.model.load_state_dict(torch.load(train_args.model_save_path, map_location=trainer.device))
+    scores = evaluate_resolutions(trainer.model, trainer.val_loader, args.eval_sizes, trainer.device)
+    best_size = max(scores, key=scores.get)
+    return {"mode": label, "epochs": len(history), "seconds": seconds,
+            "seconds_per_epoch": seconds / max(1, len(history)),
+            "best_f1": max(h["f1"] for h in history), "f1_at_224": scores.get(224, float("nan")),
+            "best_eval_size": best_size, "f1_at_best_size": scores[best_size]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train with a progressive resolution / batch size schedule")
+    parser.add_argument("--schedule", default=DEFAULT_SCHEDULE, help="start_epoch:size:batch_size,...")
+    parser.add_argument("--eval-sizes", type=lambda s: [int(v) for v in s.split(",")], default=[224, 240, 256])
+    parser.add_argument("--baseline", action="store_true", help="also train at a fixed 224 and compare")
+    args, train_argv = parser.parse_known_args(argv)
+
+    from skin_cancer_dataset import save_label_encoder
+    save_label_encoder()
+
+    results = [run(args, train_argv, progressive=True)]
+    if args.baseline:
+        results.append(run(args, train_argv, progressive=False))
+
+    print(f"\n{'mode':<14}{'epochs':>8}{'minutes':>10}{'s/epoch':>10}{'best F1':>10}{'F1@224':>10}{'best eval':>11}")
+    for r in results:
+        print(f"{r['mode']:<14}{r['epochs']:>8}{r['seconds'] / 60:>10.1f}{r['seconds_per_epoch']:>10.1f}"
+              f"{r['best_f1']:>10.2f}{r['f1_at_224']:>10.2f}{r['f1_at_best_size']:>7.2f}@{r['best_eval_size']}")
+    if len(results) == 2:
+        saved = 1 - results[0]["seconds"] / results[1]["seconds"]
+        delta = results[0]["f1_at_best_size"] - results[1]["f1_at_best_size"]
+        print(f"\nProgressive: {saved * 100:.0f}% less training time, {delta:+.2f} macro-F1 vs fixed resolution")
+    return results
+
+
+if __name__ == '__main__':
+    main()
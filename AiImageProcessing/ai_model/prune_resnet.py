@@ -0,0 +1,205 @@
+"""
+Latency-aware structured (channel) pruning of the serving ResNet18.
+
+Each BasicBlock's inner width (conv1 output = bn1 = conv2 input) is pruned
+by removing the channels with the smallest L1 filter norm, which physically
+shrinks the dense conv weights without touching the residual paths. Pruning
+proceeds in rounds: prune a fraction of every block, fine-tune for a few
+epochs, measure the real CPU latency, and stop once the latency target is met.
+
+    python prune_resnet.py --checkpoint best_model.pth --target-ms 8 --step 0.15 --finetune-epochs 2
+
+Every level is saved as best_model_pruned_<level>.pth containing the block
+widths plus the state dict; model_path.predict_image loads it when
+MODEL_PATH points at it. A Pareto table (latency vs macro-F1) is written to
+pruning_pareto.csv.
+"""
+import argparse
+import csv
+import os
+
+import torch
+import torch.nn as nn
+from torchvision.models.resnet import BasicBlock
+
+PRUNED_ARCH = "resnet18_pruned"
+
+
+def block_names(model):
+    return [f"layer{i}.{j}" for i in range(1, 5) for j in range(len(getattr(model, f"layer{i}")))]
+
+
+def get_block(model, name: str) -> BasicBlock:
+    layer, index = name.split(".")
+    return getattr(model, layer)[int(index)]
+
+
+def block_widths(model) -> dict:
+    return {name: get_block(model, name).conv1.out_channels for name in block_names(model)}
+
+
+def build_pruned_resnet18(num_classes: int, widths: dict) -> nn.Module:
+    """A ResNet18 whose BasicBlocks have the given inner widths (uninitialised)."""
+    from torchvision import models
+
+    model = models.resnet18()
+    model.fc = nn.Linear(model.fc.in_features, num_classes)
+    for name, width in widths.items():
+        block = get_block(model, name)
+        block.conv1 = nn.Conv2d(block.conv1.in_channels, width, 3, block.conv1.stride, 1, bias=False)
+        block.bn1 = nn.BatchNorm2d(width)
+        block.conv2 = nn.Conv2d(width, block.conv2.out_channels, 3, 1, 1, bias=False)
+    return model
+
+
+def prune_block(block: BasicBlock, keep: int):
+    """Keep the `keep` conv1 filters with the largest L1 norm; shrink bn1 and conv2 to match."""
+    importance = block.conv1.weight.detach().abs().sum(dim=(1, 2, 3))
+    kept = torch.sort(torch.argsort(importance, descending=True)[:keep]).values
+
+    conv1 = nn.Conv2d(block.conv1.in_channels, keep, 3, block.conv1.stride, 1, bias=False)
+    conv1.weight.data = block.conv1.weight.data[kept].clone()
+
+    bn1 = nn.BatchNorm2d(keep)
+    for attr in ("weight", "bias", "running_mean", "running_var"):
+        getattr(bn1, attr).data = getattr(block.bn1, attr).data[kept].clone()
+    bn1.num_batches_tracked = block.bn1.num_batches_tracked.clone()
+
+    conv2 = nn.Conv2d(keep, block.conv2.out_channels, 3, 1, 1, bias=False)
+    conv2.weight.data = block.conv2.weight.data[:, kept].clone()
+
+    block.conv1, block.bn1, block.conv2 = conv1, bn1, conv2
+
+
+def prune_model(model, fraction: float, min_channels: int = 8):
+    for name in block_names(model):
+        block = get_block(model, name)
+        width = block.conv1.out_channels
+        keep = max(min_channels, int(round(width * (1 - fraction))))
+        if keep < width:
+            prune_block(block, keep)
+    return model
+
+
+def save_pruned(model, path: str, num_classes: int, metrics: dict = None):
+    torch.save({
+        "arch": PRUNED_ARCH,
+        "num_classes": num_classes,
+        "block_widths": block_widths(model),
+        "state_dict": model.state_dict(),
+        "metrics": metrics or {}
+    }, path)
+
+
+def load_pruned(path: str, map_location="cpu") -> nn.Module:
+    checkpoint = torch.load(path, map_location=map_location)
+    model = build_pruned_resnet18(checkpoint["num_classes"], checkpoint["block_widths"])
+    model.load_state_dict(checkpoint["state_dict"])
+    return model
+
+
+def is_pruned_checkpoint(checkpoint) -> bool:
+    return isinstance(checkpoint, dict) and checkpoint.get("arch") == PRUNED_ARCH
+
+
+def fine_tune(model, args, level: int, train_loader, val_loader):
+    """A few epochs of the normal Trainer on the pruned model; returns the macro-F1 of the weights kept."""
+    import torch.optim as optim
+    from data_pipeline import BatchAugment, BatchEvalTransform
+    from skin_cancer_dataset import get_device
+    from trainer import Trainer, TrainerConfig
+
+    device = get_device()
+    config = TrainerConfig(
+        num_epochs=args.finetune_epochs, patience=args.finetune_epochs,
+        model_save_path=f"_pruning_level_{level}.pth", checkpoint_path=None,
+        log_dir=f"runs/pruning/level_{level}", mixed_precision=args.bf16, eval_store_dir=None
+    )
+    trainer = Trainer(model, optim.Adam(model.parameters(), lr=args.lr), nn.CrossEntropyLoss(),
+                      train_loader, val_loader, config, device,
+                      train_transform=BatchAugment().to(device), val_transform=BatchEvalTransform().to(device))
+    trainer.fit()
+    # Continue from the best fine-tuned weights
+    model.load_state_dict(torch.load(config.model_save_path, map_location=device))
+    os.remove(config.model_save_path)
+    # Score the reloaded weights the same way as level 0, so the Pareto rows are comparable
+    return evaluate_f1(model.cpu(), val_loader)
+
+
+def evaluate_f1(model, val_loader) -> float:
+    from sklearn.metrics import f1_score
+    from data_pipeline import BatchEvalTransform
+
+    transform = BatchEvalTransform()
+    model.eval()
+    preds, labels = [], []
+    with torch.inference_mode():
+        for images, batch_labels in val_loader:
+            preds.append(model(transform(images)).argmax(dim=1))
+            labels.append(batch_labels)
+    return f1_score(torch.cat(labels).numpy(), torch.cat(preds).numpy(), average='macro') * 100
+
+
+def main(argv=None):
+    from architectures import build_model
+    from data_pipeline import get_fast_loaders
+    from latency import count_parameters, measure_latency
+    from skin_cancer_dataset import get_num_classes
+
+    parser = argparse.ArgumentParser(description="Iterative channel pruning of ResNet18 driven by CPU latency")
+    parser.add_argument("--checkpoint", default="best_model.pth")
+    parser.add_argument("--target-ms", type=float, required=True, help="p50 batch-1 latency to reach")
+    parser.add_argument("--step", type=float, default=0.15, help="fraction of each block's channels removed per round")
+    parser.add_argument("--max-rounds", type=int, default=10)
+    parser.add_argument("--finetune-epochs", type=int, default=2)
+    parser.add_argument("--lr", type=float, default=1e-4)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache", default=None)
+    parser.add_argument("--threads", type=int, default=None, help="torch threads for latency measurement (match serving)")
+    parser.add_argument("--bf16", action="store_true")
+    parser.add_argument("--out-dir", default=".")
+    parser.add_argument("--pareto", default="pruning_pareto.csv")
+    args = parser.parse_args(argv)
+
+    num_classes = get_num_classes()
+    model = build_model("resnet18", num_classes, pretrained=False)
+    model.load_state_dict(torch.load(args.checkpoint, map_location="cpu"))
+    train_loader, val_loader = get_fast_loaders(args.batch_size, args.workers, args.cache)
+
+    def record(level, f1):
+        latency = measure_latency(model, threads=args.threads)
+        row = {"level": level, "params_M": count_parameters(model) / 1e6,
+               "latency_p50_ms": latency["p50_ms"], "latency_p90_ms": latency["p90_ms"], "macro_f1": f1}
+        print(f"Level {level}: {row['params_M']:.2f}M params | p50 {row['latency_p50_ms']:.2f} ms | F1 {f1:.2f}%")
+        return row
+
+    rows = [record(0, evaluate_f1(model, val_loader))]
+    for level in range(1, args.max_rounds + 1):
+        if rows[-1]["latency_p50_ms"] <= args.target_ms:
+            print(f"🎯 Latency target {args.target_ms} ms reached")
+            break
+        prune_model(model, args.step)
+        f1 = fine_tune(model, args, level, train_loader, val_loader)
+        model.cpu()
+        rows.append(record(level, f1))
+        save_pruned(model, os.path.join(args.out_dir, f"best_model_pruned_{level}.pth"), num_classes,
+                    {k: v for k, v in rows[-1].items() if k != "level"})
+    else:
+        print(f"⚠️ Latency target not reached after {args.max_rounds} rounds")
+
+    # Pareto front: levels not beaten on both latency and F1 by another level
+    for row in rows:
+        row["pareto"] = not any(o["latency_p50_ms"] <= row["latency_p50_ms"] and o["macro_f1"] > row["macro_f1"]
+                                for o in rows if o is not row)
+    with open(args.pareto, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"\n{'level':>6}{'params M':>10}{'p50 ms':>10}{'macro-F1':>10}{'pareto':>8}")
+    for row in rows:
+        print(f"{row['level']:>6}{row['params_M']:>10.2f}{row['latency_p50_ms']:>10.2f}{row['macro_f1']:>10.2f}{str(row['pareto']):>8}")
+
+
+if __name__ == '__main__':
+    main()
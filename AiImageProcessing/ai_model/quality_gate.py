@@ -0,0 +1,174 @@
+"""
+Pre-inference image quality gate.
+
+Cheap NumPy checks on a downscaled copy of the decoded image (a millisecond or
+two for a typical upload), run before the model so blurry, badly exposed,
+tiny or non-skin photos don't cost a forward pass and a stored diagnostic:
+
+  * blurry          - variance of the 4-neighbour Laplacian of the grey image
+  * overexposed /
+    underexposed    - fraction of clipped highlight / shadow pixels
+  * low_resolution  - shorter side of the original upload (image.info["original_size"])
+  * no_skin         - fraction of pixels in the YCbCr skin-tone box
+
+Every check has a reject and a (milder) flag threshold. Rejected images are
+not diagnosed; flagged ones are, with the reason codes attached to the result.
+
+    python quality_gate.py path/to/images   # report for a folder of images
+"""
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+# ===== CONFIG =====
+# Longest side of the copy the checks run on
+ANALYSIS_SIZE = int(os.environ.get("QUALITY_ANALYSIS_SIZE", "256"))
+# (reject below, flag below)
+SHARPNESS_THRESHOLDS = (float(os.environ.get("QUALITY_SHARPNESS_REJECT", "15")),
+                        float(os.environ.get("QUALITY_SHARPNESS_FLAG", "60")))
+MIN_SIDE_THRESHOLDS = (int(os.environ.get("QUALITY_MIN_SIDE_REJECT", "128")),
+                       int(os.environ.get("QUALITY_MIN_SIDE_FLAG", "224")))
+SKIN_COVERAGE_THRESHOLDS = (float(os.environ.get("QUALITY_SKIN_REJECT", "0.05")),
+                            float(os.environ.get("QUALITY_SKIN_FLAG", "0.2")))
+# (reject above, flag above) fraction of clipped pixels
+CLIPPED_THRESHOLDS = (float(os.environ.get("QUALITY_CLIPPED_REJECT", "0.5")),
+                      float(os.environ.get("QUALITY_CLIPPED_FLAG", "0.2")))
+SHADOW_LEVEL, HIGHLIGHT_LEVEL = 16, 240
+# Skin-tone box in YCbCr (Chai & Ngan), wide enough for light to dark skin under typical lighting
+SKIN_CB_RANGE = (77, 127)
+SKIN_CR_RANGE = (133, 173)
+
+REJECT, FLAG = "reject", "flag"
+
+
+class QualityReport:
+    def __init__(self, reasons, measurements, elapsed_ms):
+        self.reasons = reasons
+        self.measurements = measurements
+        self.elapsed_ms = elapsed_ms
+
+    @property
+    def rejected(self) -> bool:
+        return any(reason["severity"] == REJECT for reason in self.reasons)
+
+    @property
+    def codes(self):
+        return [reason["code"] for reason in self.reasons]
+
+    def as_dict(self) -> dict:
+        return {"reasons": self.reasons, "measurements": self.measurements}
+
+
+class ImageQualityRejected(Exception):
+    def __init__(self, report: QualityReport):
+        super().__init__("Image rejected by quality gate: " + ", ".join(report.codes))
+        self.report = report
+
+
+def downscale(image, size: int = ANALYSIS_SIZE):
+    scale = size / max(image.size)
+    if scale >= 1:
+        return image
+    new_size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(new_size, Image.BILINEAR, reducing_gap=2.0)
+
+
+# ===== MEASUREMENTS =====
+def laplacian_variance(grey: np.ndarray) -> float:
+    if min(grey.shape) < 3:
+        return 0.0
+    laplacian = (grey[:-2, 1:-1] + grey[2:, 1:-1] + grey[1:-1, :-2] + grey[1:-1, 2:]
+                 - 4 * grey[1:-1, 1:-1])
+    return float(laplacian.var())
+
+
+def skin_coverage(rgb: np.ndarray) -> float:
+    r, g, b = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    cb = 128 - 0.168736 * r - 0.331264 * g + 0.5 * b
+    cr = 128 + 0.5 * r - 0.418688 * g - 0.081312 * b
+    mask = ((cb >= SKIN_CB_RANGE[0]) & (cb <= SKIN_CB_RANGE[1])
+            & (cr >= SKIN_CR_RANGE[0]) & (cr <= SKIN_CR_RANGE[1]))
+    return float(mask.mean())
+
+
+def measure(image) -> dict:
+    small = downscale(image.convert("RGB") if image.mode != "RGB" else image)
+    rgb = np.asarray(small, dtype=np.float32)
+    grey = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    original_width, original_height = image.info.get("original_size", image.size)
+    return {
+        "sharpness": laplacian_variance(grey),
+        "mean_brightness": float(grey.mean()),
+        "shadow_fraction": float((grey <= SHADOW_LEVEL).mean()),
+        "highlight_fraction": float((grey >= HIGHLIGHT_LEVEL).mean()),
+        "min_side": int(min(original_width, original_height)),
+        "skin_coverage": skin_coverage(rgb)
+    }
+
+
+# ===== GATE =====
+def _below(reasons, code, value, thresholds):
+    reject, flag = thresholds
+    if value < reject:
+        reasons.append({"code": code, "severity": REJECT, "value": round(value, 4), "threshold": reject})
+    elif value < flag:
+        reasons.append({"code": code, "severity": FLAG, "value": round(value, 4), "threshold": flag})
+
+
+def _above(reasons, code, value, thresholds):
+    reject, flag = thresholds
+    if value > reject:
+        reasons.append({"code": code, "severity": REJECT, "value": round(value, 4), "threshold": reject})
+    elif value > flag:
+        reasons.append({"code": code, "severity": FLAG, "value": round(value, 4), "threshold": flag})
+
+
+def assess(image) -> QualityReport:
+    """Run every check on a decoded PIL image and collect the reason codes."""
+    start = time.perf_counter()
+    m = measure(image)
+    reasons = []
+    _below(reasons, "low_resolution", m["min_side"], MIN_SIDE_THRESHOLDS)
+    _below(reasons, "blurry", m["sharpness"], SHARPNESS_THRESHOLDS)
+    _above(reasons, "overexposed", m["highlight_fraction"], CLIPPED_THRESHOLDS)
+    _above(reasons, "underexposed", m["shadow_fraction"], CLIPPED_THRESHOLDS)
+    _below(reasons, "no_skin", m["skin_coverage"], SKIN_COVERAGE_THRESHOLDS)
+    measurements = {name: round(value, 4) for name, value in m.items()}
+    return QualityReport(reasons, measurements, (time.perf_counter() - start) * 1000)
+
+
+def check(image, mode: str = REJECT) -> QualityReport:
+    """
+    assess() with a policy: "reject" raises ImageQualityRejected for reject-level
+    reasons, "flag" only reports them, "off" skips the checks (returns None).
+    """
+    if mode == "off":
+        return None
+    report = assess(image)
+    if mode == REJECT and report.rejected:
+        raise ImageQualityRejected(report)
+    return report
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        raise SystemExit("Usage: python quality_gate.py <image folder>")
+    from model_path import load_image
+
+    folder = sys.argv[1]
+    counts, timings = {}, []
+    for name in sorted(os.listdir(folder)):
+        if not name.lower().endswith((".jpg", ".jpeg", ".png", ".webp")):
+            continue
+        report = assess(load_image(os.path.join(folder, name)))
+        timings.append(report.elapsed_ms)
+        status = "❌ reject" if report.rejected else ("⚠️ flag" if report.reasons else "✅ ok")
+        print(f"{name}: {status} {' '.join(report.codes)}")
+        for code in report.codes:
+            counts[code] = counts.get(code, 0) + 1
+    if timings:
+        print(f"\n{len(timings)} images, median {np.median(timings):.2f} ms, max {max(timings):.2f} ms per check")
+        print("Reasons: " + (", ".join(f"{code} {n}" for code, n in sorted(counts.items())) or "none"))
@@ -0,0 +1,122 @@
+"""
+Per-step training time breakdown.
+
+Splits every training step into data wait, host-to-device transfer, batch
+augmentation, forward (incl. loss), backward and optimizer step, and logs the
+averages every `log_every_steps` steps to TensorBoard (StepTime/*, Throughput/*,
+Memory/*) together with samples/s and memory use. Optionally records a
+torch.profiler trace for a window of steps (view with the TensorBoard profiler
+plugin or chrome://tracing).
+
+Enabled through TrainerConfig(profile_steps=True, profile_trace_dir=...), or
+    python train.py --profile-steps --profile-trace runs/trace
+"""
+import os
+import time
+from collections import defaultdict
+
+import torch
+
+PHASES = ("data", "transfer", "augment", "forward", "backward", "optimizer")
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process in MiB (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class StepProfiler:
+    def __init__(self, device, log_scalar, log_every_steps: int = 50, trace_dir: str = None,
+                 trace_skip_steps: int = 10, trace_steps: int = 5):
+        self.device = device
+        self.log_scalar = log_scalar
+        self.log_every_steps = max(1, log_every_steps)
+        self.trace_dir = trace_dir
+        self.trace_skip_steps = trace_skip_steps
+        self.trace_steps = trace_steps
+        self._trace = None
+        self._trace_done = trace_dir is None
+        self._last = None
+        self._step = defaultdict(float)
+        self._window = defaultdict(float)
+        self._window_steps = 0
+        self._window_samples = 0
+        self._epoch = defaultdict(float)
+
+    def _now(self) -> float:
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+        return time.perf_counter()
+
+    # ===== EPOCH =====
+    def start_epoch(self):
+        self._epoch.clear()
+        if not self._trace_done and self._trace is None:
+            from torch.profiler import ProfilerActivity, profile, schedule, tensorboard_trace_handler
+
+            activities = [ProfilerActivity.CPU] + ([ProfilerActivity.CUDA] if self.device.type == "cuda" else [])
+            self._trace = profile(
+                activities=activities,
+                schedule=schedule(wait=self.trace_skip_steps, warmup=1, active=self.trace_steps, repeat=1),
+                on_trace_ready=tensorboard_trace_handler(self.trace_dir),
+                record_shapes=True, profile_memory=True, with_stack=True
+            )
+            self._trace.start()
+        self._last = self._now()
+
+    def end_epoch(self, verbose: bool = True) -> dict:
+        """Total seconds per phase for the epoch; also prints the split."""
+        self._stop_trace()
+        total = sum(self._epoch.values()) or 1.0
+        if verbose:
+            print("Step time: " + " | ".join(f"{p} {self._epoch[p] / total * 100:.0f}%" for p in PHASES))
+        return dict(self._epoch)
+
+    # ===== STEP =====
+    def mark(self, phase: str):
+        """Attribute the time since the previous mark to `phase`."""
+        now = self._now()
+        self._step[phase] += now - self._last
+        self._last = now
+
+    def end_step(self, global_step: int, samples: int):
+        for phase, seconds in self._step.items():
+            self._window[phase] += seconds
+            self._epoch[phase] += seconds
+        self._step.clear()
+        self._window_steps += 1
+        self._window_samples += samples
+        if self._trace is not None:
+            self._trace.step()
+            if self._trace.step_num >= self.trace_skip_steps + 1 + self.trace_steps:
+                self._stop_trace()
+
+        if self._window_steps >= self.log_every_steps:
+            self._flush(global_step)
+        self._last = self._now()
+
+    def _flush(self, global_step: int):
+        seconds = sum(self._window.values())
+        for phase in PHASES:
+            self.log_scalar(f"StepTime/{phase}_ms", self._window[phase] / self._window_steps * 1000, global_step)
+        if seconds:
+            self.log_scalar("Throughput/step_samples_per_sec", self._window_samples / seconds, global_step)
+        self.log_scalar("Memory/rss_mb", rss_mb(), global_step)
+        if self.device.type == "cuda":
+            self.log_scalar("Memory/cuda_allocated_mb", torch.cuda.memory_allocated(self.device) / 2 ** 20, global_step)
+            self.log_scalar("Memory/cuda_max_allocated_mb", torch.cuda.max_memory_allocated(self.device) / 2 ** 20, global_step)
+        self._window.clear()
+        self._window_steps = 0
+        self._window_samples = 0
+
+    def _stop_trace(self):
+        if self._trace is not None:
+            self._trace.stop()
+            self._trace = None
+            self._trace_done = True
+            print(f"🔬 Profiler trace written to {self.trace_dir}")
@@ -0,0 +1,198 @@
+"""
+Parallel hyperparameter sweep with asynchronous successive halving (ASHA).
+
+Trials (architecture, learning rate, batch size, patience) run in parallel
+worker processes, each one a normal Trainer run. After every epoch a trial
+reports its validation macro-F1; at rung epochs (min_epochs * eta^k) it is
+stopped unless it is in the top 1/eta of the trials that reached that rung.
+All trials read the same preprocessed tensor cache, so the dataset is decoded
+once and shared through the page cache.
+
+    python sweep.py --cache tensor_cache --trials 16 --parallel 4 \
+        --archs resnet18,efficientnet_b0 --lrs 1e-4,3e-4,1e-3 --batch-sizes 32,64
+
+Results go to <out>/results.csv, a printed table, and TensorBoard (hparams tab)
+under runs/sweep/<name>.
+"""
+import argparse
+import csv
+import itertools
+import multiprocessing as mp
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+class AshaCoordinator:
+    """Rung bookkeeping shared by all trial processes through a multiprocessing manager."""
+
+    def __init__(self, manager, min_epochs: int, max_epochs: int, eta: int):
+        self.rungs = manager.dict()
+        self.lock = manager.Lock()
+        self.eta = eta
+        self.rung_epochs = []
+        epoch = min_epochs
+        while epoch < max_epochs:
+            self.rung_epochs.append(epoch)
+            epoch *= eta
+
+    def should_stop(self, trial_id: int, epoch: int, score: float) -> bool:
+        """Record `score` for a trial that just finished `epoch` (1-based); True if it should be pruned."""
+        if epoch not in self.rung_epochs:
+            return False
+        with self.lock:
+            scores = dict(self.rungs.get(epoch, {}))
+            scores[trial_id] = score
+            self.rungs[epoch] = scores
+            if len(scores) < self.eta:
+                return False
+            keep = max(1, len(scores) // self.eta)
+            cutoff = sorted(scores.values(), reverse=True)[keep - 1]
+            return score < cutoff
+
+
+class AshaCallback:
+    def __init__(self, coordinator: AshaCoordinator, trial_id: int):
+        self.coordinator = coordinator
+        self.trial_id = trial_id
+        self.pruned_at = None
+
+    def on_epoch_end(self, trainer, result):
+        if self.coordinator.should_stop(self.trial_id, result.epoch + 1, result.f1):
+            self.pruned_at = result.epoch + 1
+            print(f"✂️ Trial {self.trial_id} pruned after epoch {self.pruned_at} (F1 {result.f1:.2f}%)")
+            return True
+        return False
+
+
+def sample_trials(args) -> list:
+    grid = list(itertools.product(args.archs, args.lrs, args.batch_sizes, args.patience))
+    rng = random.Random(args.seed)
+    rng.shuffle(grid)
+    if args.trials and args.trials < len(grid):
+        grid = grid[:args.trials]
+    return [{"arch": a, "lr": lr, "batch_size": b, "patience": p} for a, lr, b, p in grid]
+
+
+def run_trial(trial_id: int, trial: dict, args, coordinator: AshaCoordinator) -> dict:
+    import torch
+    from torch.utils.tensorboard import SummaryWriter
+    from train import build_argument_parser, build_trainer
+
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // args.parallel))
+    trial_dir = os.path.join(args.out, f"trial_{trial_id:03d}")
+    os.makedirs(trial_dir, exist_ok=True)
+    log_dir = os.path.join("runs", "sweep", args.name, f"trial_{trial_id:03d}")
+
+    train_argv = [
+        "--arch", trial["arch"], "--lr", str(trial["lr"]), "--batch-size", str(trial["batch_size"]),
+        "--patience", str(trial["patience"]), "--epochs", str(args.max_epochs),
+        "--workers", str(args.workers),
+        "--model-save-path", os.path.join(trial_dir, "best_model.pth"),
+        "--log-dir", log_dir
+    ]
+    if args.cache:
+        train_argv += ["--cache", args.cache]
+    if args.bf16:
+        train_argv.append("--bf16")
+
+    writer = SummaryWriter(log_dir=log_dir)
+    callback = AshaCallback(coordinator, trial_id)
+    start_time = time.perf_counter()
+    trainer = build_trainer(build_argument_parser().parse_args(train_argv), writer=writer, callbacks=[callback])
+    history = trainer.fit()
+
+    best = max(history, key=lambda h: h["f1"]) if history else {"f1": 0.0, "val_loss": float("inf"), "accuracy": 0.0}
+    if callback.pruned_at is not None:
+        status = f"pruned@{callback.pruned_at}"
+    elif len(history) < args.max_epochs:
+        status = "early-stopped"
+    else:
+        status = "completed"
+    result = dict(trial, trial=trial_id, status=status, epochs=len(history), best_f1=best["f1"],
+                  best_accuracy=best["accuracy"], best_val_loss=min(h["val_loss"] for h in history) if history else float("inf"),
+                  seconds=time.perf_counter() - start_time)
+
+    writer.add_hparams(
+        {k: trial[k] for k in ("arch", "lr", "batch_size", "patience")},
+        {"hparam/best_f1": result["best_f1"], "hparam/best_val_loss": result["best_val_loss"], "hparam/epochs": result["epochs"]},
+        run_name="hparams"
+    )
+    writer.close()
+    return result
+
+
+def print_table(results: list):
+    columns = ["trial", "arch", "lr", "batch_size", "patience", "status", "epochs", "best_f1", "best_accuracy", "best_val_loss", "seconds"]
+    print("\n" + " | ".join(f"{c:>13}" for c in columns))
+    for row in sorted(results, key=lambda r: r["best_f1"], reverse=True):
+        cells = []
+        for c in columns:
+            value = row[c]
+            cells.append(f"{value:>13.4g}" if isinstance(value, float) else f"{value!s:>13}")
+        print(" | ".join(cells))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parallel hyperparameter sweep with ASHA pruning")
+    parser.add_argument("--name", default=time.strftime("%Y%m%d-%H%M%S"))
+    parser.add_argument("--out", default=None, help="directory for trial checkpoints and results.csv")
+    parser.add_argument("--cache", default="tensor_cache", help="shared tensor cache (empty string to decode JPEGs)")
+    parser.add_argument("--archs", type=lambda s: s.split(","), default=["resnet18"])
+    parser.add_argument("--lrs", type=lambda s: [float(v) for v in s.split(",")], default=[1e-4, 3e-4, 1e-3])
+    parser.add_argument("--batch-sizes", type=lambda s: [int(v) for v in s.split(",")], default=[32])
+    parser.add_argument("--patience", type=lambda s: [int(v) for v in s.split(",")], default=[5])
+    parser.add_argument("--trials", type=int, default=0, help="random subset of the grid (0 = full grid)")
+    parser.add_argument("--parallel", type=int, default=2, help="trials running at the same time")
+    parser.add_argument("--workers", type=int, default=0, help="DataLoader workers per trial")
+    parser.add_argument("--min-epochs", type=int, default=1, help="first rung")
+    parser.add_argument("--max-epochs", type=int, default=30)
+    parser.add_argument("--eta", type=int, default=3)
+    parser.add_argument("--bf16", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    if args.cache:
+        from tensor_cache import INDEX_FILE
+        if not os.path.isfile(os.path.join(args.cache, INDEX_FILE)):
+            raise SystemExit(f"No tensor cache at '{args.cache}'. Build it with "
+                             f"'python tensor_cache.py build --out {args.cache}' or pass --cache '' to decode JPEGs")
+    args.out = args.out or os.path.join("sweeps", args.name)
+    os.makedirs(args.out, exist_ok=True)
+
+    trials = sample_trials(args)
+    print(f"Sweep '{args.name}': {len(trials)} trials, {args.parallel} in parallel")
+
+    # Prepare the label encoder and splits once in the parent; fork shares them with the trials
+    from skin_cancer_dataset import get_splits, save_label_encoder
+    get_splits()
+    save_label_encoder()
+
+    context = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else mp.get_context()
+    results = []
+    with context.Manager() as manager:
+        coordinator = AshaCoordinator(manager, args.min_epochs, args.max_epochs, args.eta)
+        with ProcessPoolExecutor(max_workers=args.parallel, mp_context=context) as pool:
+            futures = {pool.submit(run_trial, i, trial, args, coordinator): i for i, trial in enumerate(trials)}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Trial {futures[future]} failed: {e}")
+                    continue
+                results.append(result)
+                print(f"Trial {result['trial']} {result['status']}: best F1 {result['best_f1']:.2f}%")
+
+    results_path = os.path.join(args.out, "results.csv")
+    with open(results_path, "w", newline="") as f:
+        if results:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(sorted(results, key=lambda r: r["best_f1"], reverse=True))
+    print_table(results)
+    print(f"\nResults written to {results_path}")
+    return results
+
+
+if __name__ == '__main__':
+    main()
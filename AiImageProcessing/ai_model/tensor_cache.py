@@ -0,0 +1,206 @@
+"""
+Preprocessed HAM10000 tensor cache.
+
+Decoding and resizing the full-resolution JPEGs dominates CPU training time, and
+it is repeated for every sample in every epoch. This module does it once:
+every image is decoded, resized to a fixed square size and written as uint8
+HWC into memory-mapped shard files, with a JSON index of image ids and labels.
+ShardedSkinCancerDataset then serves samples straight out of the page cache.
+
+    python tensor_cache.py build --out tensor_cache --size 256
+    python tensor_cache.py benchmark --cache tensor_cache
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import Dataset, DataLoader
+from torchvision import transforms
+
+INDEX_FILE = "index.json"
+DEFAULT_IMAGE_SIZE = 256
+DEFAULT_SHARD_SIZE = 2048
+
+# Same augmentations as skin_cancer_dataset.train_transforms, applied to uint8 CHW tensors
+cached_train_transforms = transforms.Compose([
+    transforms.RandomHorizontalFlip(),
+    transforms.RandomRotation(20),
+    transforms.RandomResizedCrop(224, scale=(0.8, 1.0), antialias=True),
+    transforms.ColorJitter(brightness=0.2, contrast=0.2),
+    transforms.ConvertImageDtype(torch.float32),
+    transforms.Normalize(mean=[0.5]*3, std=[0.5]*3)
+])
+
+cached_val_transforms = transforms.Compose([
+    transforms.Resize((224, 224), antialias=True),
+    transforms.ConvertImageDtype(torch.float32),
+    transforms.Normalize(mean=[0.5]*3, std=[0.5]*3)
+])
+
+
+def decode_resized(image_path: str, image_size: int) -> np.ndarray:
+    image = Image.open(image_path)
+    # Let the JPEG decoder downscale in the DCT domain before the real resize
+    image.draft("RGB", (image_size, image_size))
+    image = image.convert("RGB").resize((image_size, image_size), Image.BILINEAR)
+    return np.asarray(image, dtype=np.uint8)
+
+
+def build_tensor_cache(metadata, output_dir: str, class_names, image_size: int = DEFAULT_IMAGE_SIZE,
+                       shard_size: int = DEFAULT_SHARD_SIZE, num_workers: int = None):
+    """Decode every row of `metadata` (needs image_id, image_path, dx_encoded) into uint8 shards."""
+    os.makedirs(output_dir, exist_ok=True)
+    num_workers = num_workers or os.cpu_count() or 1
+    image_ids = metadata['image_id'].tolist()
+    image_paths = metadata['image_path'].tolist()
+    labels = metadata['dx_encoded'].astype(int).tolist()
+
+    shards = []
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        for shard_index, start in enumerate(range(0, len(image_ids), shard_size)):
+            paths = image_paths[start:start + shard_size]
+            file_name = f"shard_{shard_index:04d}.npy"
+            shard = np.lib.format.open_memmap(
+                os.path.join(output_dir, file_name), mode="w+", dtype=np.uint8,
+                shape=(len(paths), image_size, image_size, 3)
+            )
+            for offset, pixels in enumerate(pool.map(lambda p: decode_resized(p, image_size), paths)):
+                shard[offset] = pixels
+            shard.flush()
+            del shard
+            shards.append({"file": file_name, "count": len(paths)})
+            print(f"Shard {shard_index}: {start + len(paths)}/{len(image_ids)} images")
+
+    index = {
+        "image_size": image_size,
+        "class_names": [str(c) for c in class_names],
+        "shards": shards,
+        "image_ids": image_ids,
+        "labels": labels
+    }
+    with open(os.path.join(output_dir, INDEX_FILE), "w") as f:
+        json.dump(index, f)
+    print(f"Tensor cache written to {output_dir} in {time.perf_counter() - start_time:.1f}s")
+    return index
+
+
+def load_index(cache_dir: str) -> dict:
+    with open(os.path.join(cache_dir, INDEX_FILE)) as f:
+        return json.load(f)
+
+
+class ShardedSkinCancerDataset(Dataset):
+    """
+    Reads preprocessed images out of the memory-mapped shards without copying.
+
+    Samples are uint8 CHW tensor views over the mapped pages; `transform` should
+    work on tensors (see cached_train_transforms / cached_val_transforms).
+    The shards are opened lazily, so the dataset can be handed to DataLoader
+    worker processes and each one maps the files itself.
+    """
+
+    def __init__(self, cache_dir: str, image_ids=None, transform=None):
+        self.cache_dir = cache_dir
+        self.transform = transform
+        index = load_index(cache_dir)
+        self.image_size = index["image_size"]
+        self.class_names = index["class_names"]
+        self._shard_files = [s["file"] for s in index["shards"]]
+
+        shard_of = np.concatenate([np.full(s["count"], i, dtype=np.int32) for i, s in enumerate(index["shards"])])
+        offset_of = np.concatenate([np.arange(s["count"], dtype=np.int32) for s in index["shards"]])
+        all_ids = np.asarray(index["image_ids"])
+        all_labels = np.asarray(index["labels"], dtype=np.int64)
+
+        if image_ids is None:
+            selected = np.arange(len(all_ids))
+        else:
+            position = {image_id: i for i, image_id in enumerate(all_ids)}
+            selected = np.asarray([position[image_id] for image_id in image_ids], dtype=np.int64)
+
+        self.image_ids = all_ids[selected]
+        self.labels = all_labels[selected]
+        self._shard_index = shard_of[selected]
+        self._offset = offset_of[selected]
+        self._shards = None
+
+    def _open_shards(self):
+        # mode "c" maps copy-on-write so torch gets a writable view without a copy
+        self._shards = [np.load(os.path.join(self.cache_dir, f), mmap_mode="c") for f in self._shard_files]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_shards"] = None
+        return state
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        if self._shards is None:
+            self._open_shards()
+        pixels = self._shards[self._shard_index[idx]][self._offset[idx]]
+        image = torch.from_numpy(pixels).permute(2, 0, 1)
+        if self.transform:
+            image = self.transform(image)
+        return image, int(self.labels[idx])
+
+
+def time_one_epoch(dataset, batch_size: int = 32, num_workers: int = 0, max_batches: int = None) -> float:
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, num_workers=num_workers)
+    start_time = time.perf_counter()
+    for batch_index, (images, labels) in enumerate(loader):
+        if max_batches is not None and batch_index + 1 >= max_batches:
+            break
+    return time.perf_counter() - start_time
+
+
+def run_benchmark(cache_dir: str, batch_size: int, num_workers: int, max_batches: int = None):
+    from skin_cancer_dataset import SkinCancerDataset, get_splits, get_transforms
+
+    train_metadata, _ = get_splits()
+    train_transforms, _ = get_transforms()
+    jpeg_dataset = SkinCancerDataset(train_metadata, transform=train_transforms)
+    cached_dataset = ShardedSkinCancerDataset(cache_dir, train_metadata['image_id'].tolist(), transform=cached_train_transforms)
+
+    # Touch every shard once so the comparison is against a warm page cache, as in epoch 2+
+    time_one_epoch(cached_dataset, batch_size, num_workers, max_batches)
+
+    jpeg_seconds = time_one_epoch(jpeg_dataset, batch_size, num_workers, max_batches)
+    cached_seconds = time_one_epoch(cached_dataset, batch_size, num_workers, max_batches)
+    samples = len(cached_dataset) if max_batches is None else min(len(cached_dataset), max_batches * batch_size)
+
+    print(f"\nTraining input pipeline, {samples} samples, batch {batch_size}, {num_workers} workers")
+    print(f"JPEG decode:  {jpeg_seconds:8.2f}s  ({samples / jpeg_seconds:8.1f} samples/s)")
+    print(f"Tensor cache: {cached_seconds:8.2f}s  ({samples / cached_seconds:8.1f} samples/s)")
+    print(f"Speed-up:     {jpeg_seconds / cached_seconds:8.2f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build or benchmark the preprocessed HAM10000 tensor cache")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build")
+    build_parser.add_argument("--out", default="tensor_cache")
+    build_parser.add_argument("--size", type=int, default=DEFAULT_IMAGE_SIZE)
+    build_parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE)
+    build_parser.add_argument("--workers", type=int, default=None)
+
+    bench_parser = subparsers.add_parser("benchmark")
+    bench_parser.add_argument("--cache", default="tensor_cache")
+    bench_parser.add_argument("--batch-size", type=int, default=32)
+    bench_parser.add_argument("--workers", type=int, default=0)
+    bench_parser.add_argument("--max-batches", type=int, default=None)
+
+    args = parser.parse_args()
+    if args.command == "build":
+        from skin_cancer_dataset import load_metadata, get_label_encoder
+        build_tensor_cache(load_metadata(), args.out, get_label_encoder().classes_, args.size, args.shard_size, args.workers)
+    else:
+        run_benchmark(args.cache, args.batch_size, args.workers, args.max_batches)
@@ -0,0 +1,105 @@
+"""
+Single training entry point for every architecture.
+
+    python train.py --arch resnet18
+    python train.py --arch densenet121 --bf16 --channels-last
+    python train.py --arch cnn --cache tensor_cache --accumulation-steps 2
+"""
+import argparse
+
+import torch.nn as nn
+import torch.optim as optim
+
+from architectures import ARCHITECTURES, build_model
+from data_pipeline import BatchAugment, BatchEvalTransform, get_fast_loaders
+from skin_cancer_dataset import get_device, get_label_encoder, save_label_encoder
+from trainer import Trainer, TrainerConfig
+
+# Output locations per architecture, as used by the original scripts
+ARCH_DEFAULTS = {
+    "resnet18": {"model_save_path": "best_model.pth", "log_dir": "runs/skin_cancer_classification"},
+    "densenet121": {"model_save_path": "best_model_densenet.pth", "log_dir": "runs/densenet_skin_cancer"},
+    "efficientnet_b0": {"model_save_path": "best_model_efficientnet.pth", "log_dir": "runs/efficientnet_skin_cancer"},
+    "cnn": {"model_save_path": "best_model_cnn.pth", "log_dir": "runs/cnn_skin_cancer"},
+    "resnet10": {"model_save_path": "best_model_resnet10.pth", "log_dir": "runs/resnet10_skin_cancer"},
+    "cnn_early_exit": {"model_save_path": "best_model_cnn_early_exit.pth", "log_dir": "runs/cnn_early_exit_skin_cancer"},
+}
+
+
+def build_argument_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Train a skin lesion classifier on HAM10000")
+    parser.add_argument("--arch", choices=ARCHITECTURES, default="resnet18")
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--patience", type=int, default=5)
+    parser.add_argument("--lr", type=float, default=0.001)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--cache", default=None, help="tensor cache directory (default: decode JPEGs)")
+    parser.add_argument("--no-pretrained", action="store_true")
+    parser.add_argument("--bf16", action="store_true", help="bf16 autocast")
+    parser.add_argument("--channels-last", action="store_true")
+    parser.add_argument("--compile", action="store_true", help="torch.compile the model")
+    parser.add_argument("--accumulation-steps", type=int, default=1)
+    parser.add_argument("--model-save-path", default=None)
+    parser.add_argument("--checkpoint-path", default=None, help="full training state, saved every epoch")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue from --checkpoint-path; restores the optimizer, so --lr is ignored")
+    # Resuming used to be the default; the old opt-out is still accepted
+    parser.add_argument("--no-resume", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--log-dir", default=None)
+    parser.add_argument("--profile-steps", action="store_true", help="log per-step time breakdown to TensorBoard")
+    parser.add_argument("--profile-trace", default=None, help="also write a torch.profiler trace to this directory")
+    return parser
+
+
+def build_trainer(args, trainer_class=Trainer, loaders=None, num_classes: int = None, class_names=None,
+                  **trainer_kwargs) -> Trainer:
+    defaults = ARCH_DEFAULTS[args.arch]
+    model_save_path = args.model_save_path or defaults["model_save_path"]
+    config = TrainerConfig(
+        num_epochs=args.epochs,
+        patience=args.patience,
+        model_save_path=model_save_path,
+        checkpoint_path=args.checkpoint_path or model_save_path.replace(".pth", "_checkpoint.pt"),
+        resume=args.resume and not args.no_resume,
+        log_dir=args.log_dir or defaults["log_dir"],
+        mixed_precision=args.bf16,
+        channels_last=args.channels_last,
+        compile=args.compile,
+        accumulation_steps=args.accumulation_steps,
+        profile_steps=args.profile_steps,
+        profile_trace_dir=args.profile_trace
+    )
+
+    device = get_device()
+    if num_classes is None:
+        if class_names is None:
+            class_names = [str(c) for c in get_label_encoder().classes_]
+        num_classes = len(class_names)
+    model = build_model(args.arch, num_classes, pretrained=not args.no_pretrained)
+    train_loader, val_loader = loaders or get_fast_loaders(args.batch_size, args.workers, args.cache)
+    optimizer = optim.Adam(model.parameters(), lr=args.lr)
+
+    return trainer_class(
+        model, optimizer, nn.CrossEntropyLoss(), train_loader, val_loader, config, device,
+        train_transform=BatchAugment().to(device),
+        val_transform=BatchEvalTransform().to(device),
+        class_names=class_names,
+        **trainer_kwargs
+    )
+
+
+def main(argv=None):
+    args = build_argument_parser().parse_args(argv)
+    save_label_encoder()
+    if args.arch == "cnn_early_exit":
+        # Joint loss over the exits; early_exit.py also calibrates the exit thresholds
+        from early_exit import EarlyExitTrainer
+        trainer = build_trainer(args, trainer_class=EarlyExitTrainer)
+    else:
+        trainer = build_trainer(args)
+    return trainer.fit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,354 @@
+"""
+One training engine for every architecture.
+
+Replaces the three copy-pasted train_model loops. On top of the old behaviour
+(train, validate, log loss/accuracy/macro-F1 to TensorBoard, keep the best
+weights, early stopping on validation loss) it supports bf16 autocast,
+channels_last, gradient accumulation, torch.compile, full checkpoint/resume
+throughput logging and an opt-in per-step time breakdown.
+"""
+import contextlib
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional
+
+import numpy as np
+import torch
+import torch.nn as nn
+from sklearn.metrics import f1_score
+from torch.utils.tensorboard import SummaryWriter
+
+from data_pipeline import DataWaitMeter
+from evaluation_store import EvaluationStore
+from step_profiler import StepProfiler
+
+
+@dataclass
+class TrainerConfig:
+    num_epochs: int = 30
+    patience: int = 5
+    # Best weights only (state_dict), what the serving code loads
+    model_save_path: str = "best_model.pth"
+    # Full training state, saved every epoch; None disables it
+    checkpoint_path: Optional[str] = "last_checkpoint.pt"
+    # Continue from checkpoint_path (weights, optimizer incl. learning rate, epoch, early-stopping state)
+    resume: bool = False
+    log_dir: str = "runs/skin_cancer_classification"
+    mixed_precision: bool = False  # bf16 autocast
+    channels_last: bool = False
+    compile: bool = False
+    accumulation_steps: int = 1
+    max_grad_norm: Optional[float] = None
+    log_every_steps: int = 50
+    # Validation logits of every saved best model are kept here for reports; None disables it
+    eval_store_dir: Optional[str] = "eval_cache"
+    # Per-step time breakdown to TensorBoard (see step_profiler.py); trace dir adds a torch.profiler window
+    profile_steps: bool = False
+    profile_trace_dir: Optional[str] = None
+
+
+@dataclass
+class EpochResult:
+    epoch: int
+    train_loss: float
+    val_loss: float
+    accuracy: float
+    f1: float
+    samples_per_second: float
+    data_wait_fraction: float
+    improved: bool
+    logits: np.ndarray = field(default=None, repr=False)
+    labels: np.ndarray = field(default=None, repr=False)
+
+
+class Trainer:
+    """
+    Callbacks are objects with any of on_epoch_start(trainer, epoch) and
+    on_epoch_end(trainer, result); on_epoch_end may return True to stop training.
+    Subclasses can override compute_loss() for other objectives.
+    """
+
+    def __init__(self, model: nn.Module, optimizer, criterion, train_loader, val_loader,
+                 config: TrainerConfig = None, device=None, train_transform: Callable = None,
+                 val_transform: Callable = None, lr_scheduler=None, writer: SummaryWriter = None,
+                 callbacks: List = None, class_names: List[str] = None):
+        self.config = config or TrainerConfig()
+        self.device = device or torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.model = model.to(self.device)
+        if self.config.channels_last:
+            self.model = self.model.to(memory_format=torch.channels_last)
+        self.optimizer = optimizer
+        self.criterion = criterion
+        self.train_loader = train_loader
+        self.val_loader = val_loader
+        self.train_transform = train_transform
+        self.val_transform = val_transform
+        self.lr_scheduler = lr_scheduler
+        self.callbacks = list(callbacks or [])
+        self.class_names = class_names
+        self.writer = writer
+        self._owns_writer = writer is None
+
+        # Compiled wrapper for forward passes; checkpoints always use the plain module
+        self.forward_model = torch.compile(self.model) if self.config.compile else self.model
+
+        self.start_epoch = 0
+        self.global_step = 0
+        self.best_loss = float('inf')
+        self.patience_counter = 0
+        self.history: List[dict] = []
+        self.should_stop = False
+        self.step_profiler = None
+        if self.config.profile_steps or self.config.profile_trace_dir:
+            self.step_profiler = StepProfiler(self.device, self.log_scalar, self.config.log_every_steps,
+                                              self.config.profile_trace_dir)
+
+    # ===== HELPERS =====
+    @property
+    def is_main_process(self) -> bool:
+        return True
+
+    def autocast(self):
+        return torch.autocast(device_type=self.device.type, dtype=torch.bfloat16, enabled=self.config.mixed_precision)
+
+    def prepare_batch(self, batch, transform):
+        profiler = self.step_profiler if self.model.training else None
+        images, labels, *extra = batch
+        images = images.to(self.device, non_blocking=True)
+        labels = labels.to(self.device, non_blocking=True)
+        if profiler:
+            profiler.mark("transfer")
+        if transform is not None:
+            images = transform(images)
+        if self.config.channels_last:
+            images = images.contiguous(memory_format=torch.channels_last)
+        if profiler:
+            profiler.mark("augment")
+        return images, labels, extra
+
+    def sync_context(self, sync: bool):
+        """Context for a micro-batch; overridden to skip gradient sync between accumulation steps."""
+        return contextlib.nullcontext()
+
+    def compute_loss(self, outputs, labels, extra):
+        return self.criterion(outputs, labels)
+
+    def logits_of(self, outputs):
+        """Class logits from whatever the model returns (overridden for multi-head models)."""
+        return outputs
+
+    def log_scalar(self, tag, value, step):
+        if self.writer is not None:
+            self.writer.add_scalar(tag, value, step)
+
+    # ===== CHECKPOINTS =====
+    def state_dict(self) -> dict:
+        return {
+            "model": self.model.state_dict(),
+            "optimizer": self.optimizer.state_dict(),
+            "lr_scheduler": self.lr_scheduler.state_dict() if self.lr_scheduler else None,
+            "epoch": self.start_epoch,
+            "global_step": self.global_step,
+            "best_loss": self.best_loss,
+            "patience_counter": self.patience_counter,
+            "history": self.history,
+            "torch_rng": torch.get_rng_state(),
+            "numpy_rng": np.random.get_state()
+        }
+
+    def save_checkpoint(self, path: str = None):
+        path = path or self.config.checkpoint_path
+        if not path or not self.is_main_process:
+            return
+        tmp_path = path + ".tmp"
+        torch.save(self.state_dict(), tmp_path)
+        os.replace(tmp_path, path)
+
+    def load_checkpoint(self, path: str = None):
+        path = path or self.config.checkpoint_path
+        state = torch.load(path, map_location=self.device, weights_only=False)
+        self.model.load_state_dict(state["model"])
+        self.optimizer.load_state_dict(state["optimizer"])
+        if self.lr_scheduler and state.get("lr_scheduler"):
+            self.lr_scheduler.load_state_dict(state["lr_scheduler"])
+        self.start_epoch = state["epoch"]
+        self.global_step = state["global_step"]
+        self.best_loss = state["best_loss"]
+        self.patience_counter = state["patience_counter"]
+        self.history = state["history"]
+        torch.set_rng_state(state["torch_rng"])
+        np.random.set_state(state["numpy_rng"])
+        print(f"✅ Resumed from {path} at epoch {self.start_epoch + 1} "
+              f"(learning rate {self.optimizer.param_groups[0]['lr']:g} from the checkpoint's optimizer state)")
+        if self.start_epoch >= self.config.num_epochs or self.patience_counter >= self.config.patience:
+            print("⚠️ The checkpoint is from a finished run; there is nothing left to train")
+
+    def resume_if_requested(self):
+        path = self.config.checkpoint_path
+        if not path or not os.path.exists(path):
+            return
+        if self.config.resume:
+            self.load_checkpoint()
+        elif self.is_main_process:
+            print(f"ℹ️ Not resuming from existing {path} (pass --resume to continue it); it will be overwritten")
+
+    def store_evaluation(self, result: EpochResult):
+        """Keep the validation outputs of the checkpoint just saved, so reports never re-run inference."""
+        if not self.config.eval_store_dir:
+            return
+        image_ids = getattr(self.val_loader.dataset, "image_ids", None)
+        if image_ids is not None and len(image_ids) != len(result.labels):
+            image_ids = None
+        EvaluationStore(self.config.eval_store_dir).save(
+            self.config.model_save_path, result.logits, result.labels, image_ids, self.class_names,
+            {"epoch": result.epoch + 1, "val_loss": result.val_loss, "accuracy": result.accuracy, "f1": result.f1}
+        )
+
+    # ===== TRAINING =====
+    def train_one_epoch(self, epoch: int):
+        self.model.train()
+        accumulation_steps = max(1, self.config.accumulation_steps)
+        meter = DataWaitMeter(self.train_loader)
+        profiler = self.step_profiler
+        running_loss = 0.0
+        batches = 0
+
+        self.optimizer.zero_grad(set_to_none=True)
+        if profiler:
+            profiler.start_epoch()
+        for step, batch in enumerate(meter):
+            if profiler:
+                profiler.mark("data")
+            images, labels, extra = self.prepare_batch(batch, self.train_transform)
+            is_update_step = (step + 1) % accumulation_steps == 0 or step + 1 == len(self.train_loader)
+            with self.sync_context(is_update_step):
+                with self.autocast():
+                    outputs = self.forward_model(images)
+                    loss = self.compute_loss(outputs, labels, extra)
+                if profiler:
+                    profiler.mark("forward")
+                (loss / accumulation_steps).backward()
+                if profiler:
+                    profiler.mark("backward")
+
+            if is_update_step:
+                if self.config.max_grad_norm:
+                    nn.utils.clip_grad_norm_(self.model.parameters(), self.config.max_grad_norm)
+                self.optimizer.step()
+                self.optimizer.zero_grad(set_to_none=True)
+                self.global_step += 1
+
+            running_loss += loss.item()
+            batches += 1
+            if self.config.log_every_steps and batches % self.config.log_every_steps == 0:
+                self.log_scalar("Loss/train_step", loss.item(), self.global_step)
+            if profiler:
+                profiler.mark("optimizer")
+                profiler.end_step(self.global_step, len(labels))
+
+        if profiler:
+            profiler.end_epoch(verbose=self.is_main_process)
+        report = meter.report()
+        return running_loss / max(1, batches), report
+
+    @torch.no_grad()
+    def evaluate(self):
+        self.model.eval()
+        val_loss = 0.0
+        batches = 0
+        all_logits = []
+        all_labels = []
+        for batch in self.val_loader:
+            images, labels, extra = self.prepare_batch(batch, self.val_transform)
+            with self.autocast():
+                outputs = self.forward_model(images)
+                loss = self.compute_loss(outputs, labels, extra)
+            val_loss += loss.item()
+            batches += 1
+            all_logits.append(self.logits_of(outputs).float().cpu())
+            all_labels.append(labels.cpu())
+        if not all_logits:
+            # Empty validation shard (distributed runs with fewer images than ranks)
+            return 0.0, np.empty((0, 0), dtype=np.float32), np.empty(0, dtype=np.int64)
+        logits = torch.cat(all_logits).numpy()
+        labels = torch.cat(all_labels).numpy()
+        return val_loss / max(1, batches), logits, labels
+
+    def fit(self):
+        self.resume_if_requested()
+        if self.writer is None and self.is_main_process:
+            self.writer = SummaryWriter(log_dir=self.config.log_dir)
+
+        try:
+            for epoch in range(self.start_epoch, self.config.num_epochs):
+                if self.should_stop or self.patience_counter >= self.config.patience:
+                    break
+                if self.is_main_process:
+                    print(f"\nEpoch {epoch + 1}/{self.config.num_epochs}")
+                for callback in self.callbacks:
+                    if hasattr(callback, "on_epoch_start"):
+                        callback.on_epoch_start(self, epoch)
+
+                result = self.run_epoch(epoch)
+                self.start_epoch = epoch + 1
+                self.save_checkpoint()
+
+                for callback in self.callbacks:
+                    if hasattr(callback, "on_epoch_end") and callback.on_epoch_end(self, result):
+                        self.should_stop = True
+
+                if self.patience_counter >= self.config.patience:
+                    if self.is_main_process:
+                        print("\n⚠️ Early stopping triggered.")
+                    break
+        finally:
+            if self._owns_writer and self.writer is not None:
+                self.writer.close()
+                self.writer = None
+        return self.history
+
+    def run_epoch(self, epoch: int) -> EpochResult:
+        epoch_start = time.perf_counter()
+        train_loss, data_report = self.train_one_epoch(epoch)
+        train_seconds = time.perf_counter() - epoch_start
+        if self.lr_scheduler is not None:
+            self.lr_scheduler.step()
+
+        avg_val_loss, logits, labels = self.evaluate()
+        preds = logits.argmax(axis=1)
+        accuracy = (preds == labels).mean() * 100
+        f1 = f1_score(labels, preds, average='macro') * 100
+        samples_per_second = data_report["samples"] / train_seconds if train_seconds else 0.0
+
+        improved = avg_val_loss < self.best_loss
+        if improved:
+            self.best_loss = avg_val_loss
+            self.patience_counter = 0
+        else:
+            self.patience_counter += 1
+
+        result = EpochResult(epoch, train_loss, avg_val_loss, accuracy, f1, samples_per_second,
+                             data_report["data_wait_fraction"], improved, logits, labels)
+        self.history.append({k: v for k, v in result.__dict__.items() if k not in ("logits", "labels")})
+
+        if self.is_main_process:
+            print(f"Training Loss: {train_loss:.4f} | {samples_per_second:.1f} samples/s | "
+                  f"data wait {data_report['data_wait_fraction'] * 100:.1f}%")
+            print(f"Val Loss: {avg_val_loss:.4f} | Acc: {accuracy:.2f}% | F1: {f1:.2f}%")
+
+            self.log_scalar("Loss/train", train_loss, epoch)
+            self.log_scalar("Loss/val", avg_val_loss, epoch)
+            self.log_scalar("Accuracy/val", accuracy, epoch)
+            self.log_scalar("F1_score/val", f1, epoch)
+            self.log_scalar("Throughput/train_samples_per_sec", samples_per_second, epoch)
+            self.log_scalar("Throughput/data_wait_fraction", data_report["data_wait_fraction"], epoch)
+            self.log_scalar("Time/epoch_seconds", time.perf_counter() - epoch_start, epoch)
+
+            if improved:
+                torch.save(self.model.state_dict(), self.config.model_save_path)
+                self.store_evaluation(result)
+                print("✨ Validation loss improved. Model saved.")
+            else:
+                print(f"🛑 No improvement. Patience counter: {self.patience_counter}/{self.config.patience}")
+        return result
@@ -0,0 +1,31 @@
+"""add diagnostic phash and created_at
+
+Revision ID: 4c1e7b2a9f03
+Revises: 9d87aa5ad1f9
+Create Date: 2026-10-19 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '4c1e7b2a9f03'
+down_revision: Union[str, None] = '9d87aa5ad1f9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('diagnostics', sa.Column('phash', sa.String(length=16), nullable=True))
+    op.add_column('diagnostics', sa.Column('created_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_diagnostics_created_at'), 'diagnostics', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_diagnostics_created_at'), table_name='diagnostics')
+    op.drop_column('diagnostics', 'created_at')
+    op.drop_column('diagnostics', 'phash')
@@ -0,0 +1,42 @@
+import os
+
+# Deployment profile: "development" keeps the verbose defaults, "production" turns them off
+APP_PROFILE = os.getenv("APP_PROFILE", "development").lower()
+IS_PRODUCTION = APP_PROFILE == "production"
+
+DEBUG = not IS_PRODUCTION
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO" if IS_PRODUCTION else "DEBUG").upper()
+
+# Fraction of successful requests that get an access log line (errors and slow requests are always logged)
+ACCESS_LOG_SAMPLE_RATE = float(os.getenv("ACCESS_LOG_SAMPLE_RATE", "0.01" if IS_PRODUCTION else "1.0"))
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "1.0"))
+
+# Output directory of on-demand profiling sessions (app/utils/profiling.py)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+# Uploads to /post: stored by content hash under UPLOAD_DIR, rejected above MAX_UPLOAD_BYTES
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+
+# Pre-inference quality gate (ai_model/quality_gate.py): "reject", "flag" or "off"
+QUALITY_GATE_MODE = os.getenv("QUALITY_GATE_MODE", "reject").lower()
+
+# Near-duplicate uploads (perceptual hash within this many bits of a recent image of the same user):
+# "reuse" returns the earlier result without running the model, "link" runs it and references the match, "off"
+NEAR_DUPLICATE_MODE = os.getenv("NEAR_DUPLICATE_MODE", "reuse").lower()
+NEAR_DUPLICATE_MAX_DISTANCE = int(os.getenv("NEAR_DUPLICATE_MAX_DISTANCE", "6"))
+NEAR_DUPLICATE_WINDOW_SECONDS = float(os.getenv("NEAR_DUPLICATE_WINDOW_SECONDS", str(24 * 3600)))
+# How long a user's indexed hashes are trusted before they are re-read (picks up other workers' uploads)
+NEAR_DUPLICATE_RELOAD_SECONDS = float(os.getenv("NEAR_DUPLICATE_RELOAD_SECONDS", "30"))
+
+# Batch diagnosis: images per request, images per forward pass, decode threads
+MAX_BATCH_IMAGES = int(os.getenv("MAX_BATCH_IMAGES", "64"))
+INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", "8"))
+DECODE_WORKERS = int(os.getenv("DECODE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Live camera frames over WebSocket (/diagnostic/live): frame size cap, minimum seconds between
+# classified frames per connection, EMA weight of the newest frame, connections per user
+LIVE_MAX_FRAME_BYTES = int(os.getenv("LIVE_MAX_FRAME_BYTES", str(512 * 1024)))
+LIVE_MIN_FRAME_INTERVAL = float(os.getenv("LIVE_MIN_FRAME_INTERVAL", "0.2"))
+LIVE_EMA_ALPHA = float(os.getenv("LIVE_EMA_ALPHA", "0.3"))
+LIVE_MAX_CONNECTIONS_PER_USER = int(os.getenv("LIVE_MAX_CONNECTIONS_PER_USER", "2"))
@@ -1,15 +1,27 @@
 from http.client import HTTPException
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, status, Request, WebSocket
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
+import base64
+import binascii
 import json
 from typing import List
 
+from app.config import UPLOAD_DIR, MAX_UPLOAD_BYTES, MAX_BATCH_IMAGES
 from app.databases.database import SessionLocal
-from app.pydantic.diagnostic_schema import DiagnosticCreateFE, DiagnosticResponse, DiagnosticCreateAI, DiagnosticSaveFE
+from app.pydantic.diagnostic_schema import DiagnosticCreateFE, DiagnosticResponse, DiagnosticCreateAI, DiagnosticSaveFE, DiagnosticBatchFE
 from app.repo.DiagnosticRepository import create_diagnostic, get_diagnostics, delete_diagnostic, get_user_diagnostics
-from app.services.DiagnosticService import DiagnosticService
+from ai_model.quality_gate import ImageQualityRejected
+from app.services.DiagnosticService import DiagnosticService, remember_hash
+from app.services.BatchDiagnosticService import BatchDiagnosticService
+from app.services.LiveDiagnosticService import LiveDiagnosticSession
 from app.services.UserService import UserService
+from app.services.InferenceScheduler import inference_scheduler, QuotaExceededError
 from app.model import Diagnostic
+from app.utils.security import require_admin
+from app.utils.streaming_upload import receive_upload, UploadRejected
 
 router = APIRouter()
 
@@ -20,6 +32,23 @@ def get_db():
     finally:
         db.close()
 
+def quality_rejected_response(e: ImageQualityRejected) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        detail={"message": str(e), **e.report.as_dict()}
+    )
+
+def quota_exceeded_response(e: QuotaExceededError) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=str(e),
+        headers={"Retry-After": str(max(1, int(min(e.retry_after, 3600) + 0.999)))}
+    )
+
+@router.get("/diagnostic/scheduler/stats", dependencies=[Depends(require_admin)])
+def get_scheduler_stats():
+    return inference_scheduler.stats()
+
 @router.post("/diagnostic/post", response_model=DiagnosticResponse)
 def create_diagnostic_route(diagnostic_create: DiagnosticSaveFE, db: Session = Depends(get_db)):
     try:
@@ -27,7 +56,7 @@ def create_diagnostic_route(diagnostic_create: DiagnosticSaveFE, db: Session = D
         diagnostic_service = DiagnosticService(db)
         
         # Check if user exists
-        if user_service.find_by_id(diagnostic_create.user_id) is None:
+        if not user_service.user_exists(diagnostic_create.user_id):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User does not exist or incorrect"
@@ -58,7 +87,7 @@ def get_user_diagnostics_route(user_id: int, db: Session = Depends(get_db)):
     try:
         # Check if user exists
         user_service = UserService(db)
-        if user_service.find_by_id(user_id) is None:
+        if not user_service.user_exists(user_id):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found"
@@ -134,8 +163,12 @@ def set_diagnosis_route(diagnostic_create: DiagnosticCreateFE, db: Session = Dep
                 image_data=None  # Clear the base64 data since we're using the file
             )
             
-            # Get diagnosis using the updated diagnostic_create object
-            result = diagnostic_service.post_diagnostic_with_mole_result(diagnostic_create)
+            # Get diagnosis using the updated diagnostic_create object, in this user's fair share of inference
+            result = inference_scheduler.run(
+                diagnostic_create.user_id,
+                diagnostic_service.post_diagnostic_with_mole_result,
+                diagnostic_create
+            )
             
             # Update the result's image_url to be the original URL
             result.image_url = diagnostic_create.image_url
@@ -150,27 +183,49 @@ def set_diagnosis_route(diagnostic_create: DiagnosticCreateFE, db: Session = Dep
                 except Exception as e:
                     print(f"Error cleaning up temporary file: {e}")
             
+    except QuotaExceededError as e:
+        raise quota_exceeded_response(e)
+    except ImageQualityRejected as e:
+        raise quality_rejected_response(e)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=str(e)
         )
 
-@router.post("/post")
-async def create_diagnostic_endpoint(
-    file: UploadFile = File(...),
-    user_id: int = Form(...),
-    db: Session = Depends(get_db)
-):
+# The body is parsed by hand (streamed), so describe the form for the OpenAPI docs
+UPLOAD_FORM_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["file", "user_id"],
+            "properties": {"file": {"type": "string", "format": "binary"}, "user_id": {"type": "integer"}}
+        }}}
+    }
+}
+
+def check_upload_fields(fields: dict):
+    try:
+        int(fields.get("user_id", ""))
+    except ValueError:
+        raise UploadRejected(status.HTTP_422_UNPROCESSABLE_ENTITY, "user_id must be an integer")
+
+@router.post("/post", openapi_extra=UPLOAD_FORM_SCHEMA)
+async def create_diagnostic_endpoint(request: Request, db: Session = Depends(get_db)):
+    # Stream the upload to disk, named by its SHA-256; type and size are checked as it arrives.
+    # user_id is checked before the file is kept, so a bad form leaves nothing behind.
+    try:
+        upload = await receive_upload(request.headers, request.stream(), UPLOAD_DIR, MAX_UPLOAD_BYTES,
+                                      validate_fields=check_upload_fields)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    user_id = int(upload.fields["user_id"])
+
     try:
-        # Save the uploaded file
-        file_location = f"uploads/{file.filename}"
-        with open(file_location, "wb+") as file_object:
-            file_object.write(await file.read())
-        
         # Create diagnostic record
         diagnostic = Diagnostic(
-            image_url=file_location,
+            image_url=upload.path,
             result="{}",  # Empty result initially
             user_id=user_id
         )
@@ -179,6 +234,99 @@ async def create_diagnostic_endpoint(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+BATCH_FORM_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {"schema": {
+                "type": "object",
+                "required": ["files", "user_id"],
+                "properties": {
+                    "files": {"type": "array", "items": {"type": "string", "format": "binary"}},
+                    "user_id": {"type": "integer"}
+                }
+            }},
+            "application/json": {"schema": DiagnosticBatchFE.model_json_schema()}
+        }
+    }
+}
+
+def check_batch_image(index: int, data: bytes) -> bytes:
+    if not data:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Image {index} is empty")
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Image {index} exceeds the {MAX_UPLOAD_BYTES / 2 ** 20:g} MB limit"
+        )
+    return data
+
+async def read_batch_request(request: Request):
+    """(user_id, [image bytes]) from a multipart form with repeated `files` parts or a DiagnosticBatchFE JSON body."""
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form(max_files=MAX_BATCH_IMAGES + 1)
+        try:
+            user_id = int(form.get("user_id", ""))
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="user_id must be an integer")
+        files = [part for part in form.getlist("files") if not isinstance(part, str)]
+        if len(files) > MAX_BATCH_IMAGES:
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"At most {MAX_BATCH_IMAGES} images per batch")
+        images = [check_batch_image(i, await part.read()) for i, part in enumerate(files)]
+        await form.close()
+        return user_id, images
+
+    try:
+        batch = DiagnosticBatchFE(**await request.json())
+    except (ValueError, TypeError, ValidationError) as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Invalid batch body: {e}")
+    if len(batch.images) > MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"At most {MAX_BATCH_IMAGES} images per batch")
+    images = []
+    for i, encoded in enumerate(batch.images):
+        try:
+            images.append(check_batch_image(i, base64.b64decode(encoded.split(",", 1)[-1], validate=True)))
+        except binascii.Error:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Image {i} is not valid base64")
+    return batch.user_id, images
+
+def batch_user_exists(user_id: int) -> bool:
+    # Own short-lived session: the request's would stay open while the results stream
+    db = SessionLocal()
+    try:
+        return UserService(db).user_exists(user_id)
+    finally:
+        db.close()
+
+@router.post("/diagnostic/batch", openapi_extra=BATCH_FORM_SCHEMA)
+async def batch_diagnosis(request: Request):
+    """
+    Diagnose many images in one request. Results are streamed as NDJSON, one
+    line per image as soon as its inference batch finishes, then a summary line;
+    all diagnostics are saved in a single transaction.
+    """
+    user_id, images = await read_batch_request(request)
+    if not images:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No images in batch")
+    # Checked before streaming starts, while an error status can still be sent
+    if not await run_in_threadpool(batch_user_exists, user_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    # One rate-limit token per batch request; the batches themselves are weighted by image count
+    try:
+        inference_scheduler.reserve(user_id)
+    except QuotaExceededError as e:
+        raise quota_exceeded_response(e)
+    return StreamingResponse(BatchDiagnosticService(user_id, images).stream(), media_type="application/x-ndjson")
+
+@router.websocket("/diagnostic/live")
+async def live_diagnosis(websocket: WebSocket, user_id: int):
+    """
+    Classify a stream of low-resolution camera frames (binary or base64 messages);
+    always the newest frame, with smoothed probabilities sent back for each one.
+    """
+    await LiveDiagnosticSession(websocket, user_id).run()
+
 @router.get("/diagnostic/{diagnostic_id}")
 def read_diagnostic(diagnostic_id: int, db: Session = Depends(get_db)):
     db_diagnostic = get_diagnostics(db, diagnostic_id)
@@ -216,23 +364,33 @@ async def get_diagnosis(diagnostic_create: DiagnosticCreateFE, db: Session = Dep
             image_data=None  # Clear the base64 data since we're using it as image_url
         )
         
-        # Get diagnosis using the existing function
-        result = diagnostic_service.post_diagnostic_with_mole_result(diagnostic_create)
+        # Get diagnosis using the existing function, in this user's fair share of inference
+        result = await inference_scheduler.submit(
+            diagnostic_create.user_id,
+            diagnostic_service.post_diagnostic_with_mole_result,
+            diagnostic_create
+        )
         
         # Create diagnostic record with original image_url
         diagnostic = Diagnostic(
             image_url=diagnostic_create.image_url,  # Store the original image_url
             result=result.result,  # result is already a JSON string
-            user_id=diagnostic_create.user_id
+            user_id=diagnostic_create.user_id,
+            phash=result.phash
         )
         
         # Save to database
         db_diagnostic = create_diagnostic(db, diagnostic)
+        remember_hash(db_diagnostic)
         
         return {
             "diagnostic_id": db_diagnostic.id,
             "result": result.result
         }
+    except QuotaExceededError as e:
+        raise quota_exceeded_response(e)
+    except ImageQualityRejected as e:
+        raise quality_rejected_response(e)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Depends
+
+from app.utils.memory import memory_snapshot, set_tracemalloc
+from app.utils.metrics import metrics
+from app.utils.security import require_admin
+
+router = APIRouter(prefix="/admin/memory", tags=["memory"], dependencies=[Depends(require_admin)])
+
+
+@router.get("")
+def get_memory():
+    """RSS, torch allocator stats, decoded image peaks and (when tracing) top allocators per stage."""
+    snapshot = memory_snapshot()
+    snapshot["stages"] = metrics.snapshot("memory.stage")["histograms"]
+    return snapshot
+
+
+@router.post("/tracemalloc")
+def toggle_tracemalloc(enabled: bool = True):
+    """tracemalloc slows allocation-heavy code noticeably; enable it only while investigating."""
+    set_tracemalloc(enabled)
+    return {"tracemalloc": enabled}
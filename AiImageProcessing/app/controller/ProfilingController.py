@@ -0,0 +1,71 @@
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse
+
+from app.utils.profiling import profiler
+from app.utils.security import require_admin
+
+router = APIRouter(prefix="/admin/profiling", tags=["profiling"], dependencies=[Depends(require_admin)])
+
+
+def get_session_or_404(session_id: str):
+    session = profiler.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Profiling session not found (it may still be running in another worker)")
+    return session
+
+
+def get_finished_session(session_id: str):
+    session = get_session_or_404(session_id)
+    if not session.wait(0):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Profiling session is still running")
+    return session
+
+
+@router.post("/start")
+def start_profiling(requests: int = 100, seconds: float = 30.0, interval_ms: float = 5.0, operators: bool = True):
+    """Profile the next `requests` requests or `seconds` seconds, whichever ends first."""
+    try:
+        session = profiler.start(requests, seconds, interval_ms / 1000, operators)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return session.summary()
+
+
+@router.post("/stop")
+def stop_profiling():
+    session = profiler.stop()
+    if session is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"No profiling session is running in worker {os.getpid()}")
+    return session.summary()
+
+
+@router.get("/status")
+def get_profiling_status():
+    return {
+        "pid": os.getpid(),
+        "running": profiler.session.summary() if profiler.session is not None else None,
+        "finished": [session.id for session in profiler.finished.values()]
+    }
+
+
+@router.get("/{session_id}")
+def get_profiling_session(session_id: str):
+    return get_session_or_404(session_id).summary()
+
+
+@router.get("/{session_id}/trace")
+def get_profiling_trace(session_id: str):
+    """Chrome trace of the profiled forward passes (chrome://tracing or ui.perfetto.dev)."""
+    session = get_finished_session(session_id)
+    return FileResponse(session.trace_path, media_type="application/json", filename=f"trace-{session.id}.json")
+
+
+@router.get("/{session_id}/stacks")
+def get_profiling_stacks(session_id: str):
+    """Collapsed Python stacks, one "frame;frame;... count" line each (flamegraph.pl, speedscope)."""
+    session = get_finished_session(session_id)
+    return FileResponse(session.stacks_path, media_type="text/plain", filename=f"stacks-{session.id}.collapsed")
@@ -6,33 +6,30 @@ from fastapi import FastAPI, Depends, HTTPException, Request
 from starlette.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import ValidationError
-from starlette.middleware.base import BaseHTTPMiddleware
-import time
 
+from app.config import DEBUG, LOG_LEVEL
 from app.databases.database import SessionLocal, engine, Base
 from app.controller.UserController import router as user_controller_router
 from app.controller.DiagnosticController import router as diagnostic_controller_router
+from app.controller.ProfilingController import router as profiling_controller_router
+from app.controller.MemoryController import router as memory_controller_router
 from app.routers import auth_routes
 from app.model import user_model
+from app.middleware.observability import ObservabilityMiddleware
+from app.utils.metrics import metrics
+from app.utils.memory import record_memory_gauges
+from app.utils.security import require_admin
 
 # Initialize database tables
 Base.metadata.create_all(bind=engine)
 
 # Initialize FastAPI app
-app = FastAPI(title="MoleCancerDetector API", debug=True)
+app = FastAPI(title="MoleCancerDetector API", debug=DEBUG)
 
-logging.basicConfig(level=logging.DEBUG)  # Enable debug logging
+logging.basicConfig(level=LOG_LEVEL)  # DEBUG in development, INFO in the production profile
 
-# Add request logging middleware
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
-        response = await call_next(request)
-        process_time = time.time() - start_time
-        logging.debug(f"Request: {request.method} {request.url.path} - Status: {response.status_code} - Time: {process_time:.2f}s")
-        return response
-
-app.add_middleware(RequestLoggingMiddleware)
+# Request ids, timings and sampled access logs
+app.add_middleware(ObservabilityMiddleware)
 
 # Configure CORS
 app.add_middleware(
@@ -62,6 +59,8 @@ def get_db():
 # Include routers
 app.include_router(user_controller_router)
 app.include_router(diagnostic_controller_router)
+app.include_router(profiling_controller_router)
+app.include_router(memory_controller_router)
 app.include_router(auth_routes.router)
 
 # Function to get local IPv4 address
@@ -73,6 +72,11 @@ def get_local_ip():
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/metrics", dependencies=[Depends(require_admin)])
+async def get_metrics():
+    record_memory_gauges()
+    return metrics.snapshot()
+
 if __name__ == "__main__":
     local_ip = get_local_ip()  # Get the current local IP
     print(f"Running on: http://{local_ip}:8001")
@@ -0,0 +1,89 @@
+import json
+import logging
+import random
+import time
+import uuid
+
+from app.config import ACCESS_LOG_SAMPLE_RATE, SLOW_REQUEST_SECONDS
+from app.utils.metrics import metrics
+from app.utils.profiling import profiler
+
+access_logger = logging.getLogger("app.access")
+
+REQUEST_ID_HEADER = b"x-request-id"
+
+
+class ObservabilityMiddleware:
+    """
+    Pure ASGI middleware: assigns a request id, records request timings into the
+    metrics registry and writes sampled structured access logs.
+
+    Unlike BaseHTTPMiddleware it never wraps the response body; it only peeks at
+    the "http.response.start" message to read the status and add the id header.
+    """
+
+    def __init__(self, app, sample_rate: float = ACCESS_LOG_SAMPLE_RATE, slow_request_seconds: float = SLOW_REQUEST_SECONDS):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow_request_seconds = slow_request_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == REQUEST_ID_HEADER:
+                request_id = value.decode("latin-1")
+                break
+        if not request_id:
+            request_id = uuid.uuid4().hex
+        scope.setdefault("state", {})["request_id"] = request_id
+
+        status_code = 500
+        start_time = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                # Copy: the header list belongs to the response object
+                headers = list(message.get("headers", []))
+                headers.append((REQUEST_ID_HEADER, request_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start_time
+            self._record(scope, request_id, status_code, elapsed)
+
+    def _record(self, scope, request_id: str, status_code: int, elapsed: float):
+        # Label by route template, not raw path, so ids in URLs don't explode cardinality
+        route = scope.get("route")
+        path = getattr(route, "path", None) or "unmatched"
+        method = scope["method"]
+
+        metrics.observe("http.request.seconds", elapsed, method=method, route=path)
+        metrics.inc("http.requests", method=method, route=path, status=status_code // 100 * 100)
+        session = profiler.session
+        if session is not None:
+            session.request_finished(f"{method} {path}", elapsed)
+
+        always_log = status_code >= 500 or elapsed >= self.slow_request_seconds
+        if not always_log and (self.sample_rate <= 0 or random.random() >= self.sample_rate):
+            return
+        level = logging.WARNING if always_log else logging.INFO
+        if not access_logger.isEnabledFor(level):
+            return
+        access_logger.log(level, json.dumps({
+            "request_id": request_id,
+            "method": method,
+            "path": scope["path"],
+            "route": path,
+            "status": status_code,
+            "duration_ms": round(elapsed * 1000, 2),
+            "client": scope["client"][0] if scope.get("client") else None
+        }))
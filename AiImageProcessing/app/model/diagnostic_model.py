@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, String, ForeignKey
 from sqlalchemy.orm import relationship
 from app.databases.database import Base
 
@@ -8,4 +10,7 @@ class Diagnostic(Base):
     image_url = Column(String, nullable=False)
     result = Column(String)
     user_id = Column(Integer, ForeignKey("users.id"))
+    # Perceptual hash of the image (ai_model/perceptual_hash.py), 16 hex digits
+    phash = Column(String(16), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
     user = relationship("User", back_populates="diagnostics")
\ No newline at end of file
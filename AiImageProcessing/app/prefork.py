@@ -0,0 +1,269 @@
+"""
+Pre-fork production launcher.
+
+The master process imports torch, loads and freezes the classifier, imports the
+FastAPI app and binds the listening socket. It then forks N uvicorn workers that
+inherit all of that memory copy-on-write, so the weights exist once in RAM no
+matter how many workers are running.
+
+    python -m app.prefork --workers 4 --port 8001
+
+Signals sent to the master:
+    SIGHUP   rolling restart, one worker at a time, without dropping the socket
+    SIGUSR1  print the per-worker memory report
+    SIGTERM  graceful shutdown of all workers
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+os.environ.setdefault("APP_PROFILE", "production")
+
+# How long a freshly forked worker gets before the next old one is stopped during a rolling restart
+WORKER_BOOT_SECONDS = 3.0
+WORKER_SHUTDOWN_TIMEOUT = 30.0
+# A worker that exits sooner than this after being forked counts as a crash at startup (import, bind, ...);
+# its slot is respawned after an exponential backoff, and the master gives up after too many in a row
+WORKER_MIN_UPTIME = 10.0
+RESPAWN_BACKOFF_SECONDS = 0.5
+RESPAWN_BACKOFF_MAX_SECONDS = 5.0
+MAX_QUICK_FAILURES = 10
+
+SMAPS_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def read_smaps_rollup(pid: int) -> dict:
+    """Memory counters (in KiB) for a process, from /proc/<pid>/smaps_rollup."""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].rstrip(":") in SMAPS_FIELDS:
+                    values[parts[0].rstrip(":")] = int(parts[1])
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        return {}
+    return values
+
+
+def memory_report(master_pid: int, worker_pids) -> str:
+    lines = [f"{'role':<8}{'pid':>8}{'rss MiB':>10}{'pss MiB':>10}{'shared MiB':>12}{'unique MiB':>12}"]
+    total_unique = 0
+    total_rss = 0
+    for role, pid in [("master", master_pid)] + [("worker", pid) for pid in worker_pids]:
+        stats = read_smaps_rollup(pid)
+        if not stats:
+            lines.append(f"{role:<8}{pid:>8}  (unavailable)")
+            continue
+        shared = stats.get("Shared_Clean", 0) + stats.get("Shared_Dirty", 0)
+        unique = stats.get("Private_Clean", 0) + stats.get("Private_Dirty", 0)
+        total_unique += unique
+        total_rss += stats.get("Rss", 0)
+        lines.append(
+            f"{role:<8}{pid:>8}{stats.get('Rss', 0) / 1024:>10.1f}{stats.get('Pss', 0) / 1024:>10.1f}"
+            f"{shared / 1024:>12.1f}{unique / 1024:>12.1f}"
+        )
+    lines.append(f"sum of RSS: {total_rss / 1024:.1f} MiB | sum of unique: {total_unique / 1024:.1f} MiB")
+    return "\n".join(lines)
+
+
+class PreforkMaster:
+    def __init__(self, app, host: str, port: int, workers: int, threads_per_worker: int):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.num_workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.workers = {}  # pid -> slot
+        self.started_at = {}  # slot -> time.monotonic() of its last fork
+        self.quick_failures = {}  # slot -> consecutive exits before WORKER_MIN_UPTIME
+        self.pending_respawns = {}  # slot -> time.monotonic() when it may be forked again
+        self.sock = None
+        self.running = True
+        self.restart_requested = False
+        self.report_requested = False
+        self.exit_code = 0
+
+    def bind(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.host, self.port))
+        self.sock.listen(2048)
+        self.sock.set_inheritable(True)
+
+    def spawn(self, slot: int) -> int:
+        pid = os.fork()
+        if pid == 0:
+            # Never let an exception unwind into the master's loop inside the child
+            try:
+                self._run_worker()
+            except BaseException:
+                traceback.print_exc()
+                os._exit(1)
+            else:
+                os._exit(0)
+        self.workers[pid] = slot
+        self.started_at[slot] = time.monotonic()
+        return pid
+
+    def _run_worker(self):
+        import uvicorn
+        import torch
+        from app.databases.database import engine
+
+        for sig in (signal.SIGHUP, signal.SIGUSR1):
+            signal.signal(sig, signal.SIG_DFL)
+        # Pooled DB connections opened by the master must not be shared with the children
+        engine.dispose(close=False)
+        torch.set_num_threads(self.threads_per_worker)
+
+        config = uvicorn.Config(self.app, log_level="info", access_log=False, timeout_graceful_shutdown=WORKER_SHUTDOWN_TIMEOUT)
+        server = uvicorn.Server(config)
+        server.run(sockets=[self.sock])
+
+    def stop_worker(self, pid: int):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        deadline = time.monotonic() + WORKER_SHUTDOWN_TIMEOUT
+        try:
+            while time.monotonic() < deadline:
+                finished, _ = os.waitpid(pid, os.WNOHANG)
+                if finished:
+                    break
+                time.sleep(0.1)
+            else:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+        except (ChildProcessError, ProcessLookupError):
+            # Already reaped (e.g. by reap()) or gone
+            pass
+        self.workers.pop(pid, None)
+
+    def rolling_restart(self):
+        print("🔄 Rolling restart of workers")
+        for old_pid, slot in list(self.workers.items()):
+            new_pid = self.spawn(slot)
+            time.sleep(WORKER_BOOT_SECONDS)
+            self.stop_worker(old_pid)
+            print(f"Worker {slot}: {old_pid} -> {new_pid}")
+
+    def reap(self):
+        # Replace any worker that died on its own
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            slot = self.workers.pop(pid, None)
+            if slot is not None and self.running:
+                self.schedule_respawn(slot, pid, status)
+
+    def schedule_respawn(self, slot: int, pid: int, status: int):
+        now = time.monotonic()
+        if now - self.started_at.get(slot, now) >= WORKER_MIN_UPTIME:
+            self.quick_failures[slot] = 0
+            print(f"⚠️ Worker {pid} exited with status {status}, respawning")
+            self.spawn(slot)
+            return
+        failures = self.quick_failures.get(slot, 0) + 1
+        self.quick_failures[slot] = failures
+        if failures >= MAX_QUICK_FAILURES:
+            print(f"❌ Worker slot {slot} crashed {failures} times within {WORKER_MIN_UPTIME:g}s of starting; "
+                  f"shutting down (see the worker tracebacks above)")
+            self.running = False
+            self.exit_code = 1
+            return
+        delay = min(RESPAWN_BACKOFF_MAX_SECONDS, RESPAWN_BACKOFF_SECONDS * 2 ** (failures - 1))
+        print(f"⚠️ Worker {pid} exited with status {status} shortly after starting "
+              f"({failures}/{MAX_QUICK_FAILURES}), respawning in {delay:g}s")
+        self.pending_respawns[slot] = now + delay
+
+    def respawn_due(self):
+        now = time.monotonic()
+        for slot, due in list(self.pending_respawns.items()):
+            if due <= now:
+                del self.pending_respawns[slot]
+                self.spawn(slot)
+
+    def install_signals(self):
+        def on_term(signum, frame):
+            self.running = False
+
+        def on_hup(signum, frame):
+            self.restart_requested = True
+
+        def on_usr1(signum, frame):
+            self.report_requested = True
+
+        signal.signal(signal.SIGTERM, on_term)
+        signal.signal(signal.SIGINT, on_term)
+        signal.signal(signal.SIGHUP, on_hup)
+        signal.signal(signal.SIGUSR1, on_usr1)
+
+    def run(self):
+        self.bind()
+        # Move everything allocated so far out of the collector's reach so GC passes in
+        # the workers don't touch (and un-share) those pages
+        gc.collect()
+        gc.freeze()
+        for slot in range(self.num_workers):
+            self.spawn(slot)
+        self.install_signals()
+        print(f"Master {os.getpid()} serving http://{self.host}:{self.port} with {self.num_workers} workers")
+
+        while self.running:
+            time.sleep(0.5)
+            if self.restart_requested:
+                self.restart_requested = False
+                self.rolling_restart()
+            if self.report_requested:
+                self.report_requested = False
+                print(memory_report(os.getpid(), list(self.workers)))
+            self.reap()
+            if self.running:
+                self.respawn_due()
+
+        print("Shutting down workers")
+        for pid in list(self.workers):
+            self.stop_worker(pid)
+        self.sock.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-fork production launcher for the MoleCancerDetector API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads-per-worker", type=int, default=1,
+                        help="torch intra-op threads per worker; workers x threads should not exceed the core count")
+    parser.add_argument("--memory-report-after", type=float, default=None,
+                        help="print the memory report this many seconds after start")
+    args = parser.parse_args(argv)
+
+    # Load everything heavy once, before forking
+    from ai_model.model_path import load_model, freeze_model
+    load_model()
+    freeze_model()
+    from app.main import app
+
+    master = PreforkMaster(app, args.host, args.port, args.workers, args.threads_per_worker)
+    if args.memory_report_after is not None:
+        def delayed_report(signum, frame):
+            master.report_requested = True
+        signal.signal(signal.SIGALRM, delayed_report)
+        signal.alarm(max(1, int(args.memory_report_after)))
+    master.run()
+    return master.exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
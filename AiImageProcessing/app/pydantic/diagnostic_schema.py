@@ -1,5 +1,5 @@
 from pydantic import BaseModel, conint, EmailStr, Field
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 class DiagnosticCreateFE(BaseModel):
     image_url: Optional[str] = Field(None, description="Optional image URL")
@@ -9,6 +9,10 @@ class DiagnosticCreateFE(BaseModel):
     class Config:
         from_attributes = True
 
+class DiagnosticBatchFE(BaseModel):
+    user_id: int
+    images: List[str] = Field(..., description="Base64 image data (plain or data URLs)")
+
 class DiagnosticSaveFE(BaseModel):
     image_url: str
     user_id: int
@@ -21,6 +25,7 @@ class DiagnosticCreateAI(BaseModel):
     image_url: str
     user_id: int
     result: str  # This will store the JSON string of class distribution
+    phash: Optional[str] = None
 
     class Config:
         from_attributes = True
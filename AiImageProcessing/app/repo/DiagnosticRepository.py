@@ -1,4 +1,5 @@
 from sqlite3 import IntegrityError
+from datetime import datetime
 from typing import List
 from sqlalchemy.orm import Session
 from sympy.codegen.cnodes import void
@@ -11,7 +12,8 @@ def create_diagnostic(db: Session, diagnostic: Diagnostic):
     db_diagnostic = Diagnostic(
         image_url=diagnostic.image_url,
         result=diagnostic.result,
-        user_id=diagnostic.user_id
+        user_id=diagnostic.user_id,
+        phash=getattr(diagnostic, "phash", None)
     )
     db.add(db_diagnostic)
     db.commit()
@@ -24,6 +26,17 @@ def get_diagnostics(db: Session, diagnostic_id: int):
 def get_user_diagnostics(db: Session, user_id: int):
     return db.query(Diagnostic).filter(Diagnostic.user_id == user_id).all()
 
+def get_recent_user_hashes(db: Session, user_id: int, since: datetime, limit: int):
+    """(id, phash, created_at) of a user's hashed diagnostics since `since`, oldest first."""
+    rows = (
+        db.query(Diagnostic.id, Diagnostic.phash, Diagnostic.created_at)
+        .filter(Diagnostic.user_id == user_id, Diagnostic.phash.isnot(None), Diagnostic.created_at >= since)
+        .order_by(Diagnostic.created_at.desc())
+        .limit(limit)
+        .all()
+    )
+    return list(reversed(rows))
+
 def delete_diagnostic(db: Session, diagnostic_id: int):
     diagnostic = db.query(Diagnostic).filter(Diagnostic.id == diagnostic_id).first()
     if diagnostic:
@@ -7,7 +7,7 @@ import json
 from ..databases.database import get_db
 from ..schemas.user_models import UserCreate, Token, LoginRequest
 from ..model.user_model import User
-from ..utils.security import verify_password, create_access_token, get_password_hash
+from ..utils.security import verify_password, create_access_token, get_password_hash, build_token_claims
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
@@ -40,7 +40,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         
         # Create access token
         access_token = create_access_token(
-            data={"sub": db_user.email}
+            data=build_token_claims(db_user)
         )
         
         return {
@@ -89,7 +89,7 @@ async def login(
     
     # Create access token
     access_token = create_access_token(
-        data={"sub": user.email}
+        data=build_token_claims(user)
     )
     
     return {
@@ -0,0 +1,157 @@
+"""
+Batch diagnosis: many images per request, results streamed as NDJSON.
+
+All images are decoded and preprocessed in parallel on a small thread pool
+while earlier batches are already in the model. Every INFERENCE_BATCH_SIZE
+images go through the InferenceScheduler as one job (one stacked forward pass,
+WFQ cost = images in the batch). Each finished batch is flushed to the
+database and streamed to the client right away; the request is committed as
+one transaction at the end, so diagnostic ids in the item lines only become
+final with the closing {"done": true, "committed": true} line. Image files are
+written to UPLOAD_DIR only after that commit, so a failed batch leaves none. Near-duplicates
+of a recent upload of the same user reuse its result instead of being
+inferred (see NEAR_DUPLICATE_MODE).
+"""
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import AsyncIterator, List
+
+from starlette.concurrency import run_in_threadpool
+
+from ai_model.model_path import decode_image, predict_batch, preprocess
+from ai_model.perceptual_hash import phash, to_hex
+from ai_model.quality_gate import ImageQualityRejected
+from app.config import DECODE_WORKERS, INFERENCE_BATCH_SIZE, UPLOAD_DIR, NEAR_DUPLICATE_MODE
+from app.databases.database import SessionLocal
+from app.model import Diagnostic
+from app.services.DiagnosticService import (
+    attach_quality, find_near_duplicate, link_duplicate, remember_hash, reuse_result, run_quality_gate
+)
+from app.services.InferenceScheduler import inference_scheduler, QuotaExceededError
+from app.utils.memory import memory_stage, record_decoded_image
+from app.utils.metrics import metrics
+from app.utils.profiling import profiler
+from app.utils.streaming_upload import content_path, detect_image_type, store_image_bytes, SIGNATURE_BYTES
+
+_decode_pool = ThreadPoolExecutor(max_workers=max(1, DECODE_WORKERS), thread_name_prefix="batch-decode")
+
+
+def _ndjson(payload: dict) -> bytes:
+    return (json.dumps(payload) + "\n").encode("utf-8")
+
+
+def prepare_image(data: bytes):
+    """
+    Decode, quality-check, hash and preprocess one image (runs on the decode pool).
+    Returns (path it will be stored at, model input, quality report, perceptual hash).
+    """
+    extension = detect_image_type(data[:SIGNATURE_BYTES])
+    if extension is None:
+        raise ValueError("Only JPEG, PNG and WebP images are accepted")
+    image = decode_image(BytesIO(data))
+    try:
+        record_decoded_image(image)
+        quality = run_quality_gate(image)
+        path = content_path(data, UPLOAD_DIR, extension)
+        return path, preprocess(image), quality, phash(image)
+    finally:
+        image.close()
+
+
+def forward_batch(tensors):
+    with memory_stage("inference"), profiler.forward_context():
+        return predict_batch(tensors)
+
+
+class BatchDiagnosticService:
+    def __init__(self, user_id: int, images: List[bytes], batch_size: int = INFERENCE_BATCH_SIZE):
+        self.user_id = user_id
+        self.images = images
+        self.batch_size = max(1, batch_size)
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """NDJSON lines: one per image ({"index", "diagnostic_id", "result"} or {"index", "error"}), then a summary."""
+        loop = asyncio.get_running_loop()
+        prepared = [loop.run_in_executor(_decode_pool, prepare_image, data) for data in self.images]
+        metrics.observe("diagnostic.batch.images", len(self.images))
+        db = SessionLocal()
+        stored = []
+        succeeded = failed = 0
+        try:
+            for start in range(0, len(prepared), self.batch_size):
+                outcomes = await asyncio.gather(*prepared[start:start + self.batch_size], return_exceptions=True)
+                ready = []
+                for index, outcome in enumerate(outcomes, start):
+                    if isinstance(outcome, ImageQualityRejected):
+                        failed += 1
+                        yield _ndjson({"index": index, "error": str(outcome), "quality": outcome.report.as_dict()})
+                    elif isinstance(outcome, Exception):
+                        failed += 1
+                        yield _ndjson({"index": index, "error": f"Could not read image: {outcome}"})
+                    else:
+                        ready.append((index, outcome))
+                if not ready:
+                    continue
+
+                results = await self._diagnose(db, ready)
+                diagnostics = [
+                    Diagnostic(image_url=path, result=json.dumps(results[index]), user_id=self.user_id,
+                               phash=to_hex(image_hash))
+                    for index, (path, _, _, image_hash) in ready
+                ]
+                db.add_all(diagnostics)
+                await run_in_threadpool(db.flush)
+                stored.extend((index, diagnostic) for (index, _), diagnostic in zip(ready, diagnostics))
+                for (index, _), diagnostic in zip(ready, diagnostics):
+                    succeeded += 1
+                    yield _ndjson({"index": index, "diagnostic_id": diagnostic.id, "result": results[index]})
+
+            await run_in_threadpool(db.commit)
+            await run_in_threadpool(self._store_images, stored)
+            for _, diagnostic in stored:
+                remember_hash(diagnostic)
+            yield _ndjson({"done": True, "committed": True, "succeeded": succeeded, "failed": failed})
+        except QuotaExceededError as e:
+            await run_in_threadpool(db.rollback)
+            yield _ndjson({"done": True, "committed": False, "error": str(e), "retry_after": e.retry_after})
+        except Exception as e:
+            print(f"Error in batch diagnosis: {e}")
+            await run_in_threadpool(db.rollback)
+            yield _ndjson({"done": True, "committed": False, "error": str(e)})
+        finally:
+            for future in prepared:
+                future.cancel()
+            db.close()
+
+    def _store_images(self, stored):
+        for index, diagnostic in stored:
+            try:
+                store_image_bytes(self.images[index], diagnostic.image_url)
+            except OSError as e:
+                # The diagnostic is already committed; its result stays valid without the file
+                print(f"Could not store image {index} of batch diagnosis: {e}")
+
+    async def _diagnose(self, db, ready) -> dict:
+        """Class distribution per image index: reused from a near-duplicate, or from one batched forward."""
+        duplicates = await run_in_threadpool(
+            lambda: [find_near_duplicate(db, self.user_id, image_hash) for _, (_, _, _, image_hash) in ready]
+        )
+        results, to_infer = {}, []
+        for (index, (_, tensor, quality, _)), duplicate in zip(ready, duplicates):
+            reused = reuse_result(*duplicate) if duplicate and NEAR_DUPLICATE_MODE == "reuse" else None
+            if reused is not None:
+                metrics.inc("diagnostic.near_duplicate", action="reused")
+                results[index] = attach_quality(reused, quality)
+            else:
+                to_infer.append((index, tensor, quality, duplicate))
+        if to_infer:
+            # The request was charged once up front (see reserve()), so batches take no rate-limit tokens
+            distributions = await inference_scheduler.submit(
+                self.user_id, forward_batch, [tensor for _, tensor, _, _ in to_infer],
+                cost=len(to_infer), tokens=0
+            )
+            for (index, _, quality, duplicate), distribution in zip(to_infer, distributions):
+                results[index] = link_duplicate(attach_quality(distribution, quality), duplicate)
+        return results
@@ -1,10 +1,93 @@
-from typing import Type, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Type, Optional, Tuple
 import json
 from sqlalchemy.orm import Session
 
-from ai_model.model_path import predict_image
+from ai_model.model_path import load_image, predict_pil
+from ai_model.perceptual_hash import phash, to_hex, from_hex
+from ai_model.quality_gate import check as check_quality, ImageQualityRejected
+from app.config import QUALITY_GATE_MODE, NEAR_DUPLICATE_MODE, NEAR_DUPLICATE_MAX_DISTANCE, NEAR_DUPLICATE_WINDOW_SECONDS
 from app.model import Diagnostic
 from app.pydantic.diagnostic_schema import DiagnosticCreateAI, DiagnosticCreateFE
+from app.repo.DiagnosticRepository import get_diagnostics, get_recent_user_hashes
+from app.utils.memory import memory_stage, record_decoded_image
+from app.utils.metrics import metrics
+from app.utils.phash_index import phash_index
+from app.utils.profiling import profiler
+
+
+def run_quality_gate(image):
+    """Quality report for a decoded image (None when the gate is off); raises ImageQualityRejected."""
+    with memory_stage("quality"):
+        try:
+            report = check_quality(image, QUALITY_GATE_MODE)
+        except ImageQualityRejected as e:
+            metrics.observe("quality.check_ms", e.report.elapsed_ms)
+            for code in e.report.codes:
+                metrics.inc("quality.rejected", reason=code)
+            raise
+    if report is not None:
+        metrics.observe("quality.check_ms", report.elapsed_ms)
+        for code in report.codes:
+            metrics.inc("quality.flagged", reason=code)
+    return report
+
+
+def attach_quality(class_distribution: dict, report) -> dict:
+    if report is not None and report.reasons:
+        class_distribution["quality"] = report.as_dict()
+    return class_distribution
+
+
+def find_near_duplicate(db: Session, user_id: int, image_hash: int) -> Optional[Tuple[Diagnostic, int]]:
+    """The user's closest recent diagnostic within NEAR_DUPLICATE_MAX_DISTANCE bits, with the distance."""
+    if NEAR_DUPLICATE_MODE == "off":
+        return None
+    if not phash_index.is_fresh(user_id):
+        # First lookup for this user in this process, or the entry is stale: (re)seed it from the database
+        since = datetime.utcnow() - timedelta(seconds=NEAR_DUPLICATE_WINDOW_SECONDS)
+        rows = get_recent_user_hashes(db, user_id, since, phash_index.max_per_user)
+        phash_index.load(user_id, [
+            (diagnostic_id, from_hex(value), created_at.replace(tzinfo=timezone.utc).timestamp())
+            for diagnostic_id, value, created_at in rows
+        ])
+    match = phash_index.nearest(user_id, image_hash, NEAR_DUPLICATE_MAX_DISTANCE)
+    if match is None:
+        return None
+    diagnostic_id, distance = match
+    earlier = get_diagnostics(db, diagnostic_id)
+    if earlier is None or earlier.user_id != user_id:
+        # Deleted since it was indexed
+        phash_index.discard(user_id, diagnostic_id)
+        return None
+    return earlier, distance
+
+
+def reuse_result(earlier: Diagnostic, distance: int) -> Optional[dict]:
+    """The earlier class distribution, marked as reused, or None when it has no usable result."""
+    try:
+        result = json.loads(earlier.result or "")
+    except ValueError:
+        return None
+    if not isinstance(result, dict) or "predicted_class" not in result or "error" in result:
+        return None
+    result["near_duplicate_of"] = {"diagnostic_id": earlier.id, "distance": distance, "reused": True}
+    return result
+
+
+def link_duplicate(class_distribution: dict, duplicate) -> dict:
+    """Reference the near-duplicate a fresh diagnosis was made for (NEAR_DUPLICATE_MODE=link)."""
+    if duplicate:
+        earlier, distance = duplicate
+        class_distribution["near_duplicate_of"] = {"diagnostic_id": earlier.id, "distance": distance, "reused": False}
+        metrics.inc("diagnostic.near_duplicate", action="linked")
+    return class_distribution
+
+
+def remember_hash(diagnostic: Diagnostic):
+    """Index a stored diagnostic's hash for later near-duplicate lookups."""
+    if diagnostic.phash and NEAR_DUPLICATE_MODE != "off":
+        phash_index.add(diagnostic.user_id, from_hex(diagnostic.phash), diagnostic.id)
 
 
 class DiagnosticService:
@@ -13,13 +96,41 @@ class DiagnosticService:
 
     def post_diagnostic_with_mole_result(self, diagnostic_fe: DiagnosticCreateFE):
         try:
-            # Get the class distribution from the model
-            if diagnostic_fe.image_url.startswith('data:image'):
-                # If the image_url is already a base64 data URL, use it directly
-                class_distribution = predict_image(diagnostic_fe.image_url)
-            else:
-                # If it's a file path, use it directly
-                class_distribution = predict_image(diagnostic_fe.image_url)
+            # Decode a base64 data URL or file path; large JPEGs are decoded at reduced scale
+            with memory_stage("decode"):
+                image = load_image(diagnostic_fe.image_url)
+                record_decoded_image(image)
+
+            # Blurry, badly exposed, tiny or non-skin photos are rejected before inference
+            try:
+                quality = run_quality_gate(image)
+            except ImageQualityRejected:
+                image.close()
+                raise
+
+            # Burst shots and re-crops of a recent upload reuse (or link to) its diagnosis
+            image_hash = phash(image)
+            duplicate = find_near_duplicate(self.db, diagnostic_fe.user_id, image_hash)
+            reused = reuse_result(*duplicate) if duplicate and NEAR_DUPLICATE_MODE == "reuse" else None
+            if reused is not None:
+                image.close()
+                attach_quality(reused, quality)
+                metrics.inc("diagnostic.near_duplicate", action="reused")
+                return DiagnosticCreateAI(
+                    image_url=diagnostic_fe.image_url,
+                    user_id=diagnostic_fe.user_id,
+                    result=json.dumps(reused),
+                    phash=to_hex(image_hash)
+                )
+
+            # Get the class distribution from the model (operator-profiled while a profiling session runs)
+            with memory_stage("inference"), profiler.forward_context():
+                class_distribution = predict_pil(image)
+            # Release the bitmap now rather than when the request finishes
+            image.close()
+            del image
+            attach_quality(class_distribution, quality)
+            link_duplicate(class_distribution, duplicate)
             
             # Convert the distribution to a JSON string
             result_json = json.dumps(class_distribution)
@@ -28,9 +139,12 @@ class DiagnosticService:
             db_diagnostic = DiagnosticCreateAI(
                 image_url=diagnostic_fe.image_url,  # Use the original image_url
                 user_id=diagnostic_fe.user_id,
-                result=result_json
+                result=result_json,
+                phash=to_hex(image_hash)
             )
             return db_diagnostic
+        except ImageQualityRejected:
+            raise
         except Exception as e:
             # Log the error for debugging
             print(f"Error in post_diagnostic_with_mole_result: {str(e)}")
@@ -0,0 +1,249 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+from app.utils.metrics import Histogram, metrics
+
+# ===== CONFIG =====
+# Inference jobs running at the same time (each one already uses torch's intra-op threads)
+INFERENCE_CONCURRENCY = int(os.getenv("INFERENCE_CONCURRENCY", "1"))
+# Token bucket per user: sustained requests per second and burst size
+USER_RATE_PER_SECOND = float(os.getenv("INFERENCE_USER_RATE", "0.5"))
+USER_BURST = float(os.getenv("INFERENCE_USER_BURST", "10"))
+# Requests a single user may have waiting before new ones are rejected
+USER_MAX_QUEUED = int(os.getenv("INFERENCE_USER_MAX_QUEUED", "20"))
+# How often idle users (nothing queued, bucket refilled) are dropped from the scheduler's state
+IDLE_SWEEP_SECONDS = float(os.getenv("INFERENCE_IDLE_SWEEP_SECONDS", "60"))
+# Recent queue waits kept per user for the p50/p99 in stats(); dropped with the idle user's state
+USER_WAIT_SAMPLES = int(os.getenv("INFERENCE_USER_WAIT_SAMPLES", "256"))
+
+
+class QuotaExceededError(Exception):
+    def __init__(self, user_id: int, retry_after: float, reason: str):
+        super().__init__(f"Inference quota exceeded for user {user_id}: {reason}")
+        self.user_id = user_id
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def try_take(self, cost: float = 1.0) -> float:
+        """Take `cost` tokens. Returns 0 on success, otherwise the seconds until enough tokens exist."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (cost - self.tokens) / self.rate
+
+    def is_full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated_at) * self.rate >= self.burst
+
+
+class _Job:
+    __slots__ = ("user_id", "fn", "args", "kwargs", "future", "enqueued_at", "finish_tag")
+
+    def __init__(self, user_id, fn, args, kwargs, finish_tag):
+        self.user_id = user_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+        self.finish_tag = finish_tag
+
+
+class _UserState:
+    def __init__(self, weight: float, bucket: TokenBucket):
+        self.weight = weight
+        self.bucket = bucket
+        self.queue = deque()
+        self.last_finish_tag = 0.0
+        self.wait = Histogram(USER_WAIT_SAMPLES)
+
+
+class InferenceScheduler:
+    """
+    Weighted fair queuing in front of model inference.
+
+    Every user gets their own queue. Jobs are tagged with a virtual finish time
+    (start + cost / weight) and the worker threads always run the job with the
+    smallest tag, so a user with a burst of uploads only gets their fair share
+    of the inference slots instead of everything in arrival order. A token bucket
+    per user caps the sustained rate before anything is queued.
+    """
+
+    def __init__(self, concurrency: int = INFERENCE_CONCURRENCY, rate: float = USER_RATE_PER_SECOND,
+                 burst: float = USER_BURST, max_queued: int = USER_MAX_QUEUED,
+                 user_weights: Optional[Dict[int, float]] = None):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.max_queued = max_queued
+        self.user_weights = dict(user_weights or {})
+        self._users: Dict[int, _UserState] = {}
+        self._heap = []  # (finish_tag, seq, user_id) for each user's head job
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = False
+        self._last_sweep = time.monotonic()
+
+    # ----- lifecycle -----
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._worker, name=f"inference-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def set_user_weight(self, user_id: int, weight: float):
+        with self._cond:
+            self.user_weights[user_id] = weight
+            if user_id in self._users:
+                self._users[user_id].weight = weight
+
+    # ----- submission -----
+    def _evict_idle_locked(self):
+        """
+        Forget users with nothing queued, a full bucket and no pending virtual
+        finish time; recreating them later is indistinguishable from keeping them.
+        """
+        now = time.monotonic()
+        if now - self._last_sweep < IDLE_SWEEP_SECONDS:
+            return
+        self._last_sweep = now
+        idle = [
+            user_id for user_id, state in self._users.items()
+            if not state.queue and state.last_finish_tag <= self._virtual_time and state.bucket.is_full(now)
+        ]
+        for user_id in idle:
+            del self._users[user_id]
+        metrics.set_gauge("inference.users", len(self._users))
+
+    def _user_state_locked(self, user_id: int) -> _UserState:
+        self._evict_idle_locked()
+        state = self._users.get(user_id)
+        if state is None:
+            state = self._users[user_id] = _UserState(
+                self.user_weights.get(user_id, 1.0), TokenBucket(self.rate, self.burst)
+            )
+        return state
+
+    def _take_tokens_locked(self, user_id: int, state: _UserState, tokens: float):
+        retry_after = state.bucket.try_take(tokens)
+        if retry_after > 0:
+            metrics.inc("inference.rejected", reason="rate_limited")
+            raise QuotaExceededError(user_id, retry_after, "rate limit")
+
+    def reserve(self, user_id: int, tokens: float = 1.0):
+        """Charge the rate limit up front, e.g. once for a whole batch request whose jobs then pass tokens=0."""
+        with self._cond:
+            self._take_tokens_locked(user_id, self._user_state_locked(user_id), tokens)
+
+    def submit_future(self, user_id: int, fn: Callable, *args, cost: float = 1.0, tokens: float = 1.0, **kwargs) -> Future:
+        """`cost` is the job's share of inference time (e.g. images in a batch); `tokens` what it takes from the rate limit."""
+        if not self._running:
+            self.start()
+        with self._cond:
+            state = self._user_state_locked(user_id)
+            if len(state.queue) >= self.max_queued:
+                metrics.inc("inference.rejected", reason="queue_full")
+                raise QuotaExceededError(user_id, 1.0, "too many queued requests")
+            self._take_tokens_locked(user_id, state, tokens)
+
+            start_tag = max(self._virtual_time, state.last_finish_tag)
+            job = _Job(user_id, fn, args, kwargs, start_tag + cost / state.weight)
+            state.last_finish_tag = job.finish_tag
+            state.queue.append(job)
+            if len(state.queue) == 1:
+                heapq.heappush(self._heap, (job.finish_tag, next(self._seq), user_id))
+            metrics.set_gauge("inference.queued", self._queued_locked())
+            self._cond.notify()
+        return job.future
+
+    async def submit(self, user_id: int, fn: Callable, *args, **kwargs):
+        """Queue `fn(*args, **kwargs)` for `user_id` and await its result."""
+        return await asyncio.wrap_future(self.submit_future(user_id, fn, *args, **kwargs))
+
+    def run(self, user_id: int, fn: Callable, *args, **kwargs):
+        """Blocking variant of submit() for sync routes running in the threadpool."""
+        return self.submit_future(user_id, fn, *args, **kwargs).result()
+
+    # ----- workers -----
+    def _next_job(self) -> Optional[_Job]:
+        with self._cond:
+            while self._running and not self._heap:
+                self._cond.wait()
+            if not self._running:
+                return None
+            finish_tag, _, user_id = heapq.heappop(self._heap)
+            state = self._users[user_id]
+            job = state.queue.popleft()
+            state.wait.observe(time.monotonic() - job.enqueued_at)
+            self._virtual_time = max(self._virtual_time, finish_tag)
+            if state.queue:
+                heapq.heappush(self._heap, (state.queue[0].finish_tag, next(self._seq), user_id))
+            metrics.set_gauge("inference.queued", self._queued_locked())
+            return job
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            wait = time.monotonic() - job.enqueued_at
+            metrics.observe("inference.wait.seconds", wait)
+            started = time.monotonic()
+            try:
+                result = job.fn(*job.args, **job.kwargs)
+            except BaseException as e:
+                job.future.set_exception(e)
+            else:
+                job.future.set_result(result)
+            metrics.observe("inference.run.seconds", time.monotonic() - started)
+
+    def _queued_locked(self) -> int:
+        return sum(len(state.queue) for state in self._users.values())
+
+    def stats(self) -> dict:
+        with self._cond:
+            users = {
+                user_id: {"queued": len(state.queue), "weight": state.weight, "tokens": round(state.bucket.tokens, 2),
+                          "wait": state.wait.summary() if state.wait.count else None}
+                for user_id, state in self._users.items()
+            }
+        overall = metrics.histogram("inference.wait.seconds")
+        return {"concurrency": self.concurrency, "wait": overall.summary() if overall else None, "users": users}
+
+
+inference_scheduler = InferenceScheduler()
@@ -0,0 +1,210 @@
+"""
+Live classification of camera frames over a WebSocket.
+
+The client streams small compressed frames (binary JPEG/WebP/PNG messages, or
+base64 text) while it frames the mole; nothing is stored. Per connection:
+
+  * a receiver task puts every frame into a one-frame slot, replacing a frame
+    that has not been picked up yet (counted as dropped), so the server always
+    works on the newest frame and never builds a backlog;
+  * a processor task classifies at most one frame at a time and at most one
+    every LIVE_MIN_FRAME_INTERVAL seconds, through the InferenceScheduler, so a
+    connection's CPU use is bounded and it shares inference fairly with uploads;
+  * class probabilities are smoothed with an exponential moving average and
+    sent back with the quality gate's reason codes as framing hints.
+
+Messages sent: {"frame", "predicted_class", "probabilities", "raw_probabilities",
+"quality", "latency_ms", "frames_in", "frames_processed", "frames_dropped"}, or
+{"error", ...} for a frame that could not be classified.
+"""
+import asyncio
+import base64
+import binascii
+import json
+import threading
+import time
+from collections import Counter
+from io import BytesIO
+
+from fastapi import WebSocket, WebSocketDisconnect, status
+
+from ai_model.model_path import decode_image, predict_pil
+from ai_model.quality_gate import assess
+from app.config import LIVE_EMA_ALPHA, LIVE_MAX_CONNECTIONS_PER_USER, LIVE_MAX_FRAME_BYTES, LIVE_MIN_FRAME_INTERVAL
+from app.services.InferenceScheduler import inference_scheduler, QuotaExceededError
+from app.utils.metrics import metrics
+from app.utils.streaming_upload import detect_image_type, SIGNATURE_BYTES
+
+_connections = Counter()
+_connections_lock = threading.Lock()
+
+
+def classify_frame(data: bytes) -> dict:
+    """Class distribution and quality reason codes for one encoded frame (runs on an inference worker)."""
+    image = decode_image(BytesIO(data))
+    try:
+        quality = assess(image)
+        distribution = predict_pil(image)
+    finally:
+        image.close()
+    distribution["quality"] = quality.codes
+    return distribution
+
+
+class LatestFrameSlot:
+    """Single-frame mailbox: put() replaces a frame nobody has taken yet."""
+
+    def __init__(self):
+        self._frame = None
+        self._ready = asyncio.Event()
+
+    def put(self, frame) -> bool:
+        """Store `frame`; returns True when it replaced (dropped) an unprocessed one."""
+        replaced = self._frame is not None
+        self._frame = frame
+        self._ready.set()
+        return replaced
+
+    async def wait(self):
+        await self._ready.wait()
+
+    def take(self):
+        frame, self._frame = self._frame, None
+        self._ready.clear()
+        return frame
+
+
+class ProbabilitySmoother:
+    """Exponential moving average of class probabilities (percentages keyed by class name)."""
+
+    def __init__(self, alpha: float = LIVE_EMA_ALPHA):
+        self.alpha = alpha
+        self.state = None
+
+    def update(self, probabilities: dict) -> dict:
+        if self.state is None:
+            self.state = dict(probabilities)
+        else:
+            self.state = {
+                name: self.alpha * value + (1 - self.alpha) * self.state.get(name, value)
+                for name, value in probabilities.items()
+            }
+        return {name: round(value, 4) for name, value in sorted(self.state.items(), key=lambda item: -item[1])}
+
+
+class LiveDiagnosticSession:
+    def __init__(self, websocket: WebSocket, user_id: int):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.slot = LatestFrameSlot()
+        self.smoother = ProbabilitySmoother()
+        self.frames_in = 0
+        self.frames_processed = 0
+        self.frames_dropped = 0
+
+    async def run(self):
+        with _connections_lock:
+            allowed = _connections[self.user_id] < LIVE_MAX_CONNECTIONS_PER_USER
+            if allowed:
+                _connections[self.user_id] += 1
+                metrics.set_gauge("live.connections", sum(_connections.values()))
+        if not allowed:
+            await self.websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Too many live connections")
+            return
+        # One rate-limit token per live session; frames are paced by LIVE_MIN_FRAME_INTERVAL instead
+        try:
+            inference_scheduler.reserve(self.user_id)
+        except QuotaExceededError as e:
+            self._release()
+            await self.websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=e.reason)
+            return
+
+        await self.websocket.accept()
+        metrics.inc("live.connections.opened")
+        processor = asyncio.create_task(self._process())
+        try:
+            await self._receive()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            processor.cancel()
+            self._release()
+            metrics.inc("live.connections.closed")
+
+    def _release(self):
+        with _connections_lock:
+            _connections[self.user_id] -= 1
+            if _connections[self.user_id] <= 0:
+                del _connections[self.user_id]
+            metrics.set_gauge("live.connections", sum(_connections.values()))
+
+    # ===== RECEIVE =====
+    async def _receive(self):
+        while True:
+            message = await self.websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", status.WS_1000_NORMAL_CLOSURE))
+            frame = message.get("bytes")
+            if frame is None and message.get("text"):
+                try:
+                    frame = base64.b64decode(message["text"].split(",", 1)[-1], validate=True)
+                except binascii.Error:
+                    await self._send_error("Text frames must be base64 image data")
+                    continue
+            if not frame:
+                continue
+
+            self.frames_in += 1
+            metrics.inc("live.frames.in")
+            if len(frame) > LIVE_MAX_FRAME_BYTES:
+                metrics.inc("live.frames.rejected", reason="too_large")
+                await self._send_error(f"Frames are limited to {LIVE_MAX_FRAME_BYTES // 1024} KB")
+                continue
+            if detect_image_type(frame[:SIGNATURE_BYTES]) is None:
+                metrics.inc("live.frames.rejected", reason="not_an_image")
+                await self._send_error("Only JPEG, PNG and WebP frames are accepted")
+                continue
+            if self.slot.put((self.frames_in, frame)):
+                self.frames_dropped += 1
+                metrics.inc("live.frames.dropped")
+
+    # ===== PROCESS =====
+    async def _process(self):
+        last_started = 0.0
+        while True:
+            await self.slot.wait()
+            # Pace the connection; frames arriving meanwhile replace the waiting one
+            delay = last_started + LIVE_MIN_FRAME_INTERVAL - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            sequence, frame = self.slot.take()
+            last_started = time.monotonic()
+            try:
+                distribution = await inference_scheduler.submit(self.user_id, classify_frame, frame, tokens=0)
+            except QuotaExceededError as e:
+                await self._send_error(str(e), frame=sequence, retry_after=e.retry_after)
+                continue
+            except Exception as e:
+                metrics.inc("live.frames.rejected", reason="decode_error")
+                await self._send_error(f"Could not classify frame: {e}", frame=sequence)
+                continue
+
+            latency_ms = (time.monotonic() - last_started) * 1000
+            self.frames_processed += 1
+            metrics.inc("live.frames.processed")
+            metrics.observe("live.frame.latency_ms", latency_ms)
+            smoothed = self.smoother.update(distribution["probabilities"])
+            await self.websocket.send_text(json.dumps({
+                "frame": sequence,
+                "predicted_class": next(iter(smoothed)),
+                "probabilities": smoothed,
+                "raw_probabilities": distribution["probabilities"],
+                "quality": distribution["quality"],
+                "latency_ms": round(latency_ms, 1),
+                "frames_in": self.frames_in,
+                "frames_processed": self.frames_processed,
+                "frames_dropped": self.frames_dropped
+            }))
+
+    async def _send_error(self, detail: str, **extra):
+        await self.websocket.send_text(json.dumps({"error": detail, **extra}))
@@ -2,6 +2,7 @@ from typing import Optional, Type
 
 from sqlalchemy.orm import Session
 from app.model.user_model import User
+from app.utils.principal_cache import principal_cache
 
 class UserService:
     def __init__(self, db: Session):
@@ -12,6 +13,16 @@ class UserService:
         user = self.db.query(User).filter(User.id == user_id).first()
         return user
 
+    def user_exists(self, user_id: int) -> bool:
+        """Check a user exists, answering from the principal cache when possible."""
+        if principal_cache.get_by_id(user_id) is not None:
+            return True
+        user = self.find_by_id(user_id)
+        if user is None:
+            return False
+        principal_cache.put(user)
+        return True
+
     def get_all_users(self):
         from app.repo.UserRepository import get_all_users
         return get_all_users(self.db)
@@ -19,8 +30,10 @@ class UserService:
     def delete_user_by_id(self, user_id: int):
         user = self.find_by_id(user_id)
         if user:
+            email = user.email
             self.db.delete(user)
             self.db.commit()
+            principal_cache.invalidate(user_id=user_id, email=email)
             return user
         else:
-            return None
\ No newline at end of file
+            return None
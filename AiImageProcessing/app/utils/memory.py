@@ -0,0 +1,224 @@
+"""
+Memory accounting for the serving process.
+
+  * memory_snapshot() - RSS, peak RSS, Python heap (tracemalloc, when on) and
+    the torch allocator stats of the inference device;
+  * memory_stage(name) - context manager recording the RSS change of one
+    request stage (decode, quality, inference, ...) into the metrics registry
+    as memory.stage.rss_delta_mb; with tracemalloc on it also keeps the top
+    allocation sites of the stage's most recent run;
+  * record_decoded_image(image) - decoded image size counters and peaks;
+  * a soak test that replays requests and flags monotonic RSS growth:
+
+    python -m app.utils.memory soak --images uploads --iterations 2000
+    python -m app.utils.memory soak --images uploads --url http://localhost:8001 --token <admin JWT>
+"""
+import argparse
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from app.utils.metrics import metrics
+
+TRACEMALLOC_FRAMES = int(os.getenv("MEMORY_TRACEMALLOC_FRAMES", "10"))
+TOP_ALLOCATORS = 10
+
+_page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_lock = threading.Lock()
+_stage_top_allocators = {}
+_image_peaks = {"pixels": 0, "original_pixels": 0}
+
+
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _page_size
+    except (OSError, ValueError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes() -> int:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def torch_allocator_stats() -> dict:
+    try:
+        import torch
+    except ImportError:
+        return {}
+    if not torch.cuda.is_available():
+        return {"device": "cpu"}
+    return {
+        "device": "cuda",
+        "allocated_mb": torch.cuda.memory_allocated() / 2 ** 20,
+        "reserved_mb": torch.cuda.memory_reserved() / 2 ** 20,
+        "max_allocated_mb": torch.cuda.max_memory_allocated() / 2 ** 20
+    }
+
+
+def set_tracemalloc(enabled: bool):
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    elif not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+        with _lock:
+            _stage_top_allocators.clear()
+
+
+def memory_snapshot() -> dict:
+    snapshot = {
+        "rss_mb": rss_bytes() / 2 ** 20,
+        "peak_rss_mb": peak_rss_bytes() / 2 ** 20,
+        "torch": torch_allocator_stats(),
+        "tracemalloc": None,
+        "decoded_image_peaks": dict(_image_peaks)
+    }
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        with _lock:
+            top = {stage: list(entries) for stage, entries in _stage_top_allocators.items()}
+        snapshot["tracemalloc"] = {"current_mb": current / 2 ** 20, "peak_mb": peak / 2 ** 20, "top_allocators_by_stage": top}
+    return snapshot
+
+
+def record_memory_gauges():
+    metrics.set_gauge("memory.rss_mb", rss_bytes() / 2 ** 20)
+    metrics.set_gauge("memory.peak_rss_mb", peak_rss_bytes() / 2 ** 20)
+
+
+@contextmanager
+def memory_stage(name: str):
+    tracing = tracemalloc.is_tracing()
+    before_snapshot = tracemalloc.take_snapshot() if tracing else None
+    before = rss_bytes()
+    try:
+        yield
+    finally:
+        metrics.observe("memory.stage.rss_delta_mb", (rss_bytes() - before) / 2 ** 20, stage=name)
+        if before_snapshot is not None and tracemalloc.is_tracing():
+            stats = tracemalloc.take_snapshot().compare_to(before_snapshot, "lineno")[:TOP_ALLOCATORS]
+            with _lock:
+                _stage_top_allocators[name] = [
+                    {"site": str(stat.traceback), "size_diff_kb": stat.size_diff / 1024, "count_diff": stat.count_diff}
+                    for stat in stats
+                ]
+
+
+def record_decoded_image(image):
+    """Counters for the size of a decoded PIL image (and of the original before draft decoding)."""
+    width, height = image.size
+    original_width, original_height = image.info.get("original_size", image.size)
+    pixels, original_pixels = width * height, original_width * original_height
+    metrics.observe("image.decoded.megapixels", pixels / 1e6)
+    metrics.observe("image.original.megapixels", original_pixels / 1e6)
+    with _lock:
+        _image_peaks["pixels"] = max(_image_peaks["pixels"], pixels)
+        _image_peaks["original_pixels"] = max(_image_peaks["original_pixels"], original_pixels)
+    metrics.set_gauge("image.decoded.peak_pixels", _image_peaks["pixels"])
+
+
+# ===== SOAK TEST =====
+def detect_growth(samples_mb, warmup_fraction: float = 0.25, slope_threshold_mb: float = 1.0,
+                  monotonic_fraction: float = 0.7) -> dict:
+    """
+    Least-squares slope of RSS after warm-up, in MB per 100 samples, and the
+    fraction of steps that did not decrease; growth is flagged when both are high.
+    """
+    series = list(samples_mb)[int(len(samples_mb) * warmup_fraction):]
+    if len(series) < 3:
+        return {"leak_suspected": False, "slope_mb_per_100": 0.0, "non_decreasing_fraction": 0.0}
+    n = len(series)
+    mean_x, mean_y = (n - 1) / 2, sum(series) / n
+    slope = sum((i - mean_x) * (y - mean_y) for i, y in enumerate(series)) / sum((i - mean_x) ** 2 for i in range(n))
+    non_decreasing = sum(b >= a for a, b in zip(series, series[1:])) / (n - 1)
+    slope_per_100 = slope * 100
+    return {
+        "leak_suspected": slope_per_100 >= slope_threshold_mb and non_decreasing >= monotonic_fraction,
+        "slope_mb_per_100": slope_per_100,
+        "non_decreasing_fraction": non_decreasing,
+        "start_mb": series[0],
+        "end_mb": series[-1]
+    }
+
+
+def _image_paths(directory: str) -> list:
+    extensions = (".jpg", ".jpeg", ".png")
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.lower().endswith(extensions))
+
+
+def soak_in_process(paths, iterations: int, sample_every: int) -> list:
+    from ai_model.model_path import load_image, predict_pil
+
+    samples = []
+    for i in range(iterations):
+        with memory_stage("decode"):
+            image = load_image(paths[i % len(paths)])
+            record_decoded_image(image)
+        with memory_stage("inference"):
+            predict_pil(image)
+        del image
+        if i % sample_every == 0:
+            samples.append(rss_bytes() / 2 ** 20)
+    return samples
+
+
+def soak_http(paths, iterations: int, sample_every: int, url: str, token: str, user_id: int) -> list:
+    import base64
+    import requests
+
+    headers = {"Authorization": f"Bearer {token}"}
+    payloads = []
+    for path in paths:
+        with open(path, "rb") as f:
+            payloads.append(base64.b64encode(f.read()).decode("ascii"))
+    samples = []
+    for i in range(iterations):
+        payload = {"image_data": payloads[i % len(payloads)], "user_id": user_id}
+        response = requests.post(f"{url}/get_diagnosis", json=payload, timeout=60)
+        if response.status_code == 429:
+            time.sleep(float(response.headers.get("Retry-After", "1")))
+        if i % sample_every == 0:
+            snapshot = requests.get(f"{url}/admin/memory", headers=headers, timeout=10).json()
+            samples.append(snapshot["rss_mb"])
+    return samples
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serving memory tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    soak = subparsers.add_parser("soak", help="replay requests and flag monotonic RSS growth")
+    soak.add_argument("--images", required=True, help="directory of images to replay")
+    soak.add_argument("--iterations", type=int, default=1000)
+    soak.add_argument("--sample-every", type=int, default=10)
+    soak.add_argument("--url", default=None, help="replay against a running server instead of in-process")
+    soak.add_argument("--token", default=None, help="admin JWT for /admin/memory (with --url)")
+    soak.add_argument("--user-id", type=int, default=1)
+    soak.add_argument("--threshold-mb", type=float, default=1.0, help="flag growth above this many MB per 100 samples")
+    args = parser.parse_args(argv)
+
+    paths = _image_paths(args.images)
+    if not paths:
+        raise SystemExit(f"No images found in {args.images}")
+    start_time = time.perf_counter()
+    if args.url:
+        samples = soak_http(paths, args.iterations, args.sample_every, args.url.rstrip("/"), args.token, args.user_id)
+    else:
+        samples = soak_in_process(paths, args.iterations, args.sample_every)
+    result = detect_growth(samples, slope_threshold_mb=args.threshold_mb)
+
+    print(f"{args.iterations} requests in {time.perf_counter() - start_time:.1f}s, {len(samples)} RSS samples")
+    print(f"RSS {result.get('start_mb', 0):.1f} MB -> {result.get('end_mb', 0):.1f} MB after warm-up, "
+          f"slope {result['slope_mb_per_100']:.2f} MB per 100 samples, "
+          f"{result['non_decreasing_fraction'] * 100:.0f}% non-decreasing steps")
+    if result["leak_suspected"]:
+        print("⚠️ Monotonic memory growth detected")
+        raise SystemExit(1)
+    print("✅ No sustained growth")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from app.config import NEAR_DUPLICATE_RELOAD_SECONDS, NEAR_DUPLICATE_WINDOW_SECONDS
+
+# Set-bit count of every byte value, for vectorised Hamming distances
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+class _UserHashes:
+    """Ring buffer of one user's most recent (hash, diagnostic id, timestamp)."""
+
+    def __init__(self, capacity: int):
+        self.hashes = np.zeros(capacity, dtype=np.uint64)
+        self.ids = np.full(capacity, -1, dtype=np.int64)
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.next = 0
+        # time.monotonic() of the last load from the database, None if never loaded
+        self.loaded_at = None
+
+    def add(self, value: int, diagnostic_id: int, timestamp: float):
+        slot = self.next % len(self.ids)
+        self.hashes[slot] = value
+        self.ids[slot] = diagnostic_id
+        self.times[slot] = timestamp
+        self.next += 1
+
+
+class PerceptualHashIndex:
+    """
+    Per-user in-memory index of recent perceptual hashes.
+
+    Each user keeps at most `max_per_user` hashes; lookups XOR the query with all
+    of them at once and count bits through a byte table, so a lookup costs a few
+    microseconds. Entries older than `window_seconds` are ignored. Users are
+    loaded lazily and reloaded once their entry is `reload_seconds` old (see
+    is_fresh/load), since other workers index their own uploads; the least
+    recently used users are dropped beyond `max_users`.
+    """
+
+    def __init__(self, window_seconds: float, reload_seconds: float = 30.0, max_per_user: int = 256,
+                 max_users: int = 10000):
+        self.window_seconds = window_seconds
+        self.reload_seconds = reload_seconds
+        self.max_per_user = max_per_user
+        self.max_users = max_users
+        self._users: Dict[int, _UserHashes] = {}
+        self._lock = threading.Lock()
+
+    def is_fresh(self, user_id: int) -> bool:
+        with self._lock:
+            entry = self._users.get(user_id)
+            return (entry is not None and entry.loaded_at is not None
+                    and time.monotonic() - entry.loaded_at < self.reload_seconds)
+
+    def _user_locked(self, user_id: int) -> _UserHashes:
+        entry = self._users.pop(user_id, None)
+        if entry is None:
+            entry = _UserHashes(self.max_per_user)
+            while len(self._users) >= self.max_users:
+                self._users.pop(next(iter(self._users)))
+        # Re-inserting keeps the dict in least-recently-used order
+        self._users[user_id] = entry
+        return entry
+
+    def load(self, user_id: int, rows: Iterable[Tuple[int, int, float]]):
+        """Replace a user's hashes with (diagnostic id, hash, unix timestamp) rows, oldest first."""
+        entry = _UserHashes(self.max_per_user)
+        for diagnostic_id, value, timestamp in rows:
+            entry.add(value, diagnostic_id, timestamp)
+        entry.loaded_at = time.monotonic()
+        with self._lock:
+            self._users.pop(user_id, None)
+            while len(self._users) >= self.max_users:
+                self._users.pop(next(iter(self._users)))
+            self._users[user_id] = entry
+
+    def add(self, user_id: int, value: int, diagnostic_id: int, timestamp: float = None):
+        with self._lock:
+            self._user_locked(user_id).add(value, diagnostic_id, time.time() if timestamp is None else timestamp)
+
+    def discard(self, user_id: int, diagnostic_id: int):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None:
+                entry.ids[entry.ids == diagnostic_id] = -1
+
+    def nearest(self, user_id: int, value: int, max_distance: int) -> Optional[Tuple[int, int]]:
+        """(diagnostic id, Hamming distance) of the closest recent hash within max_distance, preferring the newest."""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return None
+            valid = (entry.ids >= 0) & (entry.times >= time.time() - self.window_seconds)
+            if not valid.any():
+                return None
+            hashes, ids, times = entry.hashes[valid], entry.ids[valid], entry.times[valid]
+        distances = _POPCOUNT[(hashes ^ np.uint64(value)).view(np.uint8)].reshape(-1, 8).sum(axis=1)
+        candidates = np.flatnonzero(distances <= max_distance)
+        if len(candidates) == 0:
+            return None
+        best = candidates[np.lexsort((-times[candidates], distances[candidates]))[0]]
+        return int(ids[best]), int(distances[best])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"users": len(self._users), "hashes": int(sum(min(e.next, self.max_per_user) for e in self._users.values()))}
+
+
+phash_index = PerceptualHashIndex(NEAR_DUPLICATE_WINDOW_SECONDS, NEAR_DUPLICATE_RELOAD_SECONDS)
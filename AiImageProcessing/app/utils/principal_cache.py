@@ -0,0 +1,119 @@
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app.model.user_model import User
+from app.schemas.user_models import UserInToken
+
+# How long a resolved principal stays valid without going back to the database
+PRINCIPAL_CACHE_TTL_SECONDS = 300
+PRINCIPAL_CACHE_MAX_ENTRIES = 10000
+
+
+class PrincipalCache:
+    """Thread-safe TTL cache of authenticated principals, indexed by email and id."""
+
+    def __init__(self, ttl_seconds: float = PRINCIPAL_CACHE_TTL_SECONDS, max_entries: int = PRINCIPAL_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._by_email: Dict[str, Tuple[float, UserInToken]] = {}
+        self._by_id: Dict[int, Tuple[float, UserInToken]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, index: dict, key) -> Optional[UserInToken]:
+        with self._lock:
+            entry = index.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, principal = entry
+            if expires_at < time.monotonic():
+                self._evict(principal)
+                self.misses += 1
+                return None
+            self.hits += 1
+            return principal
+
+    def get_by_email(self, email: str) -> Optional[UserInToken]:
+        return self._lookup(self._by_email, email)
+
+    def get_by_id(self, user_id: int) -> Optional[UserInToken]:
+        return self._lookup(self._by_id, user_id)
+
+    def put(self, user: User) -> UserInToken:
+        principal = UserInToken.model_validate(user)
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            if len(self._by_id) >= self.max_entries:
+                self._purge_expired()
+                if len(self._by_id) >= self.max_entries:
+                    self._by_email.clear()
+                    self._by_id.clear()
+            self._by_email[principal.email] = (expires_at, principal)
+            self._by_id[principal.id] = (expires_at, principal)
+        return principal
+
+    def invalidate(self, user_id: Optional[int] = None, email: Optional[str] = None):
+        with self._lock:
+            if user_id is not None:
+                entry = self._by_id.pop(user_id, None)
+                if entry:
+                    self._by_email.pop(entry[1].email, None)
+            if email is not None:
+                entry = self._by_email.pop(email, None)
+                if entry:
+                    self._by_id.pop(entry[1].id, None)
+
+    def clear(self):
+        with self._lock:
+            self._by_email.clear()
+            self._by_id.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._by_id), "hits": self.hits, "misses": self.misses}
+
+    def _evict(self, principal: UserInToken):
+        self._by_email.pop(principal.email, None)
+        self._by_id.pop(principal.id, None)
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        for user_id, (expires_at, principal) in list(self._by_id.items()):
+            if expires_at < now:
+                self._evict(principal)
+
+
+principal_cache = PrincipalCache()
+
+
+# Keep the cache coherent with any change to a user row, whichever code path flushes it. Rows are
+# only evicted once the transaction commits: evicting at flush would let a concurrent request
+# re-cache the old row before the commit lands, and keep it for the whole TTL.
+_CHANGED_USERS_KEY = "principal_cache.changed_users"
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _collect_changed_user(mapper, connection, target: User):
+    session = object_session(target)
+    if session is None:
+        principal_cache.invalidate(user_id=target.id, email=target.email)
+        return
+    session.info.setdefault(_CHANGED_USERS_KEY, set()).add((target.id, target.email))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session):
+    for user_id, email in session.info.pop(_CHANGED_USERS_KEY, ()):
+        principal_cache.invalidate(user_id=user_id, email=email)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_users(session):
+    session.info.pop(_CHANGED_USERS_KEY, None)
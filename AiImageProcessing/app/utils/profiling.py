@@ -0,0 +1,265 @@
+"""
+On-demand, bounded profiling sessions for the running API.
+
+An admin starts a session (see ProfilingController); it ends after N finished
+requests or T seconds, whichever comes first. While it runs:
+  * a sampler thread records Python stacks of busy threads every few
+    milliseconds via sys._current_frames(), written as collapsed stacks
+    (flamegraph.pl / speedscope input);
+  * every model forward pass inside forward_context() runs under
+    torch.profiler; operator totals are summarised and the per-request
+    traces merged into one Chrome trace (chrome://tracing, Perfetto).
+
+With no session running the only cost is a `profiler.session is None` check
+in the middleware and in forward_context().
+
+Sessions live in one process. Under app.prefork only the worker that served
+/start is profiled (run a single worker to profile all traffic); session ids
+and summaries carry that worker's pid. Results are written under PROFILE_DIR,
+so any worker can serve a finished session's summary, trace and stacks.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager, nullcontext
+from typing import Optional
+
+from app.config import PROFILE_DIR
+
+MAX_REQUESTS = 1000
+MAX_SECONDS = 300.0
+MIN_INTERVAL_SECONDS = 0.001
+KEEP_FINISHED_SESSIONS = 20
+
+# Leaf frames (file, function) of threads that are parked rather than working
+_IDLE_FUNCTIONS = {
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"), ("queue.py", "get"),
+    ("selectors.py", "select"), ("socket.py", "accept"), ("connection.py", "wait")
+}
+
+_NULL_CONTEXT = nullcontext()
+
+
+class ProfilingSession:
+    def __init__(self, max_requests: int, max_seconds: float, interval: float, capture_operators: bool, on_finish):
+        self.pid = os.getpid()
+        self.id = time.strftime("%Y%m%d-%H%M%S-") + f"{self.pid}-" + uuid.uuid4().hex[:6]
+        self.directory = os.path.join(PROFILE_DIR, self.id)
+        self.max_requests = max_requests
+        self.deadline = time.monotonic() + max_seconds
+        self.interval = interval
+        self.capture_operators = capture_operators
+        self.started_at = time.time()
+        self.requests = 0
+        self.request_seconds = Counter()
+        self.request_counts = Counter()
+        self.stacks = Counter()
+        self.samples = 0
+        self.forward_passes = 0
+        self.operators = {}
+        self.trace_events = []
+        self.finished = threading.Event()
+        self._on_finish = on_finish
+        self._lock = threading.Lock()
+        # torch.profiler allows one active profile per process; concurrent forwards are only sampled
+        self._torch_lock = threading.Lock()
+        self._sampler = threading.Thread(target=self._sample_loop, name="profiling-sampler", daemon=True)
+
+    def start(self):
+        self._sampler.start()
+
+    # ===== STACK SAMPLING =====
+    def _sample_loop(self):
+        own_ident = threading.get_ident()
+        names = {}
+        while not self.finished.is_set() and time.monotonic() < self.deadline:
+            for ident, frame in sys._current_frames().items():
+                code = frame.f_code
+                if ident == own_ident or (os.path.basename(code.co_filename), code.co_name) in _IDLE_FUNCTIONS:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+        # Results are written here rather than in finish(), which may run on the event loop
+        self.finish()
+        self._write_results()
+        self._on_finish(self)
+
+    # ===== REQUESTS =====
+    def request_finished(self, route: str, elapsed: float):
+        with self._lock:
+            if self.finished.is_set():
+                return
+            self.requests += 1
+            self.request_counts[route] += 1
+            self.request_seconds[route] += elapsed
+            done = self.requests >= self.max_requests
+        if done:
+            self.finish()
+
+    @contextmanager
+    def forward(self):
+        if not self.capture_operators or self.finished.is_set() or not self._torch_lock.acquire(blocking=False):
+            yield
+            return
+        try:
+            from torch.profiler import ProfilerActivity, profile
+
+            with profile(activities=[ProfilerActivity.CPU], record_shapes=True) as prof:
+                yield
+            self._collect(prof)
+        finally:
+            self._torch_lock.release()
+
+    def _collect(self, prof):
+        trace_path = os.path.join(self.directory, f"forward_{self.forward_passes}.json")
+        os.makedirs(self.directory, exist_ok=True)
+        prof.export_chrome_trace(trace_path)
+        with open(trace_path) as f:
+            events = json.load(f).get("traceEvents", [])
+        os.remove(trace_path)
+        with self._lock:
+            self.forward_passes += 1
+            self.trace_events.extend(events)
+            for event in prof.key_averages():
+                entry = self.operators.setdefault(event.key, {"count": 0, "self_cpu_us": 0.0, "cpu_total_us": 0.0})
+                entry["count"] += event.count
+                entry["self_cpu_us"] += event.self_cpu_time_total
+                entry["cpu_total_us"] += event.cpu_time_total
+
+    # ===== RESULTS =====
+    def finish(self):
+        """Stop collecting; the sampler thread then writes the results."""
+        with self._lock:
+            self.finished.set()
+
+    def wait(self, timeout: float = None) -> bool:
+        self._sampler.join(timeout)
+        return not self._sampler.is_alive()
+
+    def _write_results(self):
+        # Wait for an in-flight profiled forward pass so its events are included
+        with self._torch_lock:
+            pass
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.trace_path, "w") as f:
+            json.dump({"traceEvents": self.trace_events}, f)
+        with open(self.stacks_path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(os.path.join(self.directory, "summary.json"), "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    @property
+    def trace_path(self) -> str:
+        return os.path.join(self.directory, "trace.json")
+
+    @property
+    def stacks_path(self) -> str:
+        return os.path.join(self.directory, "stacks.collapsed")
+
+    def summary(self, top: int = 25) -> dict:
+        operators = sorted(self.operators.items(), key=lambda item: item[1]["self_cpu_us"], reverse=True)[:top]
+        return {
+            "id": self.id,
+            "pid": self.pid,
+            "running": not self.finished.is_set(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+            "requests": self.requests,
+            "max_requests": self.max_requests,
+            "seconds_left": max(0.0, round(self.deadline - time.monotonic(), 1)) if not self.finished.is_set() else 0.0,
+            "stack_samples": self.samples,
+            "forward_passes_profiled": self.forward_passes,
+            "routes": {route: {"count": n, "mean_ms": round(self.request_seconds[route] / n * 1000, 2)}
+                       for route, n in self.request_counts.items()},
+            "top_operators": [dict(name=name, **stats) for name, stats in operators]
+        }
+
+
+class SavedSession:
+    """A finished session read back from PROFILE_DIR (e.g. one profiled by another prefork worker)."""
+
+    def __init__(self, directory: str, summary: dict):
+        self.directory = directory
+        self.id = summary["id"]
+        self._summary = summary
+
+    trace_path = ProfilingSession.trace_path
+    stacks_path = ProfilingSession.stacks_path
+
+    @classmethod
+    def load(cls, session_id: str) -> Optional["SavedSession"]:
+        directory = os.path.join(PROFILE_DIR, os.path.basename(session_id))
+        try:
+            with open(os.path.join(directory, "summary.json")) as f:
+                return cls(directory, json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def wait(self, timeout: float = None) -> bool:
+        return True
+
+    def summary(self) -> dict:
+        return self._summary
+
+
+class Profiler:
+    def __init__(self):
+        self.session: Optional[ProfilingSession] = None
+        self.finished = OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, max_requests: int = 100, max_seconds: float = 30.0, interval: float = 0.005,
+              capture_operators: bool = True) -> ProfilingSession:
+        with self._lock:
+            if self.session is not None:
+                raise RuntimeError(f"Profiling session {self.session.id} is already running")
+            session = ProfilingSession(
+                max(1, min(max_requests, MAX_REQUESTS)), max(0.1, min(max_seconds, MAX_SECONDS)),
+                max(interval, MIN_INTERVAL_SECONDS), capture_operators, self._finished
+            )
+            self.session = session
+        session.start()
+        return session
+
+    def stop(self, timeout: float = 10.0) -> Optional[ProfilingSession]:
+        session = self.session
+        if session is not None:
+            session.finish()
+            session.wait(timeout)
+        return session
+
+    def _finished(self, session: ProfilingSession):
+        with self._lock:
+            if self.session is session:
+                self.session = None
+            self.finished[session.id] = session
+            while len(self.finished) > KEEP_FINISHED_SESSIONS:
+                self.finished.popitem(last=False)
+
+    def get(self, session_id: str) -> Optional[ProfilingSession]:
+        session = self.session
+        if session is not None and session.id == session_id:
+            return session
+        return self.finished.get(session_id) or SavedSession.load(session_id)
+
+    def forward_context(self):
+        session = self.session
+        if session is None:
+            return _NULL_CONTEXT
+        return session.forward()
+
+
+profiler = Profiler()
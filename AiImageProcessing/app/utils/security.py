@@ -7,11 +7,16 @@ from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from app.databases.database import get_db
 from app.model.user_model import User
+from app.schemas.user_models import UserInToken
+from app.utils.principal_cache import principal_cache
 
 # JWT Configuration
 SECRET_KEY = "your-secret-key-here"  # Change this to a secure secret key
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# When enabled, the signed id/name/role claims are trusted as-is and no database read is made.
+# Role changes and deletions then only take effect once the token expires.
+TRUST_TOKEN_CLAIMS = False
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -32,7 +37,21 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> User:
+def build_token_claims(user: User) -> dict:
+    """Claims embedded in every access token so the principal can be rebuilt without a lookup."""
+    return {"sub": user.email, "id": user.id, "name": user.name, "role": user.role}
+
+def _principal_from_claims(payload: dict) -> Optional[UserInToken]:
+    if payload.get("id") is None or payload.get("role") is None:
+        return None
+    return UserInToken(
+        id=payload["id"],
+        email=payload["sub"],
+        name=payload.get("name", ""),
+        role=payload["role"]
+    )
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> UserInToken:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -45,8 +64,25 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    
+
+    if TRUST_TOKEN_CLAIMS:
+        principal = _principal_from_claims(payload)
+        if principal is not None:
+            return principal
+
+    principal = principal_cache.get_by_email(email)
+    if principal is not None:
+        return principal
+
     user = db.query(User).filter(User.email == email).first()
     if user is None:
         raise credentials_exception
-    return user 
\ No newline at end of file
+    return principal_cache.put(user) 
+
+async def require_admin(current_user: UserInToken = Depends(get_current_user)) -> UserInToken:
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required"
+        )
+    return current_user
@@ -0,0 +1,205 @@
+"""
+Streaming multipart upload handling.
+
+The request body is fed chunk by chunk to python-multipart's push parser, so
+an upload is never held in memory: file data goes straight to a temporary file
+in the upload directory while its SHA-256 is computed. The image type is
+checked from the magic bytes of the first chunk and the size limit on every
+chunk, so bad uploads are rejected before the rest of the body is read.
+Finished files are named by content hash, which deduplicates repeated uploads
+and ignores the client-chosen file name.
+"""
+import hashlib
+import os
+import tempfile
+from typing import AsyncIterator, Callable, Dict, Optional
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:
+    from multipart.multipart import MultipartParser, parse_options_header
+
+# Magic bytes -> stored file extension
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+)
+SIGNATURE_BYTES = 12
+MAX_FIELD_BYTES = 1024
+# Multipart framing and small form fields on top of the file itself
+BODY_OVERHEAD_BYTES = 16 * 1024
+
+
+class UploadRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def detect_image_type(head: bytes) -> Optional[str]:
+    for signature, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+def content_path(data: bytes, upload_dir: str, extension: str) -> str:
+    """Where an upload that is already in memory is stored (same naming as receive_upload)."""
+    return os.path.join(upload_dir, hashlib.sha256(data).hexdigest() + extension)
+
+
+def store_image_bytes(data: bytes, path: str) -> str:
+    """Write `data` to its content_path() unless an identical upload is already there."""
+    if not os.path.exists(path):
+        upload_dir = os.path.dirname(path)
+        os.makedirs(upload_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=upload_dir, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    return path
+
+
+class StoredUpload:
+    def __init__(self, path: str, sha256: str, size: int, deduplicated: bool, fields: Dict[str, str]):
+        self.path = path
+        self.sha256 = sha256
+        self.size = size
+        self.deduplicated = deduplicated
+        self.fields = fields
+
+
+class _UploadReceiver:
+    """Multipart callbacks: small fields are collected, the file part is streamed to disk."""
+
+    def __init__(self, upload_dir: str, max_bytes: int, file_field: str):
+        self.upload_dir = upload_dir
+        self.max_bytes = max_bytes
+        self.file_field = file_field
+        self.fields: Dict[str, str] = {}
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.extension = None
+        self.temp_path = None
+        self._file = None
+        self._head = b""
+        self._header_field = b""
+        self._header_value = b""
+        self._headers = {}
+        self._part_name = None
+        self._field_value = b""
+
+    # ===== HEADERS =====
+    def on_part_begin(self):
+        self._headers = {}
+        self._part_name = None
+        self._field_value = b""
+
+    def on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._part_name = options.get(b"name", b"").decode("latin-1")
+        if self._part_name == self.file_field:
+            if self._file is not None:
+                raise UploadRejected(400, f"Only one '{self.file_field}' part is allowed")
+            fd, self.temp_path = tempfile.mkstemp(dir=self.upload_dir, suffix=".part")
+            self._file = os.fdopen(fd, "wb")
+
+    # ===== DATA =====
+    def on_part_data(self, data, start, end):
+        chunk = data[start:end]
+        if self._part_name != self.file_field:
+            self._field_value += chunk
+            if len(self._field_value) > MAX_FIELD_BYTES:
+                raise UploadRejected(413, f"Form field '{self._part_name}' is too large")
+            return
+
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadRejected(413, f"Upload exceeds the {self.max_bytes / 2 ** 20:g} MB limit")
+        if self.extension is None:
+            self._head += chunk[:SIGNATURE_BYTES]
+            if len(self._head) >= SIGNATURE_BYTES:
+                self._check_type()
+        self.digest.update(chunk)
+        self._file.write(chunk)
+
+    def _check_type(self):
+        self.extension = detect_image_type(self._head)
+        if self.extension is None:
+            raise UploadRejected(415, "Only JPEG, PNG and WebP images are accepted")
+
+    def on_part_end(self):
+        if self._part_name == self.file_field:
+            if self.extension is None:
+                self._check_type()
+            self._file.close()
+        elif self._part_name:
+            self.fields[self._part_name] = self._field_value.decode("utf-8")
+
+    def callbacks(self) -> dict:
+        return {name: getattr(self, name) for name in (
+            "on_part_begin", "on_header_field", "on_header_value", "on_header_end",
+            "on_headers_finished", "on_part_data", "on_part_end"
+        )}
+
+    def discard(self):
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+        if self.temp_path and os.path.exists(self.temp_path):
+            os.unlink(self.temp_path)
+
+
+async def receive_upload(headers, body: AsyncIterator[bytes], upload_dir: str, max_bytes: int,
+                         file_field: str = "file",
+                         validate_fields: Optional[Callable[[Dict[str, str]], None]] = None) -> StoredUpload:
+    """
+    Stream a multipart request body into `upload_dir`; raises UploadRejected for bad requests.
+    `validate_fields` may raise UploadRejected for the form fields before the file is kept.
+    """
+    content_type, options = parse_options_header(headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise UploadRejected(400, "Expected a multipart/form-data request")
+    content_length = headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + BODY_OVERHEAD_BYTES:
+        raise UploadRejected(413, f"Upload exceeds the {max_bytes / 2 ** 20:g} MB limit")
+
+    os.makedirs(upload_dir, exist_ok=True)
+    receiver = _UploadReceiver(upload_dir, max_bytes, file_field)
+    parser = MultipartParser(options[b"boundary"], receiver.callbacks())
+    try:
+        async for chunk in body:
+            if chunk:
+                parser.write(chunk)
+        parser.finalize()
+        if receiver.temp_path is None:
+            raise UploadRejected(400, f"Missing '{file_field}' part")
+        if validate_fields is not None:
+            validate_fields(receiver.fields)
+    except UploadRejected:
+        receiver.discard()
+        raise
+    except Exception as e:
+        receiver.discard()
+        raise UploadRejected(400, f"Malformed multipart body: {e}")
+
+    sha256 = receiver.digest.hexdigest()
+    path = os.path.join(upload_dir, sha256 + receiver.extension)
+    deduplicated = os.path.exists(path)
+    if deduplicated:
+        os.unlink(receiver.temp_path)
+    else:
+        os.replace(receiver.temp_path, path)
+    return StoredUpload(path, sha256, receiver.size, deduplicated, receiver.fields)